@@ -0,0 +1,101 @@
+"""Benchmark of the squeak lookup used to answer a getsqueaks message.
+
+Compares one query per interest, as was done before, with the combined
+lookup_squeaks_for_interests query, for an increasing number of
+interests.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_getsqueaks
+"""
+import time
+
+from bitcoin.core import CoreMainParams
+from squeak.core import MakeSqueakFromStr
+from squeak.core.signing import CSigningKey
+
+from squeaknode.core.squeak_interest import SqueakInterest
+from squeaknode.core.util import get_hash
+from squeaknode.db.db_engine import get_engine
+from squeaknode.db.squeak_db import SqueakDb
+
+
+SQUEAKS_PER_ADDRESS = 2
+
+
+def make_squeak_db(num_addresses):
+    squeak_db = SqueakDb(get_engine("sqlite://"))
+    squeak_db.init()
+    block_header = CoreMainParams.GENESIS_BLOCK.get_header()
+    addresses = []
+    for _ in range(num_addresses):
+        signing_key = CSigningKey.generate()
+        for i in range(SQUEAKS_PER_ADDRESS):
+            squeak = MakeSqueakFromStr(
+                signing_key,
+                "hello {}".format(i),
+                i,
+                CoreMainParams.GENESIS_BLOCK.GetHash(),
+                1600000000,
+            )
+            squeak_db.insert_squeak(squeak, block_header)
+            squeak_db.set_squeak_decryption_key(
+                get_hash(squeak),
+                squeak.GetDecryptionKey(),
+            )
+        addresses.append(str(squeak.GetAddress()))
+    return squeak_db, addresses
+
+
+def lookup_per_interest(squeak_db, interests):
+    ret = []
+    for interest in interests:
+        ret.extend(squeak_db.lookup_squeaks(
+            [interest.address],
+            interest.min_block,
+            interest.max_block,
+        ))
+    return ret
+
+
+def lookup_combined(squeak_db, interests):
+    squeak_hashes = squeak_db.lookup_squeaks_for_interests(interests)
+    return [
+        squeak_hash
+        for interest_squeak_hashes in squeak_hashes.values()
+        for squeak_hash in interest_squeak_hashes
+    ]
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    max_interests = 1000
+    squeak_db, addresses = make_squeak_db(max_interests)
+    for num_interests in [1, 10, 100, 500, 1000]:
+        interests = [
+            SqueakInterest(address, 0, 100)
+            for address in addresses[:num_interests]
+        ]
+        per_interest, per_interest_s = timed(
+            lookup_per_interest, squeak_db, interests)
+        combined, combined_s = timed(lookup_combined, squeak_db, interests)
+        assert sorted(per_interest) == sorted(combined)
+        assert len(combined) == num_interests * SQUEAKS_PER_ADDRESS
+        print(
+            'interests={:>5}  per_interest={:>8.4f}s  combined={:>8.4f}s  '
+            'speedup={:>6.1f}x'.format(
+                num_interests,
+                per_interest_s,
+                combined_s,
+                per_interest_s / combined_s,
+            )
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""Micro-benchmark of the peer message decoder.
+
+Compares the incremental MessageDecoder with the previous decoder, which
+re-copied the whole partial buffer for every chunk read from the socket.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_message_decoder
+"""
+import time
+from io import BytesIO
+
+from bitcoin.core.serialize import SerializationTruncationError
+from squeak.messages import msg_inv
+from squeak.messages import MsgSerializable
+from squeak.net import CInv
+
+from squeaknode.network.peer import MAX_MESSAGE_LEN
+from squeaknode.network.peer import MessageDecoder
+
+
+class LegacyMessageDecoder:
+    """The decoder that was used before the incremental decoder."""
+
+    def __init__(self):
+        self.recv_data_buffer = BytesIO()
+
+    def process_recv_data(self, recv_data):
+        data = self.read_data_buffer() + recv_data
+        try:
+            while data:
+                self.set_data_buffer(data)
+                msg = MsgSerializable.stream_deserialize(self.recv_data_buffer)
+                if msg is None:
+                    raise Exception('Invalid data')
+                else:
+                    yield msg
+                    data = self.read_data_buffer()
+        except SerializationTruncationError:
+            self.set_data_buffer(data)
+
+    def read_data_buffer(self):
+        return self.recv_data_buffer.read()
+
+    def set_data_buffer(self, data):
+        if len(data) > MAX_MESSAGE_LEN:
+            raise Exception('Message size too large')
+        self.recv_data_buffer = BytesIO(data)
+
+
+def make_inv_msg_bytes(num_invs):
+    invs = [
+        CInv(type=1, hash=i.to_bytes(32, 'big'))
+        for i in range(num_invs)
+    ]
+    return msg_inv(inv=invs).to_bytes()
+
+
+def decode_legacy(data, chunk_len):
+    decoder = LegacyMessageDecoder()
+    num_msgs = 0
+    for i in range(0, len(data), chunk_len):
+        for _ in decoder.process_recv_data(data[i:i + chunk_len]):
+            num_msgs += 1
+    return num_msgs
+
+
+def decode_incremental(data, chunk_len):
+    decoder = MessageDecoder(read_len=chunk_len)
+    num_msgs = 0
+    view = memoryview(data)
+    offset = 0
+    while offset < len(data):
+        with decoder.get_read_buffer() as read_buffer:
+            read_len = min(chunk_len, len(read_buffer), len(data) - offset)
+            read_buffer[:read_len] = view[offset:offset + read_len]
+        offset += read_len
+        for _ in decoder.process_read_len(read_len):
+            num_msgs += 1
+    return num_msgs
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    # About 1 MB of inventory, just under MAX_MESSAGE_LEN.
+    data = make_inv_msg_bytes(29000)
+    print('Message size: {} bytes'.format(len(data)))
+    for chunk_len in [1024, 4096, 65536]:
+        num_legacy, legacy_s = timed(decode_legacy, data, chunk_len)
+        num_incremental, incremental_s = timed(
+            decode_incremental, data, chunk_len)
+        assert num_legacy == num_incremental == 1
+        print(
+            'chunk_len={:>6}  legacy={:>8.4f}s  incremental={:>8.4f}s  '
+            'speedup={:>6.1f}x'.format(
+                chunk_len,
+                legacy_s,
+                incremental_s,
+                legacy_s / incremental_s,
+            )
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+"""Benchmark of the bytes sent to sync a timeline with a peer.
+
+Compares the inv based sync, where the peer answers a getsqueaks message
+with the hashes of all squeaks in the interests, with the reconcile
+message, where the peer only lists the hashes of the buckets whose
+digests differ. The requesting node is missing a few of the squeaks.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_reconcile
+"""
+import random
+
+from bitcoin.core import CoreMainParams
+from squeak.core import MakeSqueakFromStr
+from squeak.core.signing import CSigningKey
+from squeak.core.signing import CSqueakAddress
+from squeak.messages import msg_getsqueaks
+from squeak.messages import msg_inv
+from squeak.net import CInterested
+from squeak.net import CInv
+from squeak.net import CSqueakLocator
+
+from squeaknode.core.util import get_hash
+from squeaknode.db.db_engine import get_engine
+from squeaknode.db.squeak_db import SqueakDb
+from squeaknode.network.squeak_lookup_cache import SqueakLookupCache
+from squeaknode.node.squeak_controller import SqueakController
+
+
+NUM_ADDRESSES = 50
+SQUEAKS_PER_ADDRESS = 20
+BLOCK_INTERVAL = 2016
+
+
+def make_squeak_db():
+    squeak_db = SqueakDb(get_engine("sqlite://"))
+    squeak_db.init()
+    return squeak_db
+
+
+def make_controller(squeak_db):
+    # Reconciliation only uses the database and the lookup cache.
+    return SqueakController(
+        squeak_db,
+        None,
+        None,
+        None,
+        None,
+        None,
+        None,
+        SqueakLookupCache(),
+        None,
+        None,
+        None,
+    )
+
+
+def insert_squeak(squeak_db, squeak):
+    block_header = CoreMainParams.GENESIS_BLOCK.get_header()
+    squeak_db.insert_squeak(squeak, block_header)
+    squeak_db.set_squeak_decryption_key(
+        get_hash(squeak),
+        squeak.GetDecryptionKey(),
+    )
+
+
+def make_squeaks():
+    squeaks = []
+    addresses = []
+    for _ in range(NUM_ADDRESSES):
+        signing_key = CSigningKey.generate()
+        addresses.append(CSqueakAddress.from_verifying_key(
+            signing_key.get_verifying_key()))
+        for i in range(SQUEAKS_PER_ADDRESS):
+            squeaks.append(MakeSqueakFromStr(
+                signing_key,
+                "hello {}".format(i),
+                random.randrange(BLOCK_INTERVAL),
+                CoreMainParams.GENESIS_BLOCK.GetHash(),
+                1600000000,
+            ))
+    return squeaks, addresses
+
+
+def inv_sync_bytes(remote_controller, interests):
+    getsqueaks_msg = msg_getsqueaks(
+        locator=CSqueakLocator(vInterested=interests),
+    )
+    squeak_hashes = remote_controller.lookup_squeaks_for_interests(interests)
+    return len(getsqueaks_msg.to_bytes()) + invs_bytes(squeak_hashes)
+
+
+def reconcile_sync_bytes(local_controller, remote_controller, interests):
+    reconcile_msg = local_controller.make_reconcile_msg(interests)
+    squeak_hashes = remote_controller.reconcile_squeaks(
+        interests,
+        reconcile_msg.nBucketSize,
+        reconcile_msg.vDigests,
+    )
+    return len(reconcile_msg.to_bytes()) + invs_bytes(squeak_hashes)
+
+
+def invs_bytes(squeak_hashes):
+    invs = [CInv(type=1, hash=squeak_hash) for squeak_hash in squeak_hashes]
+    return len(msg_inv(inv=invs).to_bytes())
+
+
+def main():
+    random.seed(0)
+    squeaks, addresses = make_squeaks()
+    remote_db = make_squeak_db()
+    for squeak in squeaks:
+        insert_squeak(remote_db, squeak)
+    remote_controller = make_controller(remote_db)
+    interests = [
+        CInterested(
+            address=address,
+            nMinBlockHeight=0,
+            nMaxBlockHeight=BLOCK_INTERVAL,
+        )
+        for address in addresses
+    ]
+    for num_missing in [0, 1, 10, 100, len(squeaks)]:
+        missing = set(random.sample(range(len(squeaks)), num_missing))
+        local_db = make_squeak_db()
+        for i, squeak in enumerate(squeaks):
+            if i not in missing:
+                insert_squeak(local_db, squeak)
+        local_controller = make_controller(local_db)
+        inv_bytes = inv_sync_bytes(remote_controller, interests)
+        reconcile_bytes = reconcile_sync_bytes(
+            local_controller, remote_controller, interests)
+        print(
+            'squeaks={:>5}  missing={:>5}  inv={:>8} bytes  '
+            'reconcile={:>8} bytes  ratio={:>6.1f}x'.format(
+                len(squeaks),
+                num_missing,
+                inv_bytes,
+                reconcile_bytes,
+                inv_bytes / reconcile_bytes,
+            )
+        )
+
+
+if __name__ == '__main__':
+    main()
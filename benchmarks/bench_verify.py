@@ -0,0 +1,66 @@
+"""Benchmark of the squeak verification of a sync batch.
+
+Compares verifying the squeaks in the calling thread with verifying
+them with the squeak verifier, which uses a pool of worker processes
+when there is more than one CPU.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_verify
+"""
+import time
+
+from bitcoin.core import CoreMainParams
+from squeak.core import MakeSqueakFromStr
+from squeak.core.signing import CSigningKey
+
+from squeaknode.core.squeak_verifier import SqueakVerifier
+from squeaknode.core.squeak_verifier import verify_squeak_bytes_batch
+
+
+NUM_SQUEAKS = 500
+
+
+def make_squeak_bytes_list():
+    signing_key = CSigningKey.generate()
+    return [
+        MakeSqueakFromStr(
+            signing_key,
+            "hello {}".format(i),
+            0,
+            CoreMainParams.GENESIS_BLOCK.GetHash(),
+            1600000000,
+        ).serialize()
+        for i in range(NUM_SQUEAKS)
+    ]
+
+
+def main():
+    squeak_bytes_list = make_squeak_bytes_list()
+    squeak_verifier = SqueakVerifier(min_batch_size=1)
+    # Start the worker processes before timing.
+    squeak_verifier.verify(squeak_bytes_list[:1])
+    try:
+        start_time = time.perf_counter()
+        verify_squeak_bytes_batch(squeak_bytes_list)
+        inline_s = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        squeak_verifier.verify(squeak_bytes_list)
+        process_s = time.perf_counter() - start_time
+    finally:
+        squeak_verifier.stop()
+    print(
+        'squeaks={:>5}  workers={:>3}  inline={:>8.0f} squeaks/s  '
+        'verifier={:>8.0f} squeaks/s  ratio={:>5.1f}x'.format(
+            NUM_SQUEAKS,
+            squeak_verifier.max_workers,
+            NUM_SQUEAKS / inline_s,
+            NUM_SQUEAKS / process_s,
+            inline_s / process_s,
+        )
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -13,6 +13,7 @@ from squeaknode.core.squeak_entry_with_profile import SqueakEntryWithProfile
 from squeaknode.core.squeak_peer import SqueakPeer
 from squeaknode.core.squeak_profile import SqueakProfile
 from squeaknode.core.util import get_hash
+from squeaknode.network.message_stats import CommandStats
 from squeaknode.network.peer import Peer
 
 
@@ -190,4 +191,23 @@ def connected_peer_to_message(connected_peer: Peer) -> squeak_admin_pb2.Connecte
         host=connected_peer.ip,
         port=connected_peer.port,
         connect_time_s=connected_peer.connect_time,
+        send_queue_len=connected_peer.send_queue_len,
+        send_queue_bytes=connected_peer.send_queue_bytes,
+        recv_queue_len=connected_peer.recv_queue_len,
+        recv_queue_bytes=connected_peer.recv_queue_bytes,
+        recv_backpressure_count=connected_peer.recv_backpressure_count,
+        ping_rtt_s=connected_peer.ping_rtt or 0,
+    )
+
+
+def command_stats_to_message(command_stats: CommandStats) -> squeak_admin_pb2.MessageCommandStats:
+    peer_host, peer_port = command_stats.peer_address or ('', 0)
+    return squeak_admin_pb2.MessageCommandStats(
+        command=command_stats.command,
+        peer_host=peer_host,
+        peer_port=peer_port,
+        num_calls=command_stats.num_calls,
+        num_errors=command_stats.num_errors,
+        total_time_s=command_stats.total_time_s,
+        latency_histogram=command_stats.latency_histogram,
     )
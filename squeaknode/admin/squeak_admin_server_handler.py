@@ -2,6 +2,7 @@ import logging
 import sys
 
 from proto import squeak_admin_pb2
+from squeaknode.admin.messages import command_stats_to_message
 from squeaknode.admin.messages import connected_peer_to_message
 from squeaknode.admin.messages import offer_entry_to_message
 from squeaknode.admin.messages import payment_summary_to_message
@@ -14,6 +15,7 @@ from squeaknode.admin.messages import squeak_peer_to_message
 from squeaknode.admin.messages import squeak_profile_to_message
 from squeaknode.admin.profile_image_util import base64_string_to_bytes
 from squeaknode.lightning.lnd_lightning_client import LNDLightningClient
+from squeaknode.network.message_stats import LATENCY_BUCKET_BOUNDS_S
 from squeaknode.node.squeak_controller import SqueakController
 
 logger = logging.getLogger(__name__)
@@ -657,8 +659,18 @@ class SqueakAdminServerHandler(object):
         connected_peers_display_msgs = [
             connected_peer_to_message(peer) for peer in connected_peers
         ]
+        disconnect_reasons = self.squeak_controller.get_disconnect_reasons()
         return squeak_admin_pb2.GetConnectedPeersReply(
-            connected_peers=connected_peers_display_msgs
+            connected_peers=connected_peers_display_msgs,
+            disconnect_reasons=[
+                squeak_admin_pb2.DisconnectReasonCount(
+                    reason=reason,
+                    num_peers=num_peers,
+                )
+                for reason, num_peers in sorted(disconnect_reasons.items())
+            ],
+            num_half_open_peers=self.squeak_controller.get_num_half_open_peers(),
+            num_established_peers=self.squeak_controller.get_num_established_peers(),
         )
 
     def handle_disconnect_peer(self, request):
@@ -666,3 +678,43 @@ class SqueakAdminServerHandler(object):
         logger.info("Handle disconnect peer with id: {}".format(peer_id))
         self.squeak_controller.disconnect_peer(peer_id)
         return squeak_admin_pb2.DisconnectPeerReply()
+
+    def handle_get_message_stats(self, request):
+        logger.info("Handle get message stats.")
+        command_stats = self.squeak_controller.get_message_command_stats()
+        peer_command_stats = self.squeak_controller.get_message_peer_command_stats()
+        return squeak_admin_pb2.GetMessageStatsReply(
+            latency_bucket_bounds_s=LATENCY_BUCKET_BOUNDS_S,
+            command_stats=[
+                command_stats_to_message(stats) for stats in command_stats
+            ],
+            peer_command_stats=[
+                command_stats_to_message(stats) for stats in peer_command_stats
+            ],
+        )
+
+    def handle_get_download_stats(self, request):
+        logger.info("Handle get download stats.")
+        download_stats = self.squeak_controller.get_download_stats()
+        return squeak_admin_pb2.GetDownloadStatsReply(
+            num_requested=download_stats.num_requested,
+            num_received=download_stats.num_received,
+            num_duplicates=download_stats.num_duplicates,
+            num_timeouts=download_stats.num_timeouts,
+            num_in_flight=download_stats.num_in_flight,
+            num_pending=download_stats.num_pending,
+            duplicate_ratio=download_stats.duplicate_ratio,
+        )
+
+    def handle_get_dial_stats(self, request):
+        logger.info("Handle get dial stats.")
+        dial_stats = self.squeak_controller.get_dial_stats()
+        return squeak_admin_pb2.GetDialStatsReply(
+            num_attempts=dial_stats.num_attempts,
+            num_successes=dial_stats.num_successes,
+            num_failures=dial_stats.num_failures,
+            num_timeouts=dial_stats.num_timeouts,
+            num_deduplicated=dial_stats.num_deduplicated,
+            num_backoff_skips=dial_stats.num_backoff_skips,
+            total_connect_time_s=dial_stats.total_connect_time_s,
+        )
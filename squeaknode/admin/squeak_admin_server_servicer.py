@@ -234,3 +234,12 @@ class SqueakAdminServerServicer(squeak_admin_pb2_grpc.SqueakAdminServicer):
 
     def DisconnectPeer(self, request, context):
         return self.handler.handle_disconnect_peer(request)
+
+    def GetMessageStats(self, request, context):
+        return self.handler.handle_get_message_stats(request)
+
+    def GetDownloadStats(self, request, context):
+        return self.handler.handle_get_download_stats(request)
+
+    def GetDialStats(self, request, context):
+        return self.handler.handle_get_dial_stats(request)
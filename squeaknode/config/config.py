@@ -16,6 +16,11 @@ DEFAULT_NETWORK = "testnet"
 DEFAULT_PRICE_MSAT = 10000
 DEFAULT_LOG_LEVEL = "INFO"
 DEFAULT_MAX_SQUEAKS_PER_ADDRESS_PER_BLOCK = 100
+DEFAULT_INGESTION_WORKERS = 4
+DEFAULT_INGESTION_QUEUE_LEN = 1000
+DEFAULT_INGESTION_BATCH_SIZE = 100
+DEFAULT_VERIFICATION_WORKERS = 0
+DEFAULT_VERIFICATION_PROCESS_BATCH_SIZE = 16
 DEFAULT_SERVER_RPC_HOST = "0.0.0.0"
 DEFAULT_SERVER_RPC_PORT = 8774
 DEFAULT_ADMIN_RPC_HOST = "0.0.0.0"
@@ -37,11 +42,37 @@ DEFAULT_LND_HOST = "localhost"
 DEFAULT_SYNC_INTERVAL_S = 10
 DEFAULT_SYNC_TIMEOUT_S = 10
 DEFAULT_SYNC_BLOCK_INTERVAL = 2016
+DEFAULT_SYNC_FULL_SYNC_INTERVAL_S = 3600
+DEFAULT_SYNC_REDUNDANCY = 2
 DEFAULT_SENT_OFFER_RETENTION_S = 86400
 DEFAULT_OFFER_DELETION_INTERVAL_S = 10
 DEFAULT_SUBSCRIBE_INVOICES_RETRY_S = 10
 DEFAULT_SQUEAK_RETENTION_S = 604800
 DEFAULT_SQUEAK_DELETION_INTERVAL_S = 10
+DEFAULT_MAX_HANDLER_WORKERS = 8
+DEFAULT_SOCKET_READ_LEN = 65536
+DEFAULT_MAX_SEND_QUEUE_LEN = 10000
+DEFAULT_MAX_SEND_QUEUE_BYTES = 10485760
+DEFAULT_SEND_TIMEOUT_S = 30
+DEFAULT_MAX_RECV_QUEUE_LEN = 1000
+DEFAULT_MAX_RECV_QUEUE_BYTES = 4194304
+DEFAULT_LOOKUP_CACHE_TTL_S = 10
+DEFAULT_MAX_INBOUND_PEERS = 20
+DEFAULT_MAX_OUTBOUND_PEERS = 10
+DEFAULT_RESERVED_OUTBOUND_PEERS = 5
+DEFAULT_PING_INTERVAL_S = 60
+DEFAULT_PING_TIMEOUT_S = 10
+DEFAULT_LAST_MESSAGE_TIMEOUT_S = 600
+DEFAULT_HANDSHAKE_TIMEOUT_S = 30
+DEFAULT_MAX_CONCURRENT_DIALS = 8
+DEFAULT_CONNECT_TIMEOUT_S = 10
+DEFAULT_DIAL_BACKOFF_BASE_S = 10
+DEFAULT_DIAL_BACKOFF_MAX_S = 600
+DEFAULT_RESOLVE_TTL_S = 300
+DEFAULT_RESOLVE_NEGATIVE_TTL_S = 30
+DEFAULT_RELAY_BATCH_DELAY_S = 0.3
+DEFAULT_DOWNLOAD_TIMEOUT_S = 10
+DEFAULT_MAX_DOWNLOADS_PER_PEER = 1000
 
 
 @section('bitcoin')
@@ -98,6 +129,16 @@ class CoreConfig(Config):
     price_msat = key(cast=int, required=False, default=DEFAULT_PRICE_MSAT)
     max_squeaks_per_address_per_block = key(
         cast=int, required=False, default=DEFAULT_MAX_SQUEAKS_PER_ADDRESS_PER_BLOCK)
+    ingestion_workers = key(
+        cast=int, required=False, default=DEFAULT_INGESTION_WORKERS)
+    ingestion_queue_len = key(
+        cast=int, required=False, default=DEFAULT_INGESTION_QUEUE_LEN)
+    ingestion_batch_size = key(
+        cast=int, required=False, default=DEFAULT_INGESTION_BATCH_SIZE)
+    verification_workers = key(
+        cast=int, required=False, default=DEFAULT_VERIFICATION_WORKERS)
+    verification_process_batch_size = key(
+        cast=int, required=False, default=DEFAULT_VERIFICATION_PROCESS_BATCH_SIZE)
     sqk_dir_path = key(cast=str, required=False, default=DEFAULT_SQK_DIR_PATH)
     log_level = key(cast=str, required=False, default=DEFAULT_LOG_LEVEL)
     sent_offer_retention_s = key(
@@ -119,6 +160,62 @@ class SyncConfig(Config):
     timeout_s = key(cast=float, required=False, default=DEFAULT_SYNC_TIMEOUT_S)
     block_interval = key(cast=int, required=False,
                          default=DEFAULT_SYNC_BLOCK_INTERVAL)
+    full_sync_interval_s = key(cast=int, required=False,
+                               default=DEFAULT_SYNC_FULL_SYNC_INTERVAL_S)
+    redundancy = key(cast=int, required=False,
+                     default=DEFAULT_SYNC_REDUNDANCY)
+
+
+@section('network')
+class NetworkConfig(Config):
+    max_handler_workers = key(
+        cast=int, required=False, default=DEFAULT_MAX_HANDLER_WORKERS)
+    socket_read_len = key(
+        cast=int, required=False, default=DEFAULT_SOCKET_READ_LEN)
+    max_send_queue_len = key(
+        cast=int, required=False, default=DEFAULT_MAX_SEND_QUEUE_LEN)
+    max_send_queue_bytes = key(
+        cast=int, required=False, default=DEFAULT_MAX_SEND_QUEUE_BYTES)
+    send_timeout_s = key(
+        cast=float, required=False, default=DEFAULT_SEND_TIMEOUT_S)
+    max_recv_queue_len = key(
+        cast=int, required=False, default=DEFAULT_MAX_RECV_QUEUE_LEN)
+    max_recv_queue_bytes = key(
+        cast=int, required=False, default=DEFAULT_MAX_RECV_QUEUE_BYTES)
+    lookup_cache_ttl_s = key(
+        cast=float, required=False, default=DEFAULT_LOOKUP_CACHE_TTL_S)
+    max_inbound_peers = key(
+        cast=int, required=False, default=DEFAULT_MAX_INBOUND_PEERS)
+    max_outbound_peers = key(
+        cast=int, required=False, default=DEFAULT_MAX_OUTBOUND_PEERS)
+    reserved_outbound_peers = key(
+        cast=int, required=False, default=DEFAULT_RESERVED_OUTBOUND_PEERS)
+    ping_interval_s = key(
+        cast=float, required=False, default=DEFAULT_PING_INTERVAL_S)
+    ping_timeout_s = key(
+        cast=float, required=False, default=DEFAULT_PING_TIMEOUT_S)
+    last_message_timeout_s = key(
+        cast=float, required=False, default=DEFAULT_LAST_MESSAGE_TIMEOUT_S)
+    handshake_timeout_s = key(
+        cast=float, required=False, default=DEFAULT_HANDSHAKE_TIMEOUT_S)
+    max_concurrent_dials = key(
+        cast=int, required=False, default=DEFAULT_MAX_CONCURRENT_DIALS)
+    connect_timeout_s = key(
+        cast=float, required=False, default=DEFAULT_CONNECT_TIMEOUT_S)
+    dial_backoff_base_s = key(
+        cast=float, required=False, default=DEFAULT_DIAL_BACKOFF_BASE_S)
+    dial_backoff_max_s = key(
+        cast=float, required=False, default=DEFAULT_DIAL_BACKOFF_MAX_S)
+    resolve_ttl_s = key(
+        cast=float, required=False, default=DEFAULT_RESOLVE_TTL_S)
+    resolve_negative_ttl_s = key(
+        cast=float, required=False, default=DEFAULT_RESOLVE_NEGATIVE_TTL_S)
+    relay_batch_delay_s = key(
+        cast=float, required=False, default=DEFAULT_RELAY_BATCH_DELAY_S)
+    download_timeout_s = key(
+        cast=float, required=False, default=DEFAULT_DOWNLOAD_TIMEOUT_S)
+    max_downloads_per_peer = key(
+        cast=int, required=False, default=DEFAULT_MAX_DOWNLOADS_PER_PEER)
 
 
 @section('db')
@@ -134,6 +231,7 @@ class SqueaknodeConfig(Config):
     webadmin = group_key(WebadminConfig)
     core = group_key(CoreConfig)
     sync = group_key(SyncConfig)
+    network = group_key(NetworkConfig)
     db = group_key(DbConfig)
     # description = key(cast=str, section_name="general")
 
@@ -0,0 +1,19 @@
+from typing import List
+from typing import NamedTuple
+
+from squeaknode.core.peer_address import PeerAddress
+
+
+class PeerSyncState(NamedTuple):
+    """Represents the last block height of an author fully synced with a
+    remote peer."""
+    peer_address: PeerAddress
+    address: str
+    last_synced_block: int
+
+
+class PeerSyncUpdate(NamedTuple):
+    """Represents the sync states to save when a remote peer answers a sync
+    request."""
+    full_sync_states: List[PeerSyncState]
+    updated_sync_states: List[PeerSyncState]
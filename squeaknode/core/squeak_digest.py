@@ -0,0 +1,63 @@
+from typing import Iterable
+from typing import List
+from typing import NamedTuple
+
+from squeaknode.core.squeak_interest import SqueakInterest
+
+
+DIGEST_LENGTH = 8
+
+
+class SqueakDigest(NamedTuple):
+    """Represents a set of squeak hashes in a compact form.
+
+    Two sets with the same squeaks always have the same digest.
+    """
+    num_squeaks: int
+    digest: bytes
+
+
+EMPTY_SQUEAK_DIGEST = SqueakDigest(0, b'\x00' * DIGEST_LENGTH)
+
+
+def get_squeak_digest(squeak_hashes: Iterable[bytes]) -> SqueakDigest:
+    """Get the number of squeak hashes and the XOR of their first
+    DIGEST_LENGTH bytes."""
+    num_squeaks = 0
+    digest = 0
+    for squeak_hash in squeak_hashes:
+        num_squeaks += 1
+        digest ^= int.from_bytes(squeak_hash[:DIGEST_LENGTH], 'big')
+    return SqueakDigest(num_squeaks, digest.to_bytes(DIGEST_LENGTH, 'big'))
+
+
+def split_interest(
+        interest: SqueakInterest,
+        bucket_size: int,
+) -> List[SqueakInterest]:
+    """Split the block range of the interest on multiples of bucket_size.
+
+    Bucket i of an interest covers the blocks from i * bucket_size to
+    (i + 1) * bucket_size - 1 that are also in the interest.
+    """
+    ret = []
+    min_block = max(interest.min_block, 0)
+    while min_block <= interest.max_block:
+        bucket_max_block = (min_block // bucket_size + 1) * bucket_size - 1
+        max_block = min(bucket_max_block, interest.max_block)
+        ret.append(interest._replace(min_block=min_block, max_block=max_block))
+        min_block = max_block + 1
+    return ret
+
+
+def count_buckets(interest: SqueakInterest, bucket_size: int) -> int:
+    """Get the number of buckets that split_interest returns."""
+    min_block = max(interest.min_block, 0)
+    if min_block > interest.max_block:
+        return 0
+    return get_bucket(interest.max_block, bucket_size) - \
+        get_bucket(min_block, bucket_size) + 1
+
+
+def get_bucket(block_height: int, bucket_size: int) -> int:
+    return block_height // bucket_size
@@ -0,0 +1,8 @@
+from typing import NamedTuple
+
+
+class SqueakInterest(NamedTuple):
+    """Represents the squeaks of an author in a range of blocks."""
+    address: str
+    min_block: int
+    max_block: int
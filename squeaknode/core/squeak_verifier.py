@@ -0,0 +1,119 @@
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+
+from squeak.core import CheckSqueak
+from squeak.core import CSqueak
+
+from squeaknode.core.util import get_hash
+
+
+# Checking a signature takes a few milliseconds, so smaller batches are
+# verified in the calling thread.
+MIN_PROCESS_BATCH_SIZE = 16
+VERIFY_CHUNK_SIZE = 8
+
+
+logger = logging.getLogger(__name__)
+
+
+class VerifiedSqueak(NamedTuple):
+    """Represents a serialized squeak that passed the context independent
+    checks."""
+    squeak_hash: bytes
+    squeak_bytes: bytes
+
+    def get_squeak(self) -> CSqueak:
+        return CSqueak.deserialize(self.squeak_bytes)
+
+
+def verify_squeak_bytes(squeak_bytes: bytes) -> Optional[VerifiedSqueak]:
+    """Deserialize the squeak, and check its content hash and signature,
+    and its decryption key if it has one.
+
+    Return None if the squeak is not valid.
+    """
+    try:
+        squeak = CSqueak.deserialize(squeak_bytes)
+        CheckSqueak(
+            squeak,
+            skipDecryptionCheck=not squeak.HasDecryptionKey(),
+        )
+    except Exception:
+        return None
+    return VerifiedSqueak(
+        squeak_hash=get_hash(squeak),
+        squeak_bytes=squeak_bytes,
+    )
+
+
+def verify_squeak_bytes_batch(
+        squeak_bytes_list: List[bytes],
+) -> List[Optional[VerifiedSqueak]]:
+    return [
+        verify_squeak_bytes(squeak_bytes)
+        for squeak_bytes in squeak_bytes_list
+    ]
+
+
+class SqueakVerifier:
+    """Verifies batches of serialized squeaks.
+
+    Batches of at least min_batch_size squeaks are verified in a pool of
+    worker processes, so that the checks are not limited to one core by
+    the GIL. The pool is started on first use, with the spawn start
+    method, because the node process has other threads running. With a
+    single worker, all batches are verified in the calling thread.
+    """
+
+    def __init__(
+            self,
+            max_workers=None,
+            min_batch_size=MIN_PROCESS_BATCH_SIZE,
+            chunk_size=VERIFY_CHUNK_SIZE,
+    ):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.min_batch_size = min_batch_size
+        self.chunk_size = chunk_size
+        self.executor = None
+
+    def verify(
+            self,
+            squeak_bytes_list: List[bytes],
+    ) -> List[Optional[VerifiedSqueak]]:
+        """Verify the serialized squeaks.
+
+        Return a list with the verified squeak for each item, or None if
+        the item is not valid.
+        """
+        if self.max_workers == 1 or \
+                len(squeak_bytes_list) < self.min_batch_size:
+            return verify_squeak_bytes_batch(squeak_bytes_list)
+        chunks = [
+            squeak_bytes_list[i:i + self.chunk_size]
+            for i in range(0, len(squeak_bytes_list), self.chunk_size)
+        ]
+        ret: List[Optional[VerifiedSqueak]] = []
+        for results in self._get_executor().map(
+                verify_squeak_bytes_batch,
+                chunks,
+        ):
+            ret.extend(results)
+        return ret
+
+    def stop(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self.executor is None:
+            logger.info("Starting squeak verification processes...")
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return self.executor
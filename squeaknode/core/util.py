@@ -3,6 +3,7 @@ import random
 
 from bitcoin.base58 import Base58ChecksumError
 from bitcoin.wallet import CBitcoinAddressError
+from squeak.core import SECRET_KEY_LENGTH
 from squeak.core.elliptic import generate_random_scalar
 from squeak.core.elliptic import scalar_difference
 from squeak.core.elliptic import scalar_from_bytes
@@ -18,6 +19,14 @@ def get_hash(squeak):
     return squeak.GetHash()[::-1]
 
 
+def clear_decryption_key_bytes(squeak_bytes: bytes) -> bytes:
+    """Clear the decryption key of a serialized squeak.
+
+    The decryption key is the last field of a serialized squeak.
+    """
+    return squeak_bytes[:-SECRET_KEY_LENGTH] + b'\x00' * SECRET_KEY_LENGTH
+
+
 def generate_version_nonce() -> int:
     return random.SystemRandom().getrandbits(64)
 
@@ -105,6 +105,16 @@ class Models:
             sqlite_autoincrement=True,
         )
 
+        self.peer_sync_states = Table(
+            "peer_sync_state",
+            self.metadata,
+            Column("peer_host", String, primary_key=True),
+            Column("peer_port", Integer, primary_key=True),
+            Column("author_address", String(35), primary_key=True),
+            Column("last_synced_block", Integer, nullable=False),
+            Column("full_sync_time", TZDateTime, nullable=False),
+        )
+
         self.received_offers = Table(
             "received_offer",
             self.metadata,
@@ -1,8 +1,11 @@
 import logging
+import threading
+from collections import defaultdict
 from contextlib import contextmanager
 from datetime import datetime
 from datetime import timedelta
 from datetime import timezone
+from typing import Dict
 from typing import Iterator
 from typing import List
 from typing import Optional
@@ -19,6 +22,7 @@ from squeak.core import CSqueak
 from squeaknode.bitcoin.util import parse_block_header
 from squeaknode.core.lightning_address import LightningAddressHostPort
 from squeaknode.core.peer_address import PeerAddress
+from squeaknode.core.peer_sync_state import PeerSyncState
 from squeaknode.core.received_offer import ReceivedOffer
 from squeaknode.core.received_offer_with_peer import ReceivedOfferWithPeer
 from squeaknode.core.received_payment import ReceivedPayment
@@ -29,22 +33,31 @@ from squeaknode.core.sent_payment_summary import SentPaymentSummary
 from squeaknode.core.sent_payment_with_peer import SentPaymentWithPeer
 from squeaknode.core.squeak_entry import SqueakEntry
 from squeaknode.core.squeak_entry_with_profile import SqueakEntryWithProfile
+from squeaknode.core.squeak_interest import SqueakInterest
 from squeaknode.core.squeak_peer import SqueakPeer
 from squeaknode.core.squeak_profile import SqueakProfile
 from squeaknode.core.util import get_hash
 from squeaknode.db.exception import DuplicateReceivedPaymentError
 from squeaknode.db.migrations import run_migrations
 from squeaknode.db.models import Models
+from squeaknode.db.squeak_hash_index import SqueakHashIndex
 
 
 logger = logging.getLogger(__name__)
 
 
+# Maximum number of values bound in a single IN clause, to stay under the
+# SQL parameter limits of the database.
+MAX_IN_CLAUSE_VALUES = 500
+
+
 class SqueakDb:
     def __init__(self, engine, schema=None):
         self.engine = engine
         self.schema = schema
         self.models = Models(schema=schema)
+        self.squeak_hash_index = SqueakHashIndex()
+        self._insert_squeaks_lock = threading.Lock()
 
     @contextmanager
     def get_connection(self):
@@ -55,6 +68,23 @@ class SqueakDb:
         """ Create the tables and indices in the database. """
         logger.debug("SqlAlchemy version: {}".format(sqlalchemy.__version__))
         run_migrations(self.engine)
+        self.load_squeak_hash_index()
+
+    def load_squeak_hash_index(self):
+        """ Load the hashes of all stored squeaks into the index. """
+        s = select([
+            self.squeaks.c.hash,
+            self.squeaks.c.secret_key,
+        ])
+        with self.get_connection() as connection:
+            result = connection.execute(s)
+            self.squeak_hash_index.load(
+                (bytes.fromhex(row["hash"]), row["secret_key"] is not None)
+                for row in result
+            )
+        logger.info("Loaded squeak hash index with {} squeaks.".format(
+            len(self.squeak_hash_index),
+        ))
 
     @property
     def squeaks(self):
@@ -84,6 +114,10 @@ class SqueakDb:
     def sent_offers(self):
         return self.models.sent_offers
 
+    @property
+    def peer_sync_states(self):
+        return self.models.peer_sync_states
+
     @property
     def squeak_has_secret_key(self):
         return self.squeaks.c.secret_key != None  # noqa: E711
@@ -100,6 +134,10 @@ class SqueakDb:
     def squeak_has_no_secret_key(self):
         return self.squeaks.c.secret_key == None  # noqa: E711
 
+    def peer_sync_state_is_older_than(self, interval_s):
+        return self.datetime_now - timedelta(seconds=interval_s) > \
+            self.peer_sync_states.c.full_sync_time
+
     def squeak_is_older_than_retention(self, interval_s):
         return self.datetime_now - timedelta(seconds=interval_s) > \
             self.squeaks.c.created
@@ -170,6 +208,124 @@ class SqueakDb:
         Return the hash (bytes) of the inserted squeak.
         """
         ins = self.squeaks.insert().values(
+            **self._squeak_values(squeak, block_header, None),
+        )
+        with self.get_connection() as connection:
+            try:
+                connection.execute(ins)
+                # inserted_squeak_hash = res.inserted_primary_key[0]
+                self.squeak_hash_index.add(get_hash(squeak), False)
+            except sqlalchemy.exc.IntegrityError:
+                pass
+            return get_hash(squeak)
+
+    def insert_squeaks(
+            self,
+            squeak_entries: List[SqueakEntry],
+            max_squeaks_per_address_per_block: Optional[int] = None,
+    ) -> List[bytes]:
+        """ Insert new squeaks in a single transaction, together with
+        their decryption keys.
+
+        Squeaks that are already stored are skipped. If
+        max_squeaks_per_address_per_block is given, squeaks that would
+        exceed it are skipped too, counting the stored squeaks and the
+        squeaks before them in the list. Calls are serialized, so that
+        concurrent calls cannot both use the last allowed squeak.
+
+        Return the hashes of the inserted squeaks.
+        """
+        values_by_hash = {}
+        for squeak_entry in squeak_entries:
+            squeak = squeak_entry.squeak
+            secret_key = squeak.GetDecryptionKey() \
+                if squeak.HasDecryptionKey() else None
+            values_by_hash[get_hash(squeak)] = self._squeak_values(
+                squeak,
+                squeak_entry.block_header,
+                secret_key,
+            )
+        if not values_by_hash:
+            return []
+        s = select([self.squeaks.c.hash]).where(
+            self.squeaks.c.hash.in_([
+                squeak_hash.hex() for squeak_hash in values_by_hash
+            ]))
+        # Retry once if a squeak was inserted by another connection
+        # after the select.
+        for attempt in range(2):
+            try:
+                with self._insert_squeaks_lock, \
+                        self.get_connection() as connection:
+                    with connection.begin():
+                        existing_hashes = {
+                            bytes.fromhex(row["hash"])
+                            for row in connection.execute(s)
+                        }
+                        inserted_hashes = [
+                            squeak_hash for squeak_hash in values_by_hash
+                            if squeak_hash not in existing_hashes
+                        ]
+                        if max_squeaks_per_address_per_block is not None:
+                            inserted_hashes = self._filter_rate_limited(
+                                connection,
+                                inserted_hashes,
+                                values_by_hash,
+                                max_squeaks_per_address_per_block,
+                            )
+                        if inserted_hashes:
+                            connection.execute(
+                                self.squeaks.insert(),
+                                [
+                                    values_by_hash[squeak_hash]
+                                    for squeak_hash in inserted_hashes
+                                ],
+                            )
+                break
+            except sqlalchemy.exc.IntegrityError:
+                if attempt > 0:
+                    raise
+        for squeak_hash in inserted_hashes:
+            is_unlocked = values_by_hash[squeak_hash]["secret_key"] is not None
+            self.squeak_hash_index.add(squeak_hash, is_unlocked)
+        return inserted_hashes
+
+    def _filter_rate_limited(
+            self,
+            connection,
+            squeak_hashes: List[bytes],
+            values_by_hash: Dict[bytes, dict],
+            max_squeaks_per_address_per_block: int,
+    ) -> List[bytes]:
+        num_squeaks_by_block: Dict[tuple, int] = {}
+        ret = []
+        for squeak_hash in squeak_hashes:
+            values = values_by_hash[squeak_hash]
+            key = (values["author_address"], values["n_block_height"])
+            if key not in num_squeaks_by_block:
+                s = (
+                    select([func.count().label("num_squeaks")])
+                    .select_from(self.squeaks)
+                    .where(self.squeaks.c.author_address == key[0])
+                    .where(self.squeaks.c.n_block_height == key[1])
+                )
+                num_squeaks_by_block[key] = \
+                    connection.execute(s).fetchone()["num_squeaks"]
+            if num_squeaks_by_block[key] >= max_squeaks_per_address_per_block:
+                logger.info(
+                    "Rate limited squeak: {}".format(squeak_hash.hex()))
+                continue
+            num_squeaks_by_block[key] += 1
+            ret.append(squeak_hash)
+        return ret
+
+    def _squeak_values(
+            self,
+            squeak: CSqueak,
+            block_header: CBlockHeader,
+            secret_key: Optional[bytes],
+    ) -> dict:
+        return dict(
             hash=get_hash(squeak).hex(),
             squeak=squeak.serialize(),
             hash_reply_sqk=squeak.hashReplySqk.hex(),
@@ -177,16 +333,9 @@ class SqueakDb:
             n_block_height=squeak.nBlockHeight,
             n_time=squeak.nTime,
             author_address=str(squeak.GetAddress()),
-            secret_key=None,
+            secret_key=secret_key.hex() if secret_key is not None else None,
             block_header=block_header.serialize(),
         )
-        with self.get_connection() as connection:
-            try:
-                connection.execute(ins)
-                # inserted_squeak_hash = res.inserted_primary_key[0]
-            except sqlalchemy.exc.IntegrityError:
-                pass
-            return get_hash(squeak)
 
     def get_squeak_entry(self, squeak_hash: bytes) -> Optional[SqueakEntry]:
         """ Get a squeak. """
@@ -199,6 +348,32 @@ class SqueakDb:
                 return None
             return self._parse_squeak_entry(row)
 
+    def get_squeak_bytes(
+            self,
+            squeak_hashes: List[bytes],
+    ) -> Dict[bytes, bytes]:
+        """ Get the serialized squeaks with the given hashes.
+
+        Return a dict mapping each stored squeak hash to its serialized
+        squeak.
+        """
+        ret = {}
+        hashes_str = [squeak_hash.hex() for squeak_hash in squeak_hashes]
+        with self.get_connection() as connection:
+            for i in range(0, len(hashes_str), MAX_IN_CLAUSE_VALUES):
+                chunk = hashes_str[i:i + MAX_IN_CLAUSE_VALUES]
+                s = (
+                    select([
+                        self.squeaks.c.hash,
+                        self.squeaks.c.squeak,
+                    ])
+                    .where(self.squeaks.c.hash.in_(chunk))
+                )
+                result = connection.execute(s)
+                for row in result.fetchall():
+                    ret[bytes.fromhex(row["hash"])] = bytes(row["squeak"])
+        return ret
+
     def get_squeak_entry_with_profile(self, squeak_hash: bytes) -> Optional[SqueakEntryWithProfile]:
         """ Get a squeak with the author profile. """
         s = (
@@ -404,6 +579,106 @@ class SqueakDb:
             hashes = [bytes.fromhex(row["hash"]) for row in rows]
             return hashes
 
+    def lookup_squeaks_for_interests(
+        self,
+        interests: List[SqueakInterest],
+    ) -> Dict[SqueakInterest, List[bytes]]:
+        """ Lookup the unlocked squeaks that match each of the interests.
+
+        Interests with the same block range are combined in one clause, and
+        the clauses are combined in queries of at most MAX_IN_CLAUSE_VALUES
+        addresses.
+        """
+        ret: Dict[SqueakInterest, List[bytes]] = {
+            interest: [] for interest in interests
+        }
+        interests_by_address = defaultdict(list)
+        addresses_by_range = defaultdict(set)
+        for interest in ret:
+            interests_by_address[interest.address].append(interest)
+            block_range = (interest.min_block, interest.max_block)
+            addresses_by_range[block_range].add(interest.address)
+        clauses = []
+        for (min_block, max_block), addresses in addresses_by_range.items():
+            sorted_addresses = sorted(addresses)
+            for i in range(0, len(sorted_addresses), MAX_IN_CLAUSE_VALUES):
+                clauses.append((
+                    sorted_addresses[i:i + MAX_IN_CLAUSE_VALUES],
+                    min_block,
+                    max_block,
+                ))
+
+        seen = set()
+        with self.get_connection() as connection:
+            while clauses:
+                num_addresses = 0
+                conditions = []
+                while clauses and num_addresses + len(clauses[-1][0]) <= \
+                        MAX_IN_CLAUSE_VALUES:
+                    clause_addresses, min_block, max_block = clauses.pop()
+                    num_addresses += len(clause_addresses)
+                    conditions.append(and_(
+                        self.squeaks.c.author_address.in_(clause_addresses),
+                        self.squeaks.c.n_block_height >= min_block,
+                        self.squeaks.c.n_block_height <= max_block,
+                    ))
+                s = (
+                    select([
+                        self.squeaks.c.hash,
+                        self.squeaks.c.author_address,
+                        self.squeaks.c.n_block_height,
+                    ])
+                    .where(or_(*conditions))
+                    .where(self.squeak_has_secret_key)
+                )
+                result = connection.execute(s)
+                for row in result.fetchall():
+                    squeak_hash = bytes.fromhex(row["hash"])
+                    if squeak_hash in seen:
+                        continue
+                    seen.add(squeak_hash)
+                    block_height = row["n_block_height"]
+                    for interest in interests_by_address[
+                            row["author_address"]]:
+                        if interest.min_block <= block_height <= \
+                                interest.max_block:
+                            ret[interest].append(squeak_hash)
+        return ret
+
+    def lookup_squeak_hashes(
+        self,
+        squeak_hashes: List[bytes],
+    ) -> Dict[bytes, bool]:
+        """ Lookup which of the given squeak hashes are stored.
+
+        Return a dict mapping each stored squeak hash to True if the
+        squeak is unlocked, or False if it is locked.
+
+        Hashes found in the squeak hash index are answered without a query.
+        """
+        ret, missing_hashes = self.squeak_hash_index.lookup(squeak_hashes)
+        hashes_str = [squeak_hash.hex() for squeak_hash in missing_hashes]
+        if not hashes_str:
+            return ret
+        with self.get_connection() as connection:
+            for i in range(0, len(hashes_str), MAX_IN_CLAUSE_VALUES):
+                chunk = hashes_str[i:i + MAX_IN_CLAUSE_VALUES]
+                s = (
+                    select([
+                        self.squeaks.c.hash,
+                        self.squeaks.c.secret_key,
+                    ])
+                    .where(self.squeaks.c.hash.in_(chunk))
+                )
+                result = connection.execute(s)
+                for row in result.fetchall():
+                    squeak_hash = bytes.fromhex(row["hash"])
+                    is_unlocked = row["secret_key"] is not None
+                    # Not added to the index, because a delete or unlock
+                    # after the select would leave a stale entry.
+                    ret[squeak_hash] = is_unlocked
+        return ret
+
     def number_of_squeaks_with_address_with_block(
         self,
         address: str,
@@ -634,6 +909,7 @@ class SqueakDb:
         )
         with self.get_connection() as connection:
             connection.execute(stmt)
+        self.squeak_hash_index.set_unlocked(squeak_hash)
 
     def set_squeak_liked(self, squeak_hash: bytes) -> None:
         """ Set the squeak to be liked. """
@@ -662,6 +938,7 @@ class SqueakDb:
         )
         with self.get_connection() as connection:
             connection.execute(delete_squeak_stmt)
+        self.squeak_hash_index.remove(squeak_hash)
 
     def insert_peer(self, squeak_peer: SqueakPeer) -> int:
         """ Insert a new squeak peer. """
@@ -750,6 +1027,87 @@ class SqueakDb:
         with self.get_connection() as connection:
             connection.execute(delete_peer_stmt)
 
+    def get_peer_sync_states(
+            self,
+            peer_address: PeerAddress,
+            full_sync_interval_s: int,
+    ) -> List[PeerSyncState]:
+        """ Get the sync states of a peer that had a full sync within the
+        interval. """
+        s = (
+            select([self.peer_sync_states])
+            .where(self.peer_sync_states.c.peer_host == peer_address.host)
+            .where(self.peer_sync_states.c.peer_port == peer_address.port)
+            .where(~self.peer_sync_state_is_older_than(full_sync_interval_s))
+        )
+        with self.get_connection() as connection:
+            result = connection.execute(s)
+            rows = result.fetchall()
+            return [self._parse_peer_sync_state(row) for row in rows]
+
+    def insert_peer_sync_states(
+            self,
+            peer_sync_states: List[PeerSyncState],
+    ) -> None:
+        """ Insert or replace sync states after a full sync. """
+        if not peer_sync_states:
+            return
+        full_sync_time = self.datetime_now
+        with self.get_connection() as connection:
+            with connection.begin():
+                for peer_sync_state in peer_sync_states:
+                    connection.execute(
+                        self.peer_sync_states.delete().where(
+                            self._peer_sync_state_key(peer_sync_state)),
+                    )
+                connection.execute(
+                    self.peer_sync_states.insert(),
+                    [
+                        dict(
+                            peer_host=peer_sync_state.peer_address.host,
+                            peer_port=peer_sync_state.peer_address.port,
+                            author_address=peer_sync_state.address,
+                            last_synced_block=peer_sync_state.last_synced_block,
+                            full_sync_time=full_sync_time,
+                        )
+                        for peer_sync_state in peer_sync_states
+                    ],
+                )
+
+    def update_peer_sync_states(
+            self,
+            peer_sync_states: List[PeerSyncState],
+    ) -> None:
+        """ Update the last synced block of existing sync states. """
+        if not peer_sync_states:
+            return
+        with self.get_connection() as connection:
+            with connection.begin():
+                for peer_sync_state in peer_sync_states:
+                    connection.execute(
+                        self.peer_sync_states.update()
+                        .where(self._peer_sync_state_key(peer_sync_state))
+                        .values(
+                            last_synced_block=peer_sync_state.last_synced_block,
+                        ),
+                    )
+
+    def delete_old_peer_sync_states(self, interval_s: int) -> None:
+        """ Delete the sync states without a full sync within the
+        interval. """
+        stmt = self.peer_sync_states.delete().where(
+            self.peer_sync_state_is_older_than(interval_s))
+        with self.get_connection() as connection:
+            connection.execute(stmt)
+
+    def _peer_sync_state_key(self, peer_sync_state: PeerSyncState):
+        peer_address = peer_sync_state.peer_address
+        return and_(
+            self.peer_sync_states.c.peer_host == peer_address.host,
+            self.peer_sync_states.c.peer_port == peer_address.port,
+            self.peer_sync_states.c.author_address == peer_sync_state.address,
+        )
+
     def insert_received_offer(self, received_offer: ReceivedOffer):
         """ Insert a new received offer. """
         ins = self.received_offers.insert().values(
@@ -1188,6 +1546,16 @@ class SqueakDb:
             downloading=row["downloading"],
         )
 
+    def _parse_peer_sync_state(self, row) -> PeerSyncState:
+        return PeerSyncState(
+            peer_address=PeerAddress(
+                host=row["peer_host"],
+                port=row["peer_port"],
+            ),
+            address=row["author_address"],
+            last_synced_block=row["last_synced_block"],
+        )
+
     def _parse_received_offer(self, row) -> ReceivedOffer:
         return ReceivedOffer(
             received_offer_id=row["received_offer_id"],
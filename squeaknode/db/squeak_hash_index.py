@@ -0,0 +1,73 @@
+import threading
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Tuple
+
+
+class SqueakHashIndex:
+    """In-memory index of the hashes of the stored squeaks, and of which
+    of them are locked.
+
+    The database is the source of truth. The index only answers for hashes
+    that it contains, so a hash that is missing from the index must still
+    be looked up in the database.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._known = set()
+        self._locked = set()
+
+    def __len__(self):
+        return len(self._known)
+
+    def load(self, rows: Iterable[Tuple[bytes, bool]]) -> None:
+        """Replace the contents of the index with the given
+        (squeak_hash, is_unlocked) rows.
+        """
+        known = set()
+        locked = set()
+        for squeak_hash, is_unlocked in rows:
+            known.add(squeak_hash)
+            if not is_unlocked:
+                locked.add(squeak_hash)
+        with self._lock:
+            self._known = known
+            self._locked = locked
+
+    def add(self, squeak_hash: bytes, is_unlocked: bool) -> None:
+        with self._lock:
+            self._known.add(squeak_hash)
+            if is_unlocked:
+                self._locked.discard(squeak_hash)
+            else:
+                self._locked.add(squeak_hash)
+
+    def set_unlocked(self, squeak_hash: bytes) -> None:
+        with self._lock:
+            self._locked.discard(squeak_hash)
+
+    def remove(self, squeak_hash: bytes) -> None:
+        with self._lock:
+            self._known.discard(squeak_hash)
+            self._locked.discard(squeak_hash)
+
+    def lookup(
+            self,
+            squeak_hashes: List[bytes],
+    ) -> Tuple[Dict[bytes, bool], List[bytes]]:
+        """Lookup the given squeak hashes.
+
+        Return a dict mapping each indexed squeak hash to True if the
+        squeak is unlocked, and the list of hashes not in the index.
+        """
+        found = {}
+        missing = []
+        with self._lock:
+            for squeak_hash in squeak_hashes:
+                if squeak_hash in self._known:
+                    found[squeak_hash] = squeak_hash not in self._locked
+                else:
+                    missing.append(squeak_hash)
+        return found, missing
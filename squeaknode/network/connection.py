@@ -1,22 +1,28 @@
+import asyncio
 import logging
-from contextlib import contextmanager
+from concurrent.futures import Executor
+from contextlib import asynccontextmanager
 
 from squeak.messages import msg_verack
 from squeak.messages import msg_version
 
 from squeaknode.core.util import generate_version_nonce
 from squeaknode.network.connection_manager import ConnectionManager
+from squeaknode.network.download_scheduler import DownloadScheduler
+from squeaknode.network.message_stats import MessageStats
+from squeaknode.network.messages import NODE_RECONCILE
 from squeaknode.network.peer import Peer
 from squeaknode.network.peer_message_handler import PeerMessageHandler
 from squeaknode.node.squeak_controller import SqueakController
+from squeaknode.node.squeak_ingestion import SqueakIngestion
 
 
 logger = logging.getLogger(__name__)
 
 
-HANDSHAKE_TIMEOUT = 30
 UPDATE_TIME_INTERVAL = 10
 HANDSHAKE_VERSION = 70002
+HANDSHAKE_TIMEOUT_REASON = 'Handshake timeout'
 
 
 class Connection():
@@ -28,22 +34,32 @@ class Connection():
             peer: Peer,
             squeak_controller: SqueakController,
             connection_manager: ConnectionManager,
+            executor: Executor,
+            message_stats: MessageStats,
+            download_scheduler: DownloadScheduler,
+            squeak_ingestion: SqueakIngestion,
+            handshake_timeout: float,
     ):
         super().__init__()
         self.peer = peer
         self.squeak_controller = squeak_controller
         self.connection_manager = connection_manager
+        self.executor = executor
+        self.message_stats = message_stats
+        self.download_scheduler = download_scheduler
+        self.squeak_ingestion = squeak_ingestion
+        self.handshake_timeout = handshake_timeout
 
-    def handshake(self):
+    async def handshake(self):
         if self.peer.outgoing:
             local_version = self.version_pkt()
             self.peer.local_version = local_version
             self.peer.send_msg(local_version)
-            verack = self.peer.recv_msg()
+            verack = await self.peer.recv_msg()
             if not isinstance(verack, msg_verack):
                 raise Exception('Wrong message type for verack response.')
 
-        remote_version = self.peer.recv_msg()
+        remote_version = await self.peer.recv_msg()
         if not isinstance(remote_version, msg_version):
             raise Exception('Wrong message type for version message.')
         if self._is_duplicate_nonce(remote_version.nNonce):
@@ -56,11 +72,11 @@ class Connection():
             local_version = self.version_pkt()
             self.peer.local_version = local_version
             self.peer.send_msg(local_version)
-            verack = self.peer.recv_msg()
+            verack = await self.peer.recv_msg()
             if not isinstance(verack, msg_verack):
                 raise Exception('Wrong message type for verack response.')
 
-        return
+        self.peer.handshake_complete.set()
 
     def version_pkt(self):
         """Get the version message for this peer."""
@@ -68,6 +84,7 @@ class Connection():
         local_ip, local_port = self.squeak_controller.get_address()
         server_ip, server_port = self.peer.address
         msg.nVersion = HANDSHAKE_VERSION
+        msg.nServices |= NODE_RECONCILE
         msg.addrTo.ip = server_ip
         msg.addrTo.port = server_port
         msg.addrFrom.ip = local_ip
@@ -75,22 +92,59 @@ class Connection():
         msg.nNonce = generate_version_nonce()
         return msg
 
-    def handle_messages(self):
+    async def handle_messages(self):
+        """Handle messages from the peer, one at a time, in the order they
+        were received.
+
+        The message handlers make blocking calls to the controller, so they
+        are run in the executor instead of on the event loop. Return
+        immediately if the handshake did not complete.
+        """
+        if not self.peer.is_handshake_complete:
+            return
+        loop = asyncio.get_event_loop()
         peer_message_handler = PeerMessageHandler(
-            self.peer, self.squeak_controller)
+            self.peer,
+            self.squeak_controller,
+            self.message_stats,
+            self.download_scheduler,
+            self.squeak_ingestion,
+        )
+        logger.info('Started handling connected messages...')
         while True:
-            peer_message_handler.handle_msgs()
-
-    @contextmanager
-    def open_connection(self):
+            msg = await self.peer.recv_msg()
+            await loop.run_in_executor(
+                self.executor,
+                peer_message_handler.handle_peer_message,
+                msg,
+            )
+
+    @asynccontextmanager
+    async def open_connection(self):
         logger.debug(
             'Starting handshake connection with peer ... {}'.format(self.peer))
         self.connection_manager.add_peer(self.peer)
-        self.handshake()
-        logger.debug('Peer connection added... {}'.format(self.peer))
-        yield self
-        self.connection_manager.remove_peer(self.peer)
-        logger.debug('Peer connection removed... {}'.format(self.peer))
+        try:
+            try:
+                await asyncio.wait_for(
+                    self.handshake(),
+                    self.handshake_timeout,
+                )
+            except asyncio.TimeoutError:
+                # Stopping the peer ends the connection, so the timeout
+                # is not raised as an error.
+                self.connection_manager.disconnect_peer(
+                    self.peer,
+                    HANDSHAKE_TIMEOUT_REASON,
+                )
+            else:
+                logger.debug('Peer connection added... {}'.format(self.peer))
+            yield self
+        finally:
+            self.connection_manager.remove_peer(self.peer)
+            self.message_stats.remove_peer(self.peer.address)
+            self.download_scheduler.remove_peer(self.peer)
+            logger.debug('Peer connection removed... {}'.format(self.peer))
 
     # def __enter__(self):
     #     logger.debug(
@@ -1,10 +1,17 @@
 import logging
+import math
 import threading
+import time
+from collections import Counter
 
 
-MIN_PEERS = 5
-MAX_PEERS = 10
-UPDATE_THREAD_SLEEP_TIME = 10
+MAX_INBOUND_PEERS = 20
+MAX_OUTBOUND_PEERS = 10
+RESERVED_OUTBOUND_PEERS = 5
+EVICTION_PROTECTION_S = 60
+UPTIME_SCORE_MAX_S = 3600
+LATENCY_SCORE_MAX_S = 5
+EVICTED_REASON = 'Evicted for a new inbound connection'
 
 
 logger = logging.getLogger(__name__)
@@ -14,10 +21,22 @@ class ConnectionManager(object):
     """Maintains connections to other peers in the network.
     """
 
-    def __init__(self):
+    def __init__(
+            self,
+            max_inbound_peers=MAX_INBOUND_PEERS,
+            max_outbound_peers=MAX_OUTBOUND_PEERS,
+            reserved_outbound_peers=RESERVED_OUTBOUND_PEERS,
+    ):
         self._peers = {}
         self.peers_lock = threading.Lock()
         self.peers_changed_callback = None
+        self._disconnect_reasons = Counter()
+        self.max_inbound_peers = max_inbound_peers
+        self.max_outbound_peers = max_outbound_peers
+        self.reserved_outbound_peers = reserved_outbound_peers
+        self._num_inbound_slots = 0
+        self._num_outbound_slots = 0
+        self._num_refused_connections = 0
 
     @property
     def peers(self):
@@ -69,6 +88,122 @@ class ConnectionManager(object):
         """
         return self._peers.get(address)
 
+    def disconnect_peer(self, peer, reason):
+        """Disconnect a peer and record the reason.
+        """
+        logger.info('Disconnecting peer {} because: {}'.format(peer, reason))
+        with self.peers_lock:
+            self._disconnect_reasons[reason] += 1
+        peer.stop(reason)
+
+    @property
+    def disconnect_reasons(self):
+        """Get the number of peers disconnected for each reason.
+        """
+        with self.peers_lock:
+            return dict(self._disconnect_reasons)
+
+    @property
+    def num_half_open_peers(self):
+        """Number of connected peers that have not completed the handshake.
+        """
+        return sum(
+            1 for peer in self.peers
+            if not peer.is_handshake_complete
+        )
+
+    @property
+    def num_established_peers(self):
+        """Number of connected peers that have completed the handshake.
+        """
+        return sum(
+            1 for peer in self.peers
+            if peer.is_handshake_complete
+        )
+
+    @property
+    def num_inbound_slots(self):
+        return self._num_inbound_slots
+
+    @property
+    def num_outbound_slots(self):
+        return self._num_outbound_slots
+
+    @property
+    def num_refused_connections(self):
+        return self._num_refused_connections
+
+    def reserve_inbound_slot(self):
+        """Reserve a slot for a new inbound connection.
+
+        If all inbound slots are used, the inbound peer with the lowest
+        score is evicted to make room, unless every inbound peer is still
+        protected. Return False if the connection should be refused.
+        """
+        with self.peers_lock:
+            if self._num_inbound_slots < self.max_inbound_peers:
+                self._num_inbound_slots += 1
+                return True
+            peer = self._select_peer_to_evict()
+            if peer is None:
+                self._num_refused_connections += 1
+                return False
+            # The evicted peer releases its slot when it stops.
+            self._num_inbound_slots += 1
+        self.disconnect_peer(peer, EVICTED_REASON)
+        return True
+
+    def reserve_outbound_slot(self, use_reserved_slot=False):
+        """Reserve a slot for a new outbound connection.
+
+        The last reserved_outbound_peers slots can only be used by
+        connections to saved peers. Return False if no slot is available.
+        """
+        max_slots = self.max_outbound_peers
+        if not use_reserved_slot:
+            max_slots -= self.reserved_outbound_peers
+        with self.peers_lock:
+            if self._num_outbound_slots < max_slots:
+                self._num_outbound_slots += 1
+                return True
+            self._num_refused_connections += 1
+            return False
+
+    def release_slot(self, outgoing):
+        """Release the slot of a connection that is closed.
+        """
+        with self.peers_lock:
+            if outgoing:
+                self._num_outbound_slots -= 1
+            else:
+                self._num_inbound_slots -= 1
+
+    def _select_peer_to_evict(self):
+        now = time.time()
+        candidates = [
+            peer for peer in self._peers.values()
+            if not peer.outgoing
+            and peer.stop_reason is None
+            and now - peer.connect_time >= EVICTION_PROTECTION_S
+        ]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda peer: peer_score(peer, now))
+
+
+def peer_score(peer, now):
+    """Get the score of a peer, used to choose which peer to evict.
+
+    Peers that have been connected longer, that sent more useful squeaks,
+    and that have a lower ping latency have a higher score.
+    """
+    uptime_s = min(now - peer.connect_time, UPTIME_SCORE_MAX_S)
+    score = uptime_s / UPTIME_SCORE_MAX_S
+    score += math.log1p(peer.num_useful_squeaks)
+    if peer.ping_rtt is not None:
+        score -= min(peer.ping_rtt, LATENCY_SCORE_MAX_S) / LATENCY_SCORE_MAX_S
+    return score
+
 
 class DuplicatePeerError(Exception):
     pass
@@ -0,0 +1,204 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict
+from typing import List
+from typing import NamedTuple
+
+from squeak.messages import msg_getdata
+from squeak.net import CInv
+
+
+DOWNLOAD_TIMEOUT_S = 10
+MAX_DOWNLOADS_PER_PEER = 1000
+MAX_PENDING_DOWNLOADS = 100000
+RECENT_DOWNLOADS_LEN = 10000
+DOWNLOAD_TICK_S = 1
+
+
+logger = logging.getLogger(__name__)
+
+
+class DownloadStats(NamedTuple):
+    """Represents the statistics of the squeak downloads."""
+    num_requested: int
+    num_received: int
+    num_duplicates: int
+    num_timeouts: int
+    num_in_flight: int
+    num_pending: int
+
+    @property
+    def duplicate_ratio(self) -> float:
+        """Fraction of the downloaded squeaks that were already received
+        from another peer."""
+        num_downloads = self.num_received + self.num_duplicates
+        if num_downloads == 0:
+            return 0.0
+        return self.num_duplicates / num_downloads
+
+
+class _Download:
+
+    def __init__(self):
+        self.peer = None
+        self.deadline = None
+        self.announcers = []
+
+
+class DownloadScheduler:
+    """Requests each announced squeak from a single peer at a time.
+
+    When more peers announce a squeak that is already requested, they are
+    remembered as announcers, and no other request is sent. If the request
+    is not answered within timeout_s, or the peer answers with notfound or
+    disconnects, the squeak is requested from the next announcer. At most
+    max_downloads_per_peer squeaks are requested from a peer at the same
+    time, and the rest wait for it to answer.
+    """
+
+    def __init__(
+            self,
+            timeout_s=DOWNLOAD_TIMEOUT_S,
+            max_downloads_per_peer=MAX_DOWNLOADS_PER_PEER,
+            tick_s=DOWNLOAD_TICK_S,
+    ):
+        self.timeout_s = timeout_s
+        self.max_downloads_per_peer = max_downloads_per_peer
+        self.tick_s = tick_s
+        self._lock = threading.Lock()
+        self._downloads: Dict[bytes, _Download] = {}
+        self._peer_downloads: Dict[object, int] = {}
+        self._recent_downloads: OrderedDict = OrderedDict()
+        self._num_requested = 0
+        self._num_received = 0
+        self._num_duplicates = 0
+        self._num_timeouts = 0
+
+    @property
+    def stats(self) -> DownloadStats:
+        with self._lock:
+            return DownloadStats(
+                num_requested=self._num_requested,
+                num_received=self._num_received,
+                num_duplicates=self._num_duplicates,
+                num_timeouts=self._num_timeouts,
+                num_in_flight=sum(self._peer_downloads.values()),
+                num_pending=len(self._downloads),
+            )
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.tick_s)
+            try:
+                for peer, squeak_hashes in self.dispatch().items():
+                    peer.send_msg(make_getdata_msg(squeak_hashes))
+            except Exception:
+                logger.exception('Failed to dispatch downloads.')
+
+    def add_announcement(
+            self,
+            peer,
+            squeak_hashes: List[bytes],
+            now=None,
+    ) -> List[bytes]:
+        """Record the squeaks announced by the peer, and get the ones that
+        should be requested from it now."""
+        now = now or time.monotonic()
+        ret = []
+        with self._lock:
+            for squeak_hash in squeak_hashes:
+                download = self._downloads.get(squeak_hash)
+                if download is None:
+                    if len(self._downloads) >= MAX_PENDING_DOWNLOADS:
+                        continue
+                    download = _Download()
+                    self._downloads[squeak_hash] = download
+                if download.peer is None and self._has_capacity(peer):
+                    self._start(download, peer, now)
+                    ret.append(squeak_hash)
+                elif (
+                    download.peer is not peer
+                    and peer not in download.announcers
+                ):
+                    download.announcers.append(peer)
+        return ret
+
+    def on_received(self, peer, squeak_hash: bytes) -> None:
+        with self._lock:
+            download = self._downloads.pop(squeak_hash, None)
+            if download is not None:
+                self._finish(download)
+                self._num_received += 1
+                self._recent_downloads[squeak_hash] = None
+                if len(self._recent_downloads) > RECENT_DOWNLOADS_LEN:
+                    self._recent_downloads.popitem(last=False)
+            elif squeak_hash in self._recent_downloads:
+                self._num_duplicates += 1
+
+    def on_not_found(self, peer, squeak_hashes: List[bytes]) -> None:
+        with self._lock:
+            for squeak_hash in squeak_hashes:
+                download = self._downloads.get(squeak_hash)
+                if download is not None and download.peer is peer:
+                    self._finish(download)
+
+    def remove_peer(self, peer) -> None:
+        with self._lock:
+            for download in self._downloads.values():
+                if download.peer is peer:
+                    self._finish(download)
+                if peer in download.announcers:
+                    download.announcers.remove(peer)
+
+    def dispatch(self, now=None) -> Dict:
+        """Expire the timed out requests, and get the squeaks to request
+        from each peer."""
+        now = now or time.monotonic()
+        ret: Dict = {}
+        with self._lock:
+            for squeak_hash, download in list(self._downloads.items()):
+                if download.peer is not None:
+                    if now < download.deadline:
+                        continue
+                    self._num_timeouts += 1
+                    self._finish(download)
+                for peer in download.announcers:
+                    if self._has_capacity(peer):
+                        download.announcers.remove(peer)
+                        self._start(download, peer, now)
+                        ret.setdefault(peer, []).append(squeak_hash)
+                        break
+                if download.peer is None and not download.announcers:
+                    del self._downloads[squeak_hash]
+        return ret
+
+    def _has_capacity(self, peer) -> bool:
+        num_downloads = self._peer_downloads.get(peer, 0)
+        return num_downloads < self.max_downloads_per_peer
+
+    def _start(self, download, peer, now) -> None:
+        download.peer = peer
+        download.deadline = now + self.timeout_s
+        self._peer_downloads[peer] = self._peer_downloads.get(peer, 0) + 1
+        self._num_requested += 1
+
+    def _finish(self, download) -> None:
+        peer = download.peer
+        if peer is None:
+            return
+        download.peer = None
+        download.deadline = None
+        self._peer_downloads[peer] -= 1
+        if self._peer_downloads[peer] == 0:
+            del self._peer_downloads[peer]
+
+
+def make_getdata_msg(squeak_hashes: List[bytes]) -> msg_getdata:
+    invs = [
+        CInv(type=1, hash=squeak_hash)
+        for squeak_hash in squeak_hashes
+    ]
+    return msg_getdata(inv=invs)
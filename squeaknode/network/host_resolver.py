@@ -0,0 +1,111 @@
+import asyncio
+import ipaddress
+import logging
+import socket
+import time
+from collections import OrderedDict
+
+
+RESOLVE_TTL_S = 300
+RESOLVE_NEGATIVE_TTL_S = 30
+RESOLVE_CACHE_MAX_ENTRIES = 1000
+
+
+logger = logging.getLogger(__name__)
+
+
+class HostResolver:
+    """Resolves host names to ip addresses on the peer event loop, and
+    caches the results.
+
+    Successful lookups are cached for ttl_s, and failed lookups are cached
+    for negative_ttl_s. Concurrent lookups of the same host share one
+    query.
+    """
+
+    def __init__(
+            self,
+            ttl_s=RESOLVE_TTL_S,
+            negative_ttl_s=RESOLVE_NEGATIVE_TTL_S,
+            max_entries=RESOLVE_CACHE_MAX_ENTRIES,
+    ):
+        self.ttl_s = ttl_s
+        self.negative_ttl_s = negative_ttl_s
+        self.max_entries = max_entries
+        self._cache: OrderedDict = OrderedDict()
+        self._pending = {}
+        self._num_hits = 0
+        self._num_misses = 0
+
+    @property
+    def num_hits(self):
+        return self._num_hits
+
+    @property
+    def num_misses(self):
+        return self._num_misses
+
+    async def resolve(self, host):
+        """Get the ip address of the host.
+
+        Raise an exception if the host cannot be resolved.
+        """
+        if is_ip_address(host):
+            return host
+        entry = self._cache.get(host)
+        if entry is not None:
+            expire_time, ip = entry
+            if expire_time > time.monotonic():
+                self._num_hits += 1
+                if ip is None:
+                    raise HostResolveError(
+                        'Failed to resolve host {}'.format(host))
+                return ip
+            del self._cache[host]
+        self._num_misses += 1
+        pending = self._pending.get(host)
+        if pending is None:
+            pending = asyncio.ensure_future(self._lookup(host))
+            self._pending[host] = pending
+            pending.add_done_callback(self._on_lookup_done)
+        return await asyncio.shield(pending)
+
+    def _on_lookup_done(self, future):
+        for host, pending in list(self._pending.items()):
+            if pending is future:
+                del self._pending[host]
+        # Retrieve the exception, in case every caller was cancelled.
+        if not future.cancelled():
+            future.exception()
+
+    async def _lookup(self, host):
+        loop = asyncio.get_event_loop()
+        try:
+            infos = await loop.getaddrinfo(
+                host, None, family=socket.AF_INET, type=socket.SOCK_STREAM)
+            ip = infos[0][4][0]
+        except Exception as e:
+            logger.info('Failed to resolve host {}: {!r}'.format(host, e))
+            self._put(host, None, self.negative_ttl_s)
+            raise HostResolveError(
+                'Failed to resolve host {}'.format(host)) from e
+        self._put(host, ip, self.ttl_s)
+        return ip
+
+    def _put(self, host, ip, ttl_s):
+        self._cache.pop(host, None)
+        self._cache[host] = (time.monotonic() + ttl_s, ip)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+
+class HostResolveError(Exception):
+    pass
+
+
+def is_ip_address(host):
+    try:
+        ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return True
@@ -0,0 +1,116 @@
+import bisect
+import logging
+import threading
+from typing import Dict
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Tuple
+
+
+logger = logging.getLogger(__name__)
+
+
+# Upper bounds (in seconds) of the latency histogram buckets. The last
+# bucket counts every call slower than the last bound.
+LATENCY_BUCKET_BOUNDS_S = [
+    0.001,
+    0.005,
+    0.01,
+    0.05,
+    0.1,
+    0.5,
+    1,
+    5,
+]
+
+
+class CommandStats(NamedTuple):
+    """Represents the handling statistics of a message command."""
+    command: str
+    peer_address: Optional[Tuple[str, int]]
+    num_calls: int
+    num_errors: int
+    total_time_s: float
+    latency_histogram: List[int]
+
+
+class _CommandCounter:
+
+    def __init__(self):
+        self.num_calls = 0
+        self.num_errors = 0
+        self.total_time_s = 0.0
+        self.latency_histogram = [0] * (len(LATENCY_BUCKET_BOUNDS_S) + 1)
+
+    def record(self, elapsed_s, error):
+        self.num_calls += 1
+        if error:
+            self.num_errors += 1
+        self.total_time_s += elapsed_s
+        bucket = bisect.bisect_left(LATENCY_BUCKET_BOUNDS_S, elapsed_s)
+        self.latency_histogram[bucket] += 1
+
+    def to_command_stats(self, command, peer_address=None):
+        return CommandStats(
+            command=command,
+            peer_address=peer_address,
+            num_calls=self.num_calls,
+            num_errors=self.num_errors,
+            total_time_s=self.total_time_s,
+            latency_histogram=list(self.latency_histogram),
+        )
+
+
+class MessageStats:
+    """Records the number of calls, errors and latency of the handled
+    messages, for each command and for each peer.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._command_counters: Dict[str, _CommandCounter] = {}
+        self._peer_command_counters: Dict[
+            Tuple[Tuple[str, int], str], _CommandCounter] = {}
+
+    def record(self, peer_address, command, elapsed_s, error=False):
+        command_str = command.decode('utf-8', 'replace')
+        with self._lock:
+            self._get_counter(
+                self._command_counters,
+                command_str,
+            ).record(elapsed_s, error)
+            self._get_counter(
+                self._peer_command_counters,
+                (peer_address, command_str),
+            ).record(elapsed_s, error)
+
+    def remove_peer(self, peer_address):
+        """Remove the statistics of a peer that is no longer connected."""
+        with self._lock:
+            for key in list(self._peer_command_counters):
+                if key[0] == peer_address:
+                    del self._peer_command_counters[key]
+
+    def get_command_stats(self) -> List[CommandStats]:
+        with self._lock:
+            return [
+                counter.to_command_stats(command)
+                for command, counter in sorted(self._command_counters.items())
+            ]
+
+    def get_peer_command_stats(self) -> List[CommandStats]:
+        with self._lock:
+            return [
+                counter.to_command_stats(command, peer_address)
+                for (peer_address, command), counter
+                in sorted(self._peer_command_counters.items())
+            ]
+
+    @staticmethod
+    def _get_counter(counters, key):
+        counter = counters.get(key)
+        if counter is None:
+            counter = _CommandCounter()
+            counters[key] = counter
+        return counter
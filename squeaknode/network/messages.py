@@ -0,0 +1,154 @@
+import hashlib
+import struct
+from io import BytesIO
+
+import squeak.params
+from bitcoin.core.serialize import ser_read
+from bitcoin.core.serialize import Serializable
+from bitcoin.core.serialize import VectorSerializer
+from bitcoin.messages import MsgSerializable as BitcoinMsgSerializable
+from squeak.messages import messagemap
+from squeak.messages import MsgSerializable
+from squeak.net import CSqueakLocator
+from squeak.net import PROTO_VERSION
+
+from squeaknode.core.squeak_digest import DIGEST_LENGTH
+
+
+# Service bit set in the version message by nodes that handle reconcile
+# messages.
+NODE_RECONCILE = 1 << 1
+# About three and a half days of blocks, so a default sync window has five
+# buckets.
+RECONCILE_BUCKET_SIZE = 504
+# Each digest is 20 bytes, so a reconcile message stays well under
+# MAX_MESSAGE_LEN.
+MAX_RECONCILE_BUCKETS = 10000
+
+
+class CBucketDigest(Serializable):
+    """Contains the digest of the squeaks in one bucket of an interest.
+
+    nInterest is the index of the interest in the locator, and nBucket is
+    the block height of the bucket divided by the bucket size.
+    """
+
+    def __init__(
+            self,
+            nInterest=0,
+            nBucket=0,
+            nNumSqueaks=0,
+            hashDigest=b'\x00' * DIGEST_LENGTH,
+    ):
+        self.nInterest = nInterest
+        self.nBucket = nBucket
+        self.nNumSqueaks = nNumSqueaks
+        self.hashDigest = hashDigest
+
+    @classmethod
+    def stream_deserialize(cls, f):
+        nInterest = struct.unpack(b"<I", ser_read(f, 4))[0]
+        nBucket = struct.unpack(b"<I", ser_read(f, 4))[0]
+        nNumSqueaks = struct.unpack(b"<I", ser_read(f, 4))[0]
+        hashDigest = ser_read(f, DIGEST_LENGTH)
+        return cls(nInterest, nBucket, nNumSqueaks, hashDigest)
+
+    def stream_serialize(self, f):
+        f.write(struct.pack(b"<I", self.nInterest))
+        f.write(struct.pack(b"<I", self.nBucket))
+        f.write(struct.pack(b"<I", self.nNumSqueaks))
+        assert len(self.hashDigest) == DIGEST_LENGTH
+        f.write(self.hashDigest)
+
+    def __repr__(self):
+        return "CBucketDigest(nInterest=%i nBucket=%i nNumSqueaks=%i hashDigest=%s)" % \
+            (self.nInterest, self.nBucket, self.nNumSqueaks, self.hashDigest.hex())
+
+
+class msg_reconcile(MsgSerializable, BitcoinMsgSerializable):
+    """Requests the squeaks of the interests in the locator, like
+    getsqueaks, but only for the buckets whose digests differ from the
+    sender's.
+
+    Buckets without a digest are empty on the sender.
+    """
+    command = b"reconcile"
+
+    def __init__(
+            self,
+            locator=None,
+            nBucketSize=1,
+            vDigests=None,
+            protover=PROTO_VERSION,
+    ):
+        super(msg_reconcile, self).__init__(protover)
+        self.locator = locator or CSqueakLocator()
+        self.nBucketSize = nBucketSize
+        self.vDigests = vDigests or []
+
+    @classmethod
+    def msg_deser(cls, f, protover=PROTO_VERSION):
+        locator = CSqueakLocator.stream_deserialize(f)
+        nBucketSize = struct.unpack(b"<I", ser_read(f, 4))[0]
+        vDigests = VectorSerializer.stream_deserialize(CBucketDigest, f)
+        return cls(locator, nBucketSize, vDigests)
+
+    def msg_ser(self, f):
+        self.locator.stream_serialize(f)
+        f.write(struct.pack(b"<I", self.nBucketSize))
+        VectorSerializer.stream_serialize(CBucketDigest, self.vDigests, f)
+
+    def __repr__(self):
+        return "msg_reconcile(locator=%r nBucketSize=%i vDigests=%r)" % \
+            (self.locator, self.nBucketSize, self.vDigests)
+
+
+messagemap[msg_reconcile.command] = msg_reconcile
+
+
+class msg_squeak_bytes(MsgSerializable, BitcoinMsgSerializable):
+    """Carries a squeak message with the squeak still serialized.
+
+    Received squeak messages are decoded to this class instead of
+    msg_squeak, so that the squeak is not deserialized on the peer event
+    loop. It is verified and deserialized by the ingestion pipeline.
+    """
+    command = b"squeak"
+
+    def __init__(self, squeak_bytes=b'', protover=PROTO_VERSION):
+        super(msg_squeak_bytes, self).__init__(protover)
+        self.squeak_bytes = squeak_bytes
+
+    @classmethod
+    def msg_deser(cls, f, protover=PROTO_VERSION):
+        return cls(f.read())
+
+    def msg_ser(self, f):
+        f.write(self.squeak_bytes)
+
+    def __repr__(self):
+        return "msg_squeak_bytes(len=%i)" % len(self.squeak_bytes)
+
+
+# Commands that the node decodes with its own classes. They are not added
+# to the messagemap of the squeak library, so that other users of the
+# library still decode them to the library classes.
+local_messagemap = {
+    msg_squeak_bytes.command: msg_squeak_bytes,
+}
+
+
+def decode_msg(msg_bytes, protover=PROTO_VERSION):
+    """Decode a complete message, using the local message map for the
+    commands that it contains."""
+    command = msg_bytes[4:16].split(b"\x00", 1)[0]
+    cls = local_messagemap.get(command)
+    if cls is None:
+        return MsgSerializable.from_bytes(msg_bytes, protover=protover)
+    if msg_bytes[:4] != squeak.params.params.MESSAGE_START:
+        raise ValueError("Invalid message start")
+    payload = msg_bytes[24:]
+    checksum = hashlib.sha256(hashlib.sha256(payload).digest()).digest()[:4]
+    if msg_bytes[20:24] != checksum:
+        raise ValueError("Invalid message checksum")
+    return cls.msg_deser(BytesIO(payload), protover=protover)
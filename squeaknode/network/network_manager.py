@@ -1,5 +1,4 @@
 import logging
-import socket
 
 import squeak.params
 
@@ -37,7 +36,7 @@ class NetworkManager(object):
 
     def connect_host(self, host):
         """Connect to a peer by hostname."""
-        address = resolve_hostname(host)
+        address = (host, squeak.params.params.DEFAULT_PORT)
         self.connect_peer(address)
 
     def connect_seed_peers(self):
@@ -56,19 +55,10 @@ class NetworkManager(object):
         logger.debug('Stopped network manager.')
 
 
-def resolve_hostname(hostname):
-    """Get the ip address from hostname."""
-    try:
-        ip = socket.gethostbyname(hostname)
-    except Exception:
-        return None
-    port = squeak.params.params.DEFAULT_PORT
-    return (ip, port)
-
-
 def get_seed_peer_addresses():
-    """Get addresses of seed peers"""
+    """Get addresses of seed peers.
+
+    The host names are resolved by the peer server when connecting.
+    """
     for _, seed_host in squeak.params.params.DNS_SEEDS:
-        address = resolve_hostname(seed_host)
-        if address:
-            yield address
+        yield (seed_host, squeak.params.params.DEFAULT_PORT)
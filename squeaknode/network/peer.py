@@ -1,49 +1,114 @@
+import asyncio
+import hashlib
 import logging
-import queue
-import threading
+import struct
 import time
-from io import BytesIO
+from collections import deque
+from collections import OrderedDict
 
-from bitcoin.core.serialize import SerializationTruncationError
+import squeak.params
 from bitcoin.net import CAddress
-from squeak.messages import MsgSerializable
 
 from squeaknode.core.peer_address import PeerAddress
+from squeaknode.network.messages import decode_msg
+from squeaknode.network.messages import NODE_RECONCILE
 
 
 MAX_MESSAGE_LEN = 1048576
-SOCKET_READ_LEN = 1024
+MESSAGE_HEADER_LEN = 24
+MESSAGE_LENGTH_OFFSET = 16
+SOCKET_READ_LEN = 65536
+SEND_QUEUE_MAX_LEN = 10000
+SEND_QUEUE_MAX_BYTES = 10485760
+SEND_COALESCE_LEN = 65536
+SEND_TIMEOUT = 30
+RECV_QUEUE_MAX_LEN = 1000
+RECV_QUEUE_MAX_BYTES = 4194304
 LAST_MESSAGE_TIMEOUT = 600
 PING_TIMEOUT = 10
 PING_INTERVAL = 60
+MAX_PENDING_SYNC_UPDATES = 10
+MAX_REMOTE_INTERESTED_ADDRESSES = 10000
+REMOTE_INTEREST_EXPIRY_S = 600
+MAX_RECEIVED_SQUEAK_HASHES = 10000
 
 
 logger = logging.getLogger(__name__)
 
 
+def serialize_msg(command, payload):
+    """Serialize a message from its command and its serialized payload,
+    in the same format as `MsgSerializable.to_bytes`.
+    """
+    checksum = hashlib.sha256(hashlib.sha256(payload).digest()).digest()
+    return b''.join([
+        squeak.params.params.MESSAGE_START,
+        command,
+        b'\x00' * (12 - len(command)),
+        struct.pack(b'<I', len(payload)),
+        checksum[:4],
+        payload,
+    ])
+
+
 class Peer(object):
     """Maintains the internal state of a peer connection.
     """
 
-    def __init__(self, peer_socket, address, outgoing=False):
+    def __init__(
+            self,
+            peer_socket,
+            address,
+            outgoing=False,
+            read_len=SOCKET_READ_LEN,
+            max_send_queue_len=SEND_QUEUE_MAX_LEN,
+            max_send_queue_bytes=SEND_QUEUE_MAX_BYTES,
+            send_timeout=SEND_TIMEOUT,
+            send_error_callback=None,
+            max_recv_queue_len=RECV_QUEUE_MAX_LEN,
+            max_recv_queue_bytes=RECV_QUEUE_MAX_BYTES,
+            dial_address=None,
+    ):
         time_now = int(time.time())
+        self._loop = asyncio.get_event_loop()
         self._peer_socket = peer_socket
-        self._peer_socket_lock = threading.Lock()
         self._address = address
         self._outgoing = outgoing
+        self._dial_address = dial_address
+        self._read_len = read_len
         self._connect_time = time_now
         self._local_version = None
         self._remote_version = None
-        self._last_msg_revc_time = None
         self._last_sent_ping_nonce = None
         self._last_sent_ping_time = None
         self._last_recv_ping_time = None
-        self._recv_msg_queue = queue.Queue()
-
-        self.handshake_complete = threading.Event()
-        self.ping_started = threading.Event()
-        self.ping_complete = threading.Event()
-        self.stopped = threading.Event()
+        self._ping_rtt = None
+        self._num_useful_squeaks = 0
+        self._remote_interested_addresses = OrderedDict()
+        self._received_squeak_hashes = OrderedDict()
+        self._sync_request_time = None
+        self._pending_sync_updates = deque(maxlen=MAX_PENDING_SYNC_UPDATES)
+        self._recv_msg_queue = ReceiveQueue(
+            max_recv_queue_len,
+            max_recv_queue_bytes,
+        )
+        self._msg_receiver_task = None
+        self._msg_sender_task = None
+        self._stop_reason = None
+        self._send_error_callback = send_error_callback
+
+        self.handshake_complete = asyncio.Event()
+        self.ping_started = asyncio.Event()
+        self.ping_complete = asyncio.Event()
+        self.stopped = asyncio.Event()
+
+        self._msg_sender = MessageSender(
+            self._peer_socket,
+            self._on_send_error,
+            max_send_queue_len,
+            max_send_queue_bytes,
+            send_timeout,
+        )
 
     @property
     def nVersion(self):
@@ -63,6 +128,13 @@ class Peer(object):
             port=port,
         )
 
+    @property
+    def dial_address(self):
+        """The address that was dialed for an outgoing connection, with
+        the host name as it was given, or None for an incoming connection.
+        """
+        return self._dial_address
+
     @property
     def address_string(self):
         ip, port = self._address
@@ -111,13 +183,27 @@ class Peer(object):
     def remote_version(self, remote_version):
         self._remote_version = remote_version
 
+    @property
+    def supports_reconciliation(self):
+        """Whether both sides of the connection handle reconcile
+        messages."""
+        local_version = self._local_version
+        remote_version = self._remote_version
+        if local_version is None or remote_version is None:
+            return False
+        return bool(
+            local_version.nServices
+            & remote_version.nServices
+            & NODE_RECONCILE
+        )
+
     @property
     def is_handshake_complete(self):
         return self.handshake_complete.is_set()
 
     @property
     def last_msg_revc_time(self):
-        return self._last_msg_revc_time
+        return self._recv_msg_queue.last_msg_time
 
     @property
     def last_sent_ping_time(self):
@@ -126,7 +212,23 @@ class Peer(object):
     def set_last_sent_ping(self, nonce, timestamp=None):
         timestamp = timestamp or time.time()
         self._last_sent_ping_nonce = nonce
-        self._last_sent_ping_time = time.time()
+        self._last_sent_ping_time = timestamp
+
+    @property
+    def is_ping_pending(self):
+        """True if a ping was sent and its pong was not received yet."""
+        return self._last_sent_ping_nonce is not None
+
+    def set_pong_response(self, nonce, timestamp=None):
+        """Record the pong response to the last ping, and its round trip
+        time.
+        """
+        if nonce != self._last_sent_ping_nonce:
+            logger.info('Unexpected pong nonce from {}'.format(self))
+            return
+        timestamp = timestamp or time.time()
+        self._ping_rtt = timestamp - self._last_sent_ping_time
+        self._last_sent_ping_nonce = None
 
     @property
     def last_recv_ping_time(self):
@@ -136,19 +238,146 @@ class Peer(object):
         timestamp = timestamp or time.time()
         self._last_recv_ping_time = timestamp
 
-    def recv_msg(self):
-        """Read data from the peer socket, and yield messages as they are decoded.
+    @property
+    def ping_rtt(self):
+        """Round trip time in seconds of the last ping, or None if no
+        ping has completed.
+        """
+        return self._ping_rtt
+
+    @property
+    def num_useful_squeaks(self):
+        """Number of squeaks received from the peer and saved."""
+        return self._num_useful_squeaks
+
+    def add_useful_squeak(self):
+        self._num_useful_squeaks += 1
+
+    @property
+    def sync_request_time(self):
+        """Time of the oldest sync request that the peer has not answered
+        yet, or None."""
+        return self._sync_request_time
+
+    def set_sync_requested(self, timestamp=None, sync_update=None):
+        """Record a sync request sent to the peer.
 
-        This method blocks when the socket has no data to read.
+        The sync update is saved only after the peer answers the request.
+        The oldest updates are dropped if the peer leaves too many requests
+        unanswered, so that those blocks are requested again.
+        """
+        if self._sync_request_time is None:
+            self._sync_request_time = timestamp or time.time()
+        if sync_update is not None:
+            self._pending_sync_updates.append(sync_update)
+
+    def set_sync_response(self):
+        self._sync_request_time = None
+
+    def pop_sync_update(self):
+        """Return the sync update of the oldest unanswered sync request, or
+        None."""
+        if not self._pending_sync_updates:
+            return None
+        return self._pending_sync_updates.popleft()
+
+    def is_remote_interested(self, address, now=None):
+        """Return True if the peer requested squeaks for the author address
+        within the remote interest expiry."""
+        request_time = self._remote_interested_addresses.get(address)
+        if request_time is None:
+            return False
+        now = now or time.time()
+        return now - request_time < REMOTE_INTEREST_EXPIRY_S
+
+    def add_remote_interested_addresses(self, addresses, now=None):
+        """Record the author addresses that the peer requested squeaks for.
+
+        The addresses that were not requested again within the expiry are
+        removed, and only the most recently requested addresses are kept.
         """
-        msg = self._recv_msg_queue.get()
+        now = now or time.time()
+        interested_addresses = self._remote_interested_addresses
+        for address in addresses:
+            interested_addresses.pop(address, None)
+            interested_addresses[address] = now
+        while interested_addresses:
+            address, request_time = next(iter(interested_addresses.items()))
+            if len(interested_addresses) <= MAX_REMOTE_INTERESTED_ADDRESSES \
+                    and now - request_time < REMOTE_INTEREST_EXPIRY_S:
+                break
+            del interested_addresses[address]
+
+    def has_received_squeak(self, squeak_hash):
+        """Return True if the squeak was recently received from the peer."""
+        return squeak_hash in self._received_squeak_hashes
+
+    def add_received_squeak(self, squeak_hash):
+        self._received_squeak_hashes[squeak_hash] = None
+        if len(self._received_squeak_hashes) > MAX_RECEIVED_SQUEAK_HASHES:
+            self._received_squeak_hashes.popitem(last=False)
+
+    @property
+    def send_queue_len(self):
+        """Number of messages waiting to be written to the socket."""
+        return len(self._msg_sender.queue)
+
+    @property
+    def send_queue_bytes(self):
+        """Number of bytes waiting to be written to the socket."""
+        return self._msg_sender.queue_bytes
+
+    @property
+    def recv_queue_len(self):
+        """Number of received messages waiting to be handled."""
+        return len(self._recv_msg_queue)
+
+    @property
+    def recv_queue_bytes(self):
+        """Number of received bytes waiting to be handled."""
+        return self._recv_msg_queue.queue_bytes
+
+    @property
+    def is_recv_queue_full(self):
+        """True if reading from the socket is paused because the receive
+        queue is full."""
+        return self._recv_msg_queue.is_full()
+
+    @property
+    def recv_backpressure_count(self):
+        """Number of times reading from the socket was paused because the
+        receive queue was full."""
+        return self._recv_msg_queue.num_backpressure
+
+    async def recv_msg(self):
+        """Wait for the next message decoded from the peer socket.
+
+        This coroutine waits when the peer has not sent any messages.
+        """
+        msg = await self._recv_msg_queue.get()
         logger.debug('Received msg {} from {}'.format(msg, self))
         logger.info('Received msg {} from {}'.format(msg, self))
         return msg
 
-    def stop(self):
-        logger.info("Stopping peer: {}".format(self))
-        self.stopped.set()
+    @property
+    def stop_reason(self):
+        return self._stop_reason
+
+    def stop(self, reason=None):
+        """Stop the peer connection.
+
+        This method is safe to call from any thread.
+        """
+        logger.info("Stopping peer: {}, reason: {}".format(self, reason))
+        if reason and self._stop_reason is None:
+            self._stop_reason = reason
+        self._loop.call_soon_threadsafe(self.stopped.set)
+
+    def _on_send_error(self, reason):
+        if self._send_error_callback:
+            self._send_error_callback(self, reason)
+        else:
+            self.stop(reason)
 
     def close(self):
         logger.info("closing peer socket: {}".format(self._peer_socket))
@@ -156,28 +385,72 @@ class Peer(object):
             self._peer_socket.close()
 
     def send_msg(self, msg):
+        """Put a message in the send queue of the peer.
+
+        This method is safe to call from any thread, and returns without
+        waiting for the data to be written to the socket.
+        """
         logger.debug('Sending msg {} to {}'.format(msg, self))
         logger.info('Sending msg {} to {}'.format(msg, self))
         data = msg.to_bytes()
-        try:
-            with self._peer_socket_lock:
-                self._peer_socket.send(data)
-        except Exception:
-            logger.info('Failed to send msg to {}'.format(self))
-            self.stop()
+        self._loop.call_soon_threadsafe(self._msg_sender.enqueue, data)
+
+    def send_msg_payload(self, command, payload):
+        """Put a message in the send queue of the peer, from its command
+        and its already serialized payload.
+
+        This method is safe to call from any thread.
+        """
+        logger.debug('Sending {} msg with payload length {} to {}'.format(
+            command, len(payload), self))
+        data = serialize_msg(command, payload)
+        self._loop.call_soon_threadsafe(self._msg_sender.enqueue, data)
 
-    def __enter__(self):
+    async def run_until_stopped(self, coro):
+        """Run the coroutine until it completes or the peer is stopped.
+        """
+        task = asyncio.ensure_future(coro)
+        stopped_task = asyncio.ensure_future(self.stopped.wait())
+        try:
+            await asyncio.wait(
+                [task, stopped_task],
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+        finally:
+            task_done = task.done()
+            task.cancel()
+            stopped_task.cancel()
+        if task_done and not task.cancelled() and \
+                task.exception() is not None:
+            logger.error(
+                'Error in peer connection {}'.format(self),
+                exc_info=task.exception(),
+            )
+
+    async def __aenter__(self):
         logger.debug('Setting up peer {} ...'.format(self))
         msg_receiver = MessageReceiver(
-            self._peer_socket, self._recv_msg_queue, self.stopped)
-        threading.Thread(
-            target=msg_receiver.recv_msgs,
-            args=(),
-        ).start()
+            self._peer_socket,
+            self._recv_msg_queue,
+            self.stopped,
+            self._read_len,
+            self.set_pong_response,
+        )
+        self._msg_receiver_task = asyncio.ensure_future(
+            msg_receiver.recv_msgs(),
+        )
+        self._msg_sender_task = asyncio.ensure_future(
+            self._msg_sender.send_msgs(),
+        )
         return self
 
-    def __exit__(self, *exc):
-        self.stop()
+    async def __aexit__(self, *exc):
+        self.stopped.set()
+        if self._msg_receiver_task:
+            self._msg_receiver_task.cancel()
+        if self._msg_sender_task:
+            self._msg_sender_task.cancel()
+        self.close()
         logger.debug('Stopped peer {} ...'.format(self))
 
     def __repr__(self):
@@ -186,58 +459,299 @@ class Peer(object):
 
 class MessageDecoder:
     """Handles the incoming binary data from a peer and buffers and decodes.
+
+    Received bytes are written directly into a growable receive buffer.
+    The header of each message is parsed once, and the message is only
+    deserialized after its full payload has been buffered, so partial
+    messages are never copied or re-parsed.
     """
 
-    def __init__(self):
-        self.recv_data_buffer = BytesIO()
+    def __init__(self, read_len=SOCKET_READ_LEN):
+        self.read_len = read_len
+        self._buffer = bytearray(read_len)
+        self._start = 0
+        self._end = 0
+        self._next_msg_len = None
+        self.last_msg_len = 0
+
+    @property
+    def buffered_len(self):
+        return self._end - self._start
+
+    def get_read_buffer(self):
+        """Get a writable view of the free space at the end of the buffer.
+
+        The view must be released before the next call to
+        `process_read_len`.
+        """
+        self._reserve(max(self.read_len, self._missing_len()))
+        return memoryview(self._buffer)[self._end:]
+
+    def process_read_len(self, read_len):
+        """Decode messages after `read_len` bytes were written into the
+        view returned by `get_read_buffer`.
+        """
+        self._end += read_len
+        return self._decode_msgs()
 
     def process_recv_data(self, recv_data):
-        data = self.read_data_buffer() + recv_data
-        try:
-            while data:
-                self.set_data_buffer(data)
-                msg = MsgSerializable.stream_deserialize(self.recv_data_buffer)
-                if msg is None:
-                    raise Exception('Invalid data')
-                else:
-                    yield msg
-                    data = self.read_data_buffer()
-        except SerializationTruncationError:
-            self.set_data_buffer(data)
-
-    def read_data_buffer(self):
-        return self.recv_data_buffer.read()
-
-    def set_data_buffer(self, data):
-        if len(data) > MAX_MESSAGE_LEN:
+        """Decode messages after copying the received bytes into the buffer.
+        """
+        self._reserve(len(recv_data))
+        self._buffer[self._end:self._end + len(recv_data)] = recv_data
+        return self.process_read_len(len(recv_data))
+
+    def _decode_msgs(self):
+        while True:
+            if self._next_msg_len is None:
+                if self.buffered_len < MESSAGE_HEADER_LEN:
+                    break
+                self._next_msg_len = self._read_msg_len()
+            if self.buffered_len < self._next_msg_len:
+                break
+            msg_end = self._start + self._next_msg_len
+            msg = decode_msg(
+                bytes(self._buffer[self._start:msg_end]),
+            )
+            self._start = msg_end
+            self.last_msg_len = self._next_msg_len
+            self._next_msg_len = None
+            if msg is None:
+                raise Exception('Invalid data')
+            yield msg
+        if self._start == self._end:
+            self._start = self._end = 0
+            # Release the memory used by a large message.
+            if len(self._buffer) > self.read_len:
+                del self._buffer[self.read_len:]
+
+    def _read_msg_len(self):
+        payload_len = struct.unpack_from(
+            '<i',
+            self._buffer,
+            self._start + MESSAGE_LENGTH_OFFSET,
+        )[0]
+        if payload_len < 0 or payload_len > MAX_MESSAGE_LEN:
             raise Exception('Message size too large')
-        self.recv_data_buffer = BytesIO(data)
+        return MESSAGE_HEADER_LEN + payload_len
+
+    def _missing_len(self):
+        if self._next_msg_len is None:
+            return 0
+        return self._next_msg_len - self.buffered_len
+
+    def _reserve(self, size):
+        """Make room for at least `size` bytes after the buffered data.
+
+        Only the unconsumed bytes are moved, and only when the free space
+        at the end of the buffer is too small.
+        """
+        if len(self._buffer) - self._end >= size:
+            return
+        buffered_len = self.buffered_len
+        if self._start > 0:
+            self._buffer[:buffered_len] = self._buffer[self._start:self._end]
+            self._start = 0
+            self._end = buffered_len
+        if len(self._buffer) - self._end < size:
+            new_len = max(2 * len(self._buffer), self._end + size)
+            self._buffer.extend(bytes(new_len - len(self._buffer)))
+
+
+class ReceiveQueue:
+    """Queue of received messages, bounded by number of messages and by
+    number of bytes.
+
+    When the queue is full, `put` waits until messages are removed. The
+    receiver stops reading from the socket while it waits, so the sender
+    is slowed down by TCP flow control.
+    """
+
+    def __init__(
+            self,
+            max_len=RECV_QUEUE_MAX_LEN,
+            max_bytes=RECV_QUEUE_MAX_BYTES,
+    ):
+        self.max_len = max_len
+        self.max_bytes = max_bytes
+        self.queue = deque()
+        self.queue_bytes = 0
+        self.num_backpressure = 0
+        self.last_msg_time = None
+        self.changed = asyncio.Condition()
+
+    def __len__(self):
+        return len(self.queue)
+
+    def is_full(self):
+        # A message larger than max_bytes is still accepted into an empty
+        # queue.
+        return len(self.queue) >= self.max_len or (
+            self.queue and self.queue_bytes >= self.max_bytes
+        )
+
+    def set_msg_received(self):
+        """Record the time of a received message, including the messages
+        that are not queued."""
+        self.last_msg_time = time.time()
+
+    async def put(self, msg, msg_len):
+        async with self.changed:
+            if self.is_full():
+                self.num_backpressure += 1
+                await self.changed.wait_for(lambda: not self.is_full())
+            self.queue.append((msg, msg_len))
+            self.queue_bytes += msg_len
+            self.changed.notify_all()
+
+    async def get(self):
+        async with self.changed:
+            await self.changed.wait_for(lambda: self.queue)
+            msg, msg_len = self.queue.popleft()
+            self.queue_bytes -= msg_len
+            self.changed.notify_all()
+            return msg
 
 
 class MessageReceiver:
     """Reads bytes from the socket and puts messages in the receive queue.
+
+    Pong messages are passed to the pong callback as soon as they are
+    decoded, instead of being queued, so that the ping round trip does
+    not include the time spent waiting behind the queued messages.
     """
 
-    def __init__(self, socket, queue, stopped_event):
+    def __init__(
+            self,
+            socket,
+            queue,
+            stopped_event,
+            read_len=SOCKET_READ_LEN,
+            pong_callback=None,
+    ):
         self.socket = socket
         self.queue = queue
         self.stopped_event = stopped_event
-        self.decoder = MessageDecoder()
+        self.pong_callback = pong_callback
+        self.decoder = MessageDecoder(read_len)
 
-    def _recv_msgs(self):
+    async def _recv_msgs(self):
+        loop = asyncio.get_event_loop()
         while True:
-            recv_data = self.socket.recv(SOCKET_READ_LEN)
-            if not recv_data:
+            with self.decoder.get_read_buffer() as read_buffer:
+                read_len = await loop.sock_recv_into(self.socket, read_buffer)
+            if not read_len:
                 raise Exception('Peer disconnected')
 
-            for msg in self.decoder.process_recv_data(recv_data):
-                self.queue.put(msg)
+            for msg in self.decoder.process_read_len(read_len):
+                self.queue.set_msg_received()
+                if msg.command == b'pong' and self.pong_callback:
+                    self.pong_callback(msg.nonce)
+                    continue
+                await self.queue.put(msg, self.decoder.last_msg_len)
                 if self.stopped_event.is_set():
                     return
 
-    def recv_msgs(self):
+    async def recv_msgs(self):
         try:
-            self._recv_msgs()
+            await self._recv_msgs()
+        except asyncio.CancelledError:
+            raise
         except Exception:
             logger.info('Failed to receive msg from {}'.format(self))
             self.stopped_event.set()
+
+
+class MessageSender:
+    """Writes the messages in the send queue to the socket.
+
+    A single writer drains the queue, and small queued messages are
+    coalesced into one write. The error callback is called with the reason
+    when the queue grows past its limits, a write does not complete before
+    the send timeout, or the socket fails.
+    """
+
+    def __init__(
+            self,
+            socket,
+            error_callback,
+            max_queue_len=SEND_QUEUE_MAX_LEN,
+            max_queue_bytes=SEND_QUEUE_MAX_BYTES,
+            send_timeout=SEND_TIMEOUT,
+            coalesce_len=SEND_COALESCE_LEN,
+    ):
+        self.socket = socket
+        self.error_callback = error_callback
+        self.max_queue_len = max_queue_len
+        self.max_queue_bytes = max_queue_bytes
+        self.send_timeout = send_timeout
+        self.coalesce_len = coalesce_len
+        self.queue = deque()
+        self.queue_bytes = 0
+        self.queue_ready = asyncio.Event()
+        self.failed = False
+
+    def enqueue(self, data):
+        if self.failed:
+            return
+        if len(self.queue) >= self.max_queue_len:
+            self._on_error(
+                'Send queue length exceeded {} messages'.format(
+                    self.max_queue_len,
+                ))
+            return
+        if self.queue_bytes + len(data) > self.max_queue_bytes:
+            self._on_error(
+                'Send queue size exceeded {} bytes'.format(
+                    self.max_queue_bytes,
+                ))
+            return
+        self.queue.append(data)
+        self.queue_bytes += len(data)
+        self.queue_ready.set()
+
+    def _on_error(self, reason):
+        logger.info('{} for {}'.format(reason, self.socket))
+        self.failed = True
+        self.error_callback(reason)
+
+    def _pop_data(self):
+        batch = []
+        batch_len = 0
+        while self.queue:
+            data_len = len(self.queue[0])
+            if batch and batch_len + data_len > self.coalesce_len:
+                break
+            batch.append(self.queue.popleft())
+            batch_len += data_len
+        self.queue_bytes -= batch_len
+        if not self.queue:
+            self.queue_ready.clear()
+        if len(batch) == 1:
+            return batch[0]
+        return b''.join(batch)
+
+    async def _send_msgs(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            await self.queue_ready.wait()
+            data = self._pop_data()
+            try:
+                await asyncio.wait_for(
+                    loop.sock_sendall(self.socket, data),
+                    self.send_timeout,
+                )
+            except asyncio.TimeoutError:
+                self._on_error(
+                    'Send did not complete in {} seconds'.format(
+                        self.send_timeout,
+                    ))
+                return
+
+    async def send_msgs(self):
+        try:
+            await self._send_msgs()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self._on_error('Failed to send msg')
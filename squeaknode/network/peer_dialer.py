@@ -0,0 +1,160 @@
+import asyncio
+import logging
+import random
+import socket
+import time
+from typing import NamedTuple
+
+from squeaknode.network.host_resolver import HostResolveError
+from squeaknode.network.host_resolver import HostResolver
+
+
+MAX_CONCURRENT_DIALS = 8
+CONNECT_TIMEOUT = 10
+DIAL_BACKOFF_BASE_S = 10
+DIAL_BACKOFF_MAX_S = 600
+
+
+logger = logging.getLogger(__name__)
+
+
+class DialStats(NamedTuple):
+    """Represents the statistics of the outbound connection attempts."""
+    num_attempts: int
+    num_successes: int
+    num_failures: int
+    num_timeouts: int
+    num_deduplicated: int
+    num_backoff_skips: int
+    total_connect_time_s: float
+
+
+class _Backoff:
+
+    def __init__(self):
+        self.num_failures = 0
+        self.next_attempt_time = 0.0
+
+
+class PeerDialer:
+    """Makes outbound connections from the peer event loop.
+
+    At most max_concurrent_dials connection attempts run at the same time,
+    and each one is limited by connect_timeout. An address that fails is not
+    dialed again until its backoff expires. The backoff doubles with each
+    consecutive failure, with random jitter, up to backoff_max_s.
+    """
+
+    def __init__(
+            self,
+            connection_manager,
+            max_concurrent_dials=MAX_CONCURRENT_DIALS,
+            connect_timeout=CONNECT_TIMEOUT,
+            backoff_base_s=DIAL_BACKOFF_BASE_S,
+            backoff_max_s=DIAL_BACKOFF_MAX_S,
+            host_resolver=None,
+    ):
+        self.connection_manager = connection_manager
+        self.host_resolver = host_resolver or HostResolver()
+        self.max_concurrent_dials = max_concurrent_dials
+        self.connect_timeout = connect_timeout
+        self.backoff_base_s = backoff_base_s
+        self.backoff_max_s = backoff_max_s
+        self._semaphore = None
+        self._in_flight = set()
+        self._backoffs = {}
+        self._num_attempts = 0
+        self._num_successes = 0
+        self._num_failures = 0
+        self._num_timeouts = 0
+        self._num_deduplicated = 0
+        self._num_backoff_skips = 0
+        self._total_connect_time_s = 0.0
+
+    @property
+    def stats(self) -> DialStats:
+        return DialStats(
+            num_attempts=self._num_attempts,
+            num_successes=self._num_successes,
+            num_failures=self._num_failures,
+            num_timeouts=self._num_timeouts,
+            num_deduplicated=self._num_deduplicated,
+            num_backoff_skips=self._num_backoff_skips,
+            total_connect_time_s=self._total_connect_time_s,
+        )
+
+    def is_in_flight(self, address):
+        return address in self._in_flight
+
+    async def dial(self, host, port, use_reserved_slot=False):
+        """Connect to the given host and port.
+
+        Return the connected socket and its (ip, port) address, with a
+        reserved outbound slot, or None if no connection was made.
+        """
+        address = (host, port)
+        if address in self._in_flight:
+            self._num_deduplicated += 1
+            return None
+        backoff = self._backoffs.get(address)
+        if backoff and time.monotonic() < backoff.next_attempt_time:
+            self._num_backoff_skips += 1
+            return None
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent_dials)
+        self._in_flight.add(address)
+        try:
+            async with self._semaphore:
+                return await self._dial(host, port, use_reserved_slot)
+        finally:
+            self._in_flight.discard(address)
+
+    async def _dial(self, host, port, use_reserved_slot):
+        loop = asyncio.get_event_loop()
+        address = (host, port)
+        self._num_attempts += 1
+        start_time = time.perf_counter()
+        try:
+            ip = await self.host_resolver.resolve(host)
+        except HostResolveError:
+            self._record_failure(address)
+            return None
+        ip_address = (ip, port)
+        if self.connection_manager.has_connection(ip_address):
+            return None
+        if not self.connection_manager.reserve_outbound_slot(
+                use_reserved_slot):
+            logger.info(
+                'Not connecting to {}, no outbound slot.'.format(ip_address))
+            return None
+        peer_socket = socket.socket()
+        peer_socket.setblocking(False)
+        try:
+            await asyncio.wait_for(
+                loop.sock_connect(peer_socket, ip_address),
+                self.connect_timeout,
+            )
+        except Exception as e:
+            if isinstance(e, asyncio.TimeoutError):
+                self._num_timeouts += 1
+            logger.info('Failed to make connection to {}: {!r}'.format(
+                ip_address, e))
+            peer_socket.close()
+            self.connection_manager.release_slot(outgoing=True)
+            self._record_failure(address)
+            return None
+        self._num_successes += 1
+        self._total_connect_time_s += time.perf_counter() - start_time
+        self._backoffs.pop(address, None)
+        return peer_socket, ip_address
+
+    def _record_failure(self, address):
+        self._num_failures += 1
+        backoff = self._backoffs.setdefault(address, _Backoff())
+        backoff.num_failures += 1
+        delay = min(
+            self.backoff_base_s * 2 ** (backoff.num_failures - 1),
+            self.backoff_max_s,
+        )
+        delay = random.uniform(delay / 2, delay)
+        backoff.next_attempt_time = time.monotonic() + delay
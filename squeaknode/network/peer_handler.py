@@ -1,9 +1,13 @@
 import logging
+from concurrent.futures import ThreadPoolExecutor
 
 from squeaknode.network.connection import Connection
 from squeaknode.network.connection_manager import ConnectionManager
+from squeaknode.network.download_scheduler import DownloadScheduler
+from squeaknode.network.message_stats import MessageStats
 from squeaknode.network.peer import Peer
 from squeaknode.node.squeak_controller import SqueakController
+from squeaknode.node.squeak_ingestion import SqueakIngestion
 
 
 logger = logging.getLogger(__name__)
@@ -17,27 +21,79 @@ class PeerHandler():
             self,
             squeak_controller: SqueakController,
             connection_manager: ConnectionManager,
+            message_stats: MessageStats,
+            download_scheduler: DownloadScheduler,
+            squeak_ingestion: SqueakIngestion,
+            max_handler_workers: int,
+            socket_read_len: int,
+            max_send_queue_len: int,
+            max_send_queue_bytes: int,
+            send_timeout_s: float,
+            max_recv_queue_len: int,
+            max_recv_queue_bytes: int,
+            handshake_timeout_s: float,
     ):
         super().__init__()
         self.squeak_controller = squeak_controller
         self.connection_manager = connection_manager
-
-    def start(self, peer_socket, address, outgoing):
+        self.message_stats = message_stats
+        self.download_scheduler = download_scheduler
+        self.squeak_ingestion = squeak_ingestion
+        self.socket_read_len = socket_read_len
+        self.max_send_queue_len = max_send_queue_len
+        self.max_send_queue_bytes = max_send_queue_bytes
+        self.send_timeout_s = send_timeout_s
+        self.max_recv_queue_len = max_recv_queue_len
+        self.max_recv_queue_bytes = max_recv_queue_bytes
+        self.handshake_timeout_s = handshake_timeout_s
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_handler_workers,
+            thread_name_prefix='peer-handler',
+        )
+
+    async def start(self, peer_socket, address, outgoing, dial_address=None):
         """Handles all sending and receiving of messages for the given peer.
 
-        This method blocks until the peer connection has stopped.
+        This coroutine completes when the peer connection has stopped.
         """
         logger.debug(
             'Setting up controller for peer address {} ...'.format(address))
         logger.info(
             'Setting up controller for peer address {} ...'.format(address))
-        with Peer(peer_socket, address, outgoing) as p:
-            with Connection(p, self.squeak_controller, self.connection_manager).open_connection() as c:
-                # p.stopped.wait()
-                c.handle_messages()
+        async with Peer(
+            peer_socket,
+            address,
+            outgoing,
+            self.socket_read_len,
+            self.max_send_queue_len,
+            self.max_send_queue_bytes,
+            self.send_timeout_s,
+            self.connection_manager.disconnect_peer,
+            self.max_recv_queue_len,
+            self.max_recv_queue_bytes,
+            dial_address,
+        ) as p:
+            await p.run_until_stopped(self._handle_connection(p))
         logger.debug('Stopped controller for peer address {}.'.format(address))
         logger.info('Stopped controller for peer address {}.'.format(address))
 
+    async def _handle_connection(self, peer):
+        connection = Connection(
+            peer,
+            self.squeak_controller,
+            self.connection_manager,
+            self.executor,
+            self.message_stats,
+            self.download_scheduler,
+            self.squeak_ingestion,
+            self.handshake_timeout_s,
+        )
+        async with connection.open_connection() as c:
+            await c.handle_messages()
+
+    def stop(self):
+        self.executor.shutdown(wait=False)
+
 
 # class PeerListener(PeerMessageHandler):
 #     """Handles receiving messages from a peer.
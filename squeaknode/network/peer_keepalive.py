@@ -0,0 +1,79 @@
+import asyncio
+import logging
+import time
+
+from squeak.messages import msg_ping
+
+from squeaknode.core.util import generate_ping_nonce
+from squeaknode.network.peer import LAST_MESSAGE_TIMEOUT
+from squeaknode.network.peer import PING_INTERVAL
+from squeaknode.network.peer import PING_TIMEOUT
+
+
+KEEPALIVE_TICK_S = 1
+LAST_MESSAGE_TIMEOUT_REASON = 'No message received'
+PING_TIMEOUT_REASON = 'Ping timeout'
+
+
+logger = logging.getLogger(__name__)
+
+
+class PeerKeepalive:
+    """Pings all connected peers from a single task on the peer event
+    loop, and disconnects the peers that stopped responding.
+    """
+
+    def __init__(
+            self,
+            connection_manager,
+            ping_interval=PING_INTERVAL,
+            ping_timeout=PING_TIMEOUT,
+            last_message_timeout=LAST_MESSAGE_TIMEOUT,
+            tick_s=KEEPALIVE_TICK_S,
+    ):
+        self.connection_manager = connection_manager
+        self.ping_interval = ping_interval
+        self.ping_timeout = ping_timeout
+        self.last_message_timeout = last_message_timeout
+        self.tick_s = tick_s
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.tick_s)
+            try:
+                self.check_peers()
+            except Exception:
+                logger.exception('Failed to check peers.')
+
+    def check_peers(self, now=None):
+        now = now or time.time()
+        for peer in self.connection_manager.peers:
+            if peer.stop_reason is not None:
+                continue
+            if not peer.is_handshake_complete:
+                continue
+            self.check_peer(peer, now)
+
+    def check_peer(self, peer, now):
+        last_msg_time = peer.last_msg_revc_time or peer.connect_time
+        if now - last_msg_time > self.last_message_timeout:
+            self.connection_manager.disconnect_peer(
+                peer, LAST_MESSAGE_TIMEOUT_REASON)
+        elif peer.is_ping_pending:
+            # The pong cannot be read while the receive queue is full.
+            if peer.is_recv_queue_full:
+                return
+            if now - peer.last_sent_ping_time > self.ping_timeout:
+                self.connection_manager.disconnect_peer(
+                    peer, PING_TIMEOUT_REASON)
+        else:
+            last_ping_time = peer.last_sent_ping_time or peer.connect_time
+            if now - last_ping_time >= self.ping_interval:
+                self.send_ping(peer, now)
+
+    def send_ping(self, peer, now):
+        nonce = generate_ping_nonce()
+        ping = msg_ping()
+        ping.nonce = nonce
+        peer.set_last_sent_ping(nonce, now)
+        peer.send_msg(ping)
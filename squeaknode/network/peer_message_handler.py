@@ -1,4 +1,5 @@
 import logging
+import time
 
 from squeak.messages import msg_addr
 from squeak.messages import msg_getdata
@@ -15,8 +16,16 @@ from squeak.net import CSqueakLocator
 from squeaknode.core.offer import Offer
 from squeaknode.core.util import generate_ping_nonce
 from squeaknode.core.util import get_hash
+from squeaknode.network.download_scheduler import DownloadScheduler
+from squeaknode.network.message_stats import MessageStats
 from squeaknode.network.peer import Peer
 from squeaknode.node.squeak_controller import SqueakController
+from squeaknode.node.squeak_ingestion import SqueakIngestion
+
+
+GETDATA_BATCH_SIZE = 100
+# Each inv is 36 bytes, so an inv message stays well under MAX_MESSAGE_LEN.
+MAX_INV_LEN = 10000
 
 
 logger = logging.getLogger(__name__)
@@ -30,9 +39,28 @@ class PeerMessageHandler:
             self,
             peer: Peer,
             squeak_controller: SqueakController,
+            message_stats: MessageStats,
+            download_scheduler: DownloadScheduler,
+            squeak_ingestion: SqueakIngestion,
     ):
         self.peer = peer
         self.squeak_controller = squeak_controller
+        self.message_stats = message_stats
+        self.download_scheduler = download_scheduler
+        self.squeak_ingestion = squeak_ingestion
+        self.handlers = {
+            b'ping': self.handle_ping,
+            b'addr': self.handle_addr,
+            b'getaddr': self.handle_getaddr,
+            b'inv': self.handle_inv,
+            b'getsqueaks': self.handle_getsqueaks,
+            b'squeak': self.handle_squeak,
+            b'getdata': self.handle_getdata,
+            b'notfound': self.handle_notfound,
+            b'offer': self.handle_offer,
+            b'sharesqueaks': self.handle_sharesqueaks,
+            b'reconcile': self.handle_reconcile,
+        }
 
     def initiate_ping(self):
         """Send a ping message and expect a pong response."""
@@ -42,54 +70,23 @@ class PeerMessageHandler:
         self.peer.send_msg(ping)
         self.peer.set_last_sent_ping(nonce)
 
-    def handle_msgs(self):
-        """Handles messages from the peer if there are any available.
-
-        This method blocks when the peer has not sent any messages.
-        """
-        logger.info('Started handling connected messages...')
-        while True:
-            msg = self.peer.recv_msg()
-            self.handle_peer_message(msg)
-
     def handle_peer_message(self, msg):
         """Handle messages from a peer with completed handshake."""
-
-        # # Only allow version and verack messages before handshake is complete.
-        # if not self.peer.is_handshake_complete and msg.command not in [
-        #         b'version',
-        #         b'verack',
-        # ]:
-        #     raise Exception(
-        #         'Received non-handshake message from un-handshaked peer.')
-
-        # if msg.command == b'version':
-        #     self.handle_version(msg)
-        # if msg.command == b'verack':
-        #     self.handle_verack(msg)
-
-        if msg.command == b'ping':
-            self.handle_ping(msg)
-        if msg.command == b'pong':
-            self.handle_pong(msg)
-        if msg.command == b'addr':
-            self.handle_addr(msg)
-        if msg.command == b'getaddr':
-            self.handle_getaddr(msg)
-        if msg.command == b'inv':
-            self.handle_inv(msg)
-        if msg.command == b'getsqueaks':
-            self.handle_getsqueaks(msg)
-        if msg.command == b'squeak':
-            self.handle_squeak(msg)
-        if msg.command == b'getdata':
-            self.handle_getdata(msg)
-        if msg.command == b'notfound':
-            self.handle_notfound(msg)
-        if msg.command == b'offer':
-            self.handle_offer(msg)
-        if msg.command == b'sharesqueaks':
-            self.handle_sharesqueaks(msg)
+        handler = self.handlers.get(msg.command)
+        if handler is None:
+            return
+        start_time = time.perf_counter()
+        error = True
+        try:
+            handler(msg)
+            error = False
+        finally:
+            self.message_stats.record(
+                self.peer.address,
+                msg.command,
+                time.perf_counter() - start_time,
+                error,
+            )
 
     def handle_ping(self, msg):
         nonce = msg.nonce
@@ -98,9 +95,6 @@ class PeerMessageHandler:
         self.peer.set_last_recv_ping()
         self.peer.send_msg(pong)
 
-    def handle_pong(self, msg):
-        self.peer.set_pong_response(msg.nonce)
-
     def handle_addr(self, msg):
         for addr in msg.addrs:
             self.peer_server.connect_address((addr.ip, addr.port))
@@ -113,23 +107,45 @@ class PeerMessageHandler:
         self.peer.send_msg(addr_msg)
 
     def handle_inv(self, msg):
+        self.peer.set_sync_response()
+        sync_update = self.peer.pop_sync_update()
+        if sync_update is not None:
+            self.squeak_controller.save_peer_sync_update(sync_update)
         invs = msg.inv
         unknown_invs = self.squeak_controller.filter_known_invs(invs)
-        getdata_msg = msg_getdata(inv=unknown_invs)
+        # Squeaks that are already requested from another peer are only
+        # requested from this peer if that request fails.
+        squeak_hashes = self.download_scheduler.add_announcement(
+            self.peer,
+            [inv.hash for inv in unknown_invs if inv.type == 1],
+        )
+        invs = [
+            CInv(type=1, hash=squeak_hash) for squeak_hash in squeak_hashes
+        ] + [inv for inv in unknown_invs if inv.type == 2]
+        if not invs:
+            return
+        getdata_msg = msg_getdata(inv=invs)
         self.peer.send_msg(getdata_msg)
 
     def handle_getdata(self, msg):
         invs = msg.inv
         not_found = []
-        for inv in invs:
-            if inv.type == 1:
-                squeak = self.squeak_controller.get_squeak(inv.hash)
-                if squeak is None:
+        squeak_invs = [inv for inv in invs if inv.type == 1]
+        # Send the squeaks of each batch before loading the next one, so
+        # the writes to the socket overlap with the queries.
+        for i in range(0, len(squeak_invs), GETDATA_BATCH_SIZE):
+            batch = squeak_invs[i:i + GETDATA_BATCH_SIZE]
+            squeak_bytes = self.squeak_controller.get_squeak_bytes(
+                [inv.hash for inv in batch],
+                clear_decryption_key=True,
+            )
+            for inv in batch:
+                data = squeak_bytes.get(inv.hash)
+                if data is None:
                     not_found.append(inv)
                 else:
-                    squeak.ClearDecryptionKey()
-                    squeak_msg = msg_squeak(squeak=squeak)
-                    self.peer.send_msg(squeak_msg)
+                    self.peer.send_msg_payload(msg_squeak.command, data)
+        for inv in invs:
             if inv.type == 2:
                 offer = self.squeak_controller.get_buy_offer(
                     squeak_hash=inv.hash,
@@ -151,25 +167,67 @@ class PeerMessageHandler:
             self.peer.send_msg(notfound_msg)
 
     def handle_notfound(self, msg):
-        pass
+        self.peer.set_sync_response()
+        self.download_scheduler.on_not_found(
+            self.peer,
+            [inv.hash for inv in msg.inv if inv.type == 1],
+        )
 
     def handle_getsqueaks(self, msg):
-        for interest in msg.locator.vInterested:
-            squeak_hashes = self.squeak_controller.lookup_squeaks_for_interest(
-                address=str(interest.address),
-                min_block=interest.nMinBlockHeight,
-                max_block=interest.nMaxBlockHeight,
-            )
+        self.peer.add_remote_interested_addresses(
+            str(interest.address) for interest in msg.locator.vInterested
+        )
+        squeak_hashes = self.squeak_controller.lookup_squeaks_for_interests(
+            msg.locator.vInterested,
+        )
+        self.send_squeak_invs(squeak_hashes)
+
+    def handle_reconcile(self, msg):
+        self.peer.add_remote_interested_addresses(
+            str(interest.address) for interest in msg.locator.vInterested
+        )
+        squeak_hashes = self.squeak_controller.reconcile_squeaks(
+            msg.locator.vInterested,
+            msg.nBucketSize,
+            msg.vDigests,
+        )
+        self.send_squeak_invs(squeak_hashes)
+
+    def send_squeak_invs(self, squeak_hashes):
+        """Send the squeak hashes in inv messages.
+
+        An empty inv is sent if there are no squeak hashes, so that the
+        peer knows that its request was answered.
+        """
+        if not squeak_hashes:
+            self.peer.send_msg(msg_inv(inv=[]))
+        for i in range(0, len(squeak_hashes), MAX_INV_LEN):
             invs = [
                 CInv(type=1, hash=squeak_hash)
-                for squeak_hash in squeak_hashes]
+                for squeak_hash in squeak_hashes[i:i + MAX_INV_LEN]]
             inv_msg = msg_inv(inv=invs)
             self.peer.send_msg(inv_msg)
 
     def handle_squeak(self, msg):
-        squeak = msg.squeak
+        self.peer.set_sync_response()
         # TODO: check if interested before saving.
-        self.squeak_controller.save_squeak(squeak)
+        # The squeak is verified and saved by the ingestion pipeline, so
+        # that the next message can be handled while it is validated.
+        self.squeak_ingestion.submit(
+            msg.squeak_bytes,
+            on_verified=self.on_squeak_verified,
+            on_saved=self.on_squeak_saved,
+        )
+
+    def on_squeak_verified(self, squeak_hash):
+        # The squeak is not announced back to the peer that sent it.
+        self.peer.add_received_squeak(squeak_hash)
+        self.download_scheduler.on_received(self.peer, squeak_hash)
+
+    def on_squeak_saved(self, squeak):
+        # Only called for squeaks that were not already saved, so stored
+        # squeaks sent again by the peer are not counted as useful.
+        self.peer.add_useful_squeak()
         # TODO: If squeak is still locked, send getdata msg to get offer.
         if not squeak.HasDecryptionKey():
             invs = [
@@ -1,13 +1,16 @@
+import asyncio
 import logging
 import socket
 import threading
 
 import squeak.params
 
-
-MIN_PEERS = 5
-MAX_PEERS = 10
-UPDATE_THREAD_SLEEP_TIME = 10
+from squeaknode.core.peer_address import PeerAddress
+from squeaknode.network.download_scheduler import DownloadScheduler
+from squeaknode.network.host_resolver import HostResolveError
+from squeaknode.network.host_resolver import HostResolver
+from squeaknode.network.peer_dialer import PeerDialer
+from squeaknode.network.peer_keepalive import PeerKeepalive
 
 
 logger = logging.getLogger(__name__)
@@ -15,74 +18,163 @@ logger = logging.getLogger(__name__)
 
 class PeerServer(object):
     """Maintains connections to other peers in the network.
+
+    All peer sockets are handled by coroutines on a single event loop,
+    which runs in its own thread.
     """
 
-    def __init__(self, connection_manager, port=None):
+    def __init__(
+            self,
+            connection_manager,
+            port=None,
+            peer_keepalive=None,
+            peer_dialer=None,
+            host_resolver=None,
+            download_scheduler=None,
+    ):
         self.ip = socket.gethostbyname('localhost')
         self.port = port or squeak.params.params.DEFAULT_PORT
         self.connection_manager = connection_manager
+        self.host_resolver = host_resolver or HostResolver()
+        self.peer_keepalive = peer_keepalive or PeerKeepalive(
+            connection_manager)
+        self.peer_dialer = peer_dialer or PeerDialer(
+            connection_manager,
+            host_resolver=self.host_resolver,
+        )
+        self.download_scheduler = download_scheduler or DownloadScheduler()
+        self.loop = asyncio.new_event_loop()
+        self.listen_socket = None
 
     def start(self, peer_handler):
         self.peer_handler = peer_handler
 
-        # Start Listen thread
-        threading.Thread(target=self.accept_connections).start()
+        # Bind the listen socket before returning, so that incoming
+        # connections are not refused while the loop is starting.
+        self.listen_socket = self.make_listen_socket()
+
+        # Start event loop thread
+        threading.Thread(target=self._run_loop).start()
+
+        # Start listening for connections
+        asyncio.run_coroutine_threadsafe(self.accept_connections(), self.loop)
+
+        # Start pinging peers
+        asyncio.run_coroutine_threadsafe(self.peer_keepalive.run(), self.loop)
+
+        # Start retrying timed out squeak downloads
+        asyncio.run_coroutine_threadsafe(
+            self.download_scheduler.run(), self.loop)
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_forever()
+        finally:
+            tasks = asyncio.all_tasks(self.loop)
+            for task in tasks:
+                task.cancel()
+            self.loop.run_until_complete(
+                asyncio.gather(*tasks, return_exceptions=True),
+            )
+            if self.listen_socket:
+                self.listen_socket.close()
+            self.loop.close()
 
     def stop(self):
-        # TODO: stop accepting connections thread.
-        # TODO: stop every peer in connection manager.
-        pass
+        for peer in self.connection_manager.peers:
+            peer.stop()
+        self.loop.call_soon_threadsafe(self.loop.stop)
 
-    def accept_connections(self):
+    def make_listen_socket(self):
         listen_socket = socket.socket()
+        listen_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         listen_socket.bind(('', self.port))
         listen_socket.listen()
+        listen_socket.setblocking(False)
+        return listen_socket
+
+    async def accept_connections(self):
         while True:
-            peer_socket, address = listen_socket.accept()
-            peer_socket.setblocking(True)
+            peer_socket, address = await self.loop.sock_accept(
+                self.listen_socket)
+            if not self.connection_manager.reserve_inbound_slot():
+                logger.info(
+                    'Refused connection from {}, no inbound slot.'.format(
+                        address))
+                peer_socket.close()
+                continue
+            peer_socket.setblocking(False)
             self.handle_connection(peer_socket, address, outgoing=False)
 
-    def make_connection(self, ip, port):
-        address = (ip, port)
-        logger.debug('Making connection to {}'.format(address))
-        logger.info('Making connection to {}'.format(address))
+    async def make_connection(self, host, port, use_reserved_slot=False):
+        logger.debug('Making connection to {}'.format((host, port)))
+        logger.info('Making connection to {}'.format((host, port)))
+        result = await self.peer_dialer.dial(host, port, use_reserved_slot)
+        if result is None:
+            return
+        peer_socket, address = result
+        logger.info('Got socket to {}'.format(address))
+        self.handle_connection(
+            peer_socket,
+            address,
+            outgoing=True,
+            dial_address=PeerAddress(host=host, port=port),
+        )
+
+    def handle_connection(
+            self,
+            peer_socket,
+            address,
+            outgoing,
+            dial_address=None,
+    ):
+        """Start handling a connection, which must already have a slot.
+        """
+        self.loop.create_task(
+            self.run_connection(peer_socket, address, outgoing, dial_address),
+        )
+
+    async def run_connection(self, peer_socket, address, outgoing,
+                             dial_address):
         try:
-            peer_socket = socket.socket()
-            logger.info('Got socket to {}'.format(address))
-            peer_socket.connect(address)
-            peer_socket.setblocking(True)
-            self.handle_connection(peer_socket, address, outgoing=True)
-        except Exception:
-            logger.exception('Failed to make connection to {}'.format(address))
-
-    def handle_connection(self, peer_socket, address, outgoing):
-        threading.Thread(
-            target=self.peer_handler.start,
-            args=(peer_socket, address, outgoing,),
-        ).start()
-
-    def connect_address(self, address):
-        """Connect to new address."""
+            await self.peer_handler.start(
+                peer_socket,
+                address,
+                outgoing,
+                dial_address,
+            )
+        finally:
+            self.connection_manager.release_slot(outgoing)
+
+    def connect_address(self, address, use_reserved_slot=False):
+        """Connect to new address.
+
+        Connections to saved peers can use the reserved outbound slots.
+        """
         logger.debug('Connecting to peer with address {}'.format(address))
         logger.info('Connecting to peer with address {}'.format(address))
         hostname, port = address
-        ip = socket.gethostbyname(hostname)
-        new_address = (ip, port)
-        if self.connection_manager.has_connection(new_address):
-            return
-        logger.info('Connecting to peer with ip address {}'.format(ip))
-        threading.Thread(
-            target=self.make_connection,
-            args=(ip, port),
-        ).start()
+        asyncio.run_coroutine_threadsafe(
+            self.make_connection(hostname, port, use_reserved_slot),
+            self.loop,
+        )
 
     def disconnect_address(self, address):
-        """Connect to new address."""
+        """Disconnect from address."""
         logger.info('Disconnecting peer with address {}'.format(address))
         hostname, port = address
-        ip = socket.gethostbyname(hostname)
-        new_address = (ip, port)
-        peer = self.connection_manager.get_peer(new_address)
+        asyncio.run_coroutine_threadsafe(
+            self.disconnect_host(hostname, port),
+            self.loop,
+        )
+
+    async def disconnect_host(self, host, port):
+        try:
+            ip = await self.host_resolver.resolve(host)
+        except HostResolveError:
+            return
+        peer = self.connection_manager.get_peer((ip, port))
         if peer is None:
             return
         peer.stop()
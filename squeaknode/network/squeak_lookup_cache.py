@@ -0,0 +1,99 @@
+import threading
+import time
+from collections import defaultdict
+from collections import OrderedDict
+from typing import List
+from typing import Optional
+
+from squeaknode.core.squeak_interest import SqueakInterest
+
+
+LOOKUP_CACHE_TTL_S = 10
+LOOKUP_CACHE_MAX_ENTRIES = 10000
+
+
+class SqueakLookupCache:
+    """Caches the squeak hashes that match an interest, so that the same
+    getsqueaks locator sent by many peers only costs one query.
+
+    Entries expire after a short time, and are invalidated when a squeak of
+    their address is inserted, unlocked or deleted.
+    """
+
+    def __init__(
+            self,
+            ttl_s=LOOKUP_CACHE_TTL_S,
+            max_entries=LOOKUP_CACHE_MAX_ENTRIES,
+    ):
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: OrderedDict = OrderedDict()
+        self._interests_by_address = defaultdict(set)
+        self._generation = 0
+        self._num_hits = 0
+        self._num_misses = 0
+
+    @property
+    def generation(self) -> int:
+        """Number of invalidations so far.
+
+        A lookup result is only stored if no invalidation happened since
+        the lookup started.
+        """
+        return self._generation
+
+    @property
+    def num_hits(self) -> int:
+        return self._num_hits
+
+    @property
+    def num_misses(self) -> int:
+        return self._num_misses
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, interest: SqueakInterest) -> Optional[List[bytes]]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(interest)
+            if entry is not None:
+                expire_time, squeak_hashes = entry
+                if expire_time > now:
+                    self._num_hits += 1
+                    return squeak_hashes
+                self._remove(interest)
+            self._num_misses += 1
+            return None
+
+    def put(
+            self,
+            interest: SqueakInterest,
+            squeak_hashes: List[bytes],
+            generation: int,
+    ) -> None:
+        expire_time = time.monotonic() + self.ttl_s
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._remove(interest)
+            self._entries[interest] = (expire_time, squeak_hashes)
+            self._interests_by_address[interest.address].add(interest)
+            while len(self._entries) > self.max_entries:
+                oldest_interest = next(iter(self._entries))
+                self._remove(oldest_interest)
+
+    def invalidate_address(self, address: str) -> None:
+        with self._lock:
+            self._generation += 1
+            for interest in self._interests_by_address.pop(address, ()):
+                del self._entries[interest]
+
+    def _remove(self, interest):
+        if self._entries.pop(interest, None) is None:
+            return
+        interests = self._interests_by_address[interest.address]
+        interests.discard(interest)
+        if not interests:
+            del self._interests_by_address[interest.address]
@@ -0,0 +1,82 @@
+import logging
+
+from squeak.messages import msg_inv
+from squeak.net import CInv
+
+from squeaknode.core.util import get_hash
+from squeaknode.network.peer_message_handler import MAX_INV_LEN
+
+
+RELAY_BATCH_DELAY_S = 0.3
+
+
+logger = logging.getLogger(__name__)
+
+
+class SqueakRelay:
+    """Announces newly saved squeaks to the connected peers that are
+    interested in their authors, except to the peers that sent them.
+
+    New squeaks are collected for batch_delay_s, and then each peer gets one
+    inv message with the squeaks it is interested in. The batches are sent
+    from the peer event loop.
+    """
+
+    def __init__(
+            self,
+            connection_manager,
+            loop,
+            batch_delay_s=RELAY_BATCH_DELAY_S,
+    ):
+        self.connection_manager = connection_manager
+        self.loop = loop
+        self.batch_delay_s = batch_delay_s
+        self._pending = {}
+        self._flush_handle = None
+        self._num_relayed_invs = 0
+
+    @property
+    def num_relayed_invs(self):
+        return self._num_relayed_invs
+
+    def add_squeak(self, squeak):
+        """Queue a newly saved squeak to be announced.
+
+        This method is safe to call from any thread.
+        """
+        if not squeak.HasDecryptionKey():
+            return
+        squeak_hash = get_hash(squeak)
+        address = str(squeak.GetAddress())
+        self.loop.call_soon_threadsafe(self._add, squeak_hash, address)
+
+    def _add(self, squeak_hash, address):
+        self._pending[squeak_hash] = address
+        if self._flush_handle is None:
+            self._flush_handle = self.loop.call_later(
+                self.batch_delay_s,
+                self.flush,
+            )
+
+    def flush(self):
+        self._flush_handle = None
+        pending = self._pending
+        self._pending = {}
+        if not pending:
+            return
+        for peer in self.connection_manager.peers:
+            if not peer.is_handshake_complete:
+                continue
+            squeak_hashes = [
+                squeak_hash
+                for squeak_hash, address in pending.items()
+                if peer.is_remote_interested(address)
+                and not peer.has_received_squeak(squeak_hash)
+            ]
+            for i in range(0, len(squeak_hashes), MAX_INV_LEN):
+                invs = [
+                    CInv(type=1, hash=squeak_hash)
+                    for squeak_hash in squeak_hashes[i:i + MAX_INV_LEN]
+                ]
+                peer.send_msg(msg_inv(inv=invs))
+                self._num_relayed_invs += len(invs)
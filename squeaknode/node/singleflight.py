@@ -0,0 +1,61 @@
+import threading
+from typing import Callable
+from typing import Dict
+from typing import Hashable
+
+
+class _Call:
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class Singleflight:
+    """Runs a function only once at a time for each key.
+
+    While a call for a key is running, other calls with the same key wait
+    for it, and get the same result, or raise the same exception, instead
+    of running the function again. A call that starts after the running
+    one is done runs the function again.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._num_shared = 0
+
+    def do(self, key: Hashable, fn: Callable):
+        with self._lock:
+            call = self._calls.get(key, _Call())
+            is_leader = key not in self._calls
+            if is_leader:
+                self._calls[key] = call
+            else:
+                self._num_shared += 1
+        if not is_leader:
+            call.done.wait()
+        else:
+            try:
+                call.result = fn()
+            except Exception as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    @property
+    def num_in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+    @property
+    def num_shared(self) -> int:
+        """Number of calls that got the result of another call."""
+        with self._lock:
+            return self._num_shared
@@ -1,7 +1,10 @@
 import logging
 import threading
+from typing import Callable
+from typing import Dict
 from typing import List
 from typing import Optional
+from typing import Tuple
 
 import sqlalchemy
 from squeak.core import CheckSqueak
@@ -11,7 +14,6 @@ from squeak.core.signing import CSqueakAddress
 from squeak.messages import msg_getdata
 from squeak.messages import msg_getsqueaks
 from squeak.messages import msg_sharesqueaks
-from squeak.messages import MsgSerializable
 from squeak.net import CInterested
 from squeak.net import CInv
 from squeak.net import CSqueakLocator
@@ -19,20 +21,43 @@ from squeak.net import CSqueakLocator
 from squeaknode.core.block_range import BlockRange
 from squeaknode.core.offer import Offer
 from squeaknode.core.peer_address import PeerAddress
+from squeaknode.core.peer_sync_state import PeerSyncState
+from squeaknode.core.peer_sync_state import PeerSyncUpdate
 from squeaknode.core.received_offer import ReceivedOffer
 from squeaknode.core.received_offer_with_peer import ReceivedOfferWithPeer
 from squeaknode.core.received_payment_summary import ReceivedPaymentSummary
 from squeaknode.core.sent_offer import SentOffer
 from squeaknode.core.sent_payment_summary import SentPaymentSummary
 from squeaknode.core.sent_payment_with_peer import SentPaymentWithPeer
+from squeaknode.core.squeak_digest import count_buckets
+from squeaknode.core.squeak_digest import EMPTY_SQUEAK_DIGEST
+from squeaknode.core.squeak_digest import get_bucket
+from squeaknode.core.squeak_digest import get_squeak_digest
+from squeaknode.core.squeak_digest import split_interest
+from squeaknode.core.squeak_digest import SqueakDigest
+from squeaknode.core.squeak_entry import SqueakEntry
 from squeaknode.core.squeak_entry_with_profile import SqueakEntryWithProfile
+from squeaknode.core.squeak_interest import SqueakInterest
 from squeaknode.core.squeak_peer import SqueakPeer
 from squeaknode.core.squeak_profile import SqueakProfile
+from squeaknode.core.util import clear_decryption_key_bytes
 from squeaknode.core.util import get_hash
 from squeaknode.core.util import is_address_valid
 from squeaknode.network.connection_manager import ConnectionManager
+from squeaknode.network.download_scheduler import DownloadStats
+from squeaknode.network.message_stats import CommandStats
+from squeaknode.network.message_stats import MessageStats
+from squeaknode.network.messages import CBucketDigest
+from squeaknode.network.messages import MAX_RECONCILE_BUCKETS
+from squeaknode.network.messages import msg_reconcile
+from squeaknode.network.messages import RECONCILE_BUCKET_SIZE
+from squeaknode.network.peer_dialer import DialStats
 from squeaknode.network.peer_server import PeerServer
+from squeaknode.network.squeak_lookup_cache import SqueakLookupCache
 from squeaknode.node.received_payments_subscription_client import ReceivedPaymentsSubscriptionClient
+from squeaknode.node.singleflight import Singleflight
+from squeaknode.node.squeak_share_tracker import SqueakShareTracker
+from squeaknode.node.sync_planner import SyncPlanner
 
 
 logger = logging.getLogger(__name__)
@@ -48,6 +73,10 @@ class SqueakController:
         payment_processor,
         peer_server: PeerServer,
         connection_manager: ConnectionManager,
+        message_stats: MessageStats,
+        squeak_lookup_cache: SqueakLookupCache,
+        squeak_share_tracker: SqueakShareTracker,
+        sync_planner: SyncPlanner,
         config,
     ):
         self.squeak_db = squeak_db
@@ -56,7 +85,25 @@ class SqueakController:
         self.payment_processor = payment_processor
         self.peer_server = peer_server
         self.connection_manager = connection_manager
+        self.message_stats = message_stats
+        self.squeak_lookup_cache = squeak_lookup_cache
+        self.squeak_share_tracker = squeak_share_tracker
+        self.sync_planner = sync_planner
         self.config = config
+        self.new_squeak_listeners: List[Callable[[CSqueak], None]] = []
+        self.save_squeak_flight = Singleflight()
+
+    def listen_new_squeaks(self, callback):
+        """Call the callback with each squeak that is saved and was not
+        already saved."""
+        self.new_squeak_listeners.append(callback)
+
+    def on_new_squeak(self, squeak: CSqueak):
+        for callback in self.new_squeak_listeners:
+            try:
+                callback(squeak)
+            except Exception:
+                logger.exception("Failed to handle new squeak.")
 
     def save_uploaded_squeak(self, squeak: CSqueak) -> bytes:
         return self.save_squeak(
@@ -81,31 +128,76 @@ class SqueakController:
             squeak: CSqueak,
             require_decryption_key: bool = False,
     ) -> bytes:
-        # Check if squeak is valid.
-        squeak_entry = self.squeak_core.validate_squeak(squeak)
         # Check if squeak has decryption key.
         if require_decryption_key and not squeak.HasDecryptionKey():
             raise Exception(
                 "Squeak must contain decryption key.")
-        # Check if rate limit is violated.
-        if not self.squeak_rate_limiter.should_rate_limit_allow(squeak):
-            raise Exception(
-                "Exceeded allowed number of squeaks per address per block.")
+        # Concurrent saves of the same squeak share one validation and
+        # insert.
+        return self.save_squeak_flight.do(
+            get_hash(squeak),
+            lambda: self._save_squeak(squeak),
+        )
+
+    def _save_squeak(self, squeak: CSqueak) -> bytes:
+        squeak_entry = self.check_squeak(squeak)
+        squeak_hash = get_hash(squeak)
         # Save the squeak.
         logger.info("Saving squeak: {}".format(
-            get_hash(squeak).hex(),
+            squeak_hash.hex(),
         ))
-        inserted_squeak_hash = self.squeak_db.insert_squeak(
-            squeak, squeak_entry.block_header)
-        # Unlock the squeak if decryption key exists.
-        if squeak.HasDecryptionKey():
-            decryption_key = squeak.GetDecryptionKey()
-            self.unlock_squeak(
-                inserted_squeak_hash,
-                decryption_key,
-            )
+        inserted_squeak_hashes = self.save_squeak_entries([squeak_entry])
+        if not inserted_squeak_hashes:
+            if self.squeak_db.get_squeak_entry(squeak_hash) is None:
+                raise Exception(
+                    "Exceeded allowed number of squeaks per address per "
+                    "block.")
+            # Unlock the squeak if it was already saved without its
+            # decryption key.
+            if squeak.HasDecryptionKey():
+                decryption_key = squeak.GetDecryptionKey()
+                self.unlock_squeak(
+                    squeak_hash,
+                    decryption_key,
+                )
         # Return the squeak hash.
-        return inserted_squeak_hash
+        return squeak_hash
+
+    def check_squeak(self, squeak: CSqueak) -> SqueakEntry:
+        """Check the block hash of the squeak, and get its block header.
+
+        The rate limit is checked when the squeak is saved.
+        """
+        return self.squeak_core.validate_squeak(squeak)
+
+    def save_squeak_entries(
+            self,
+            squeak_entries: List[SqueakEntry],
+    ) -> List[bytes]:
+        """Save squeaks that were already checked with check_squeak, in a
+        single transaction.
+
+        Squeaks that exceed the rate limit of their address and block are
+        not saved. Return the hashes of the squeaks that were not already
+        saved.
+        """
+        inserted_squeak_hashes = self.squeak_db.insert_squeaks(
+            squeak_entries,
+            self.squeak_rate_limiter.max_squeaks_per_address_per_block,
+        )
+        inserted = set(inserted_squeak_hashes)
+        for squeak_entry in squeak_entries:
+            squeak = squeak_entry.squeak
+            if get_hash(squeak) in inserted:
+                self.on_squeak_saved(squeak)
+        return inserted_squeak_hashes
+
+    def on_squeak_saved(self, squeak: CSqueak):
+        self.squeak_lookup_cache.invalidate_address(
+            str(squeak.GetAddress()),
+        )
+        self.squeak_share_tracker.add_squeak(squeak)
+        self.on_new_squeak(squeak)
 
     def get_squeak(
             self,
@@ -120,6 +212,19 @@ class SqueakController:
             squeak.ClearDecryptionKey()
         return squeak
 
+    def get_squeak_bytes(
+            self,
+            squeak_hashes: List[bytes],
+            clear_decryption_key: bool = False,
+    ) -> Dict[bytes, bytes]:
+        squeak_bytes = self.squeak_db.get_squeak_bytes(squeak_hashes)
+        if clear_decryption_key:
+            return {
+                squeak_hash: clear_decryption_key_bytes(data)
+                for squeak_hash, data in squeak_bytes.items()
+            }
+        return squeak_bytes
+
     def get_squeak_without_decryption_key(
             self,
             squeak_hash: bytes,
@@ -279,10 +384,15 @@ class SqueakController:
         return self.save_created_squeak(squeak_entry.squeak)
 
     def delete_squeak(self, squeak_hash: bytes) -> None:
+        squeak_entry = self.squeak_db.get_squeak_entry(squeak_hash)
         num_deleted_offers = self.squeak_db.delete_offers_for_squeak(
             squeak_hash)
         logger.info("Deleted number of offers : {}".format(num_deleted_offers))
         self.squeak_db.delete_squeak(squeak_hash)
+        if squeak_entry is not None:
+            self.squeak_lookup_cache.invalidate_address(
+                str(squeak_entry.squeak.GetAddress()),
+            )
 
     def create_peer(self, peer_name: str, host: str, port: int):
         if len(peer_name) == 0:
@@ -395,6 +505,12 @@ class SqueakController:
             squeak_hash,
             secret_key,
         )
+        # The cached lookups of the address still have the squeak locked.
+        squeak_entry = self.squeak_db.get_squeak_entry(squeak_hash)
+        if squeak_entry is not None:
+            self.squeak_lookup_cache.invalidate_address(
+                str(squeak_entry.squeak.GetAddress()),
+            )
 
     def get_sent_payments(self) -> List[SentPaymentWithPeer]:
         return self.squeak_db.get_sent_payments()
@@ -528,6 +644,9 @@ class SqueakController:
             self.squeak_db.delete_squeak(
                 squeak_hash,
             )
+            self.squeak_lookup_cache.invalidate_address(
+                str(squeak.GetAddress()),
+            )
             logger.info("Deleted squeak: {}".format(
                 squeak_hash.hex(),
             ))
@@ -558,7 +677,10 @@ class SqueakController:
         logger.info("Connect to peer: {}".format(
             peer,
         ))
-        self.peer_server.connect_address(peer.address)
+        self.peer_server.connect_address(
+            peer.address,
+            use_reserved_slot=True,
+        )
 
     def connect_peers(self) -> None:
         peers = self.squeak_db.get_peers()
@@ -567,7 +689,10 @@ class SqueakController:
                 peer,
             ))
             try:
-                self.peer_server.connect_address(peer.address)
+                self.peer_server.connect_address(
+                    peer.address,
+                    use_reserved_slot=True,
+                )
             except Exception:
                 logger.exception("Failed to connect to peer {}".format(
                     peer,
@@ -580,33 +705,178 @@ class SqueakController:
     def get_connected_peers(self):
         return self.connection_manager.peers
 
-    def lookup_squeaks_for_interest(
+    def get_disconnect_reasons(self) -> Dict[str, int]:
+        return self.connection_manager.disconnect_reasons
+
+    def get_num_half_open_peers(self) -> int:
+        return self.connection_manager.num_half_open_peers
+
+    def get_num_established_peers(self) -> int:
+        return self.connection_manager.num_established_peers
+
+    def get_dial_stats(self) -> DialStats:
+        return self.peer_server.peer_dialer.stats
+
+    def get_download_stats(self) -> DownloadStats:
+        return self.peer_server.download_scheduler.stats
+
+    def get_message_command_stats(self) -> List[CommandStats]:
+        return self.message_stats.get_command_stats()
+
+    def get_message_peer_command_stats(self) -> List[CommandStats]:
+        return self.message_stats.get_peer_command_stats()
+
+    def lookup_squeaks_for_interests(
             self,
-            address: str,
-            min_block: int,
-            max_block: int,
-    ):
-        return self.squeak_db.lookup_squeaks(
-            [address],
-            min_block,
-            max_block,
+            interests: List[CInterested],
+    ) -> List[bytes]:
+        squeak_interests = [
+            get_squeak_interest(interest) for interest in interests
+        ]
+        looked_up = self.lookup_squeak_interests(squeak_interests)
+        return dedupe_squeak_hashes(
+            looked_up[squeak_interest] for squeak_interest in squeak_interests
+        )
+
+    def lookup_squeak_interests(
+            self,
+            squeak_interests: List[SqueakInterest],
+    ) -> Dict[SqueakInterest, List[bytes]]:
+        """Lookup the unlocked squeaks of each interest, from the lookup
+        cache if possible."""
+        generation = self.squeak_lookup_cache.generation
+        ret = {}
+        missing_interests = []
+        for squeak_interest in squeak_interests:
+            squeak_hashes = self.squeak_lookup_cache.get(squeak_interest)
+            if squeak_hashes is None:
+                missing_interests.append(squeak_interest)
+            else:
+                ret[squeak_interest] = squeak_hashes
+        if missing_interests:
+            looked_up = self.squeak_db.lookup_squeaks_for_interests(
+                missing_interests,
+            )
+            for squeak_interest, squeak_hashes in looked_up.items():
+                self.squeak_lookup_cache.put(
+                    squeak_interest,
+                    squeak_hashes,
+                    generation,
+                )
+                ret[squeak_interest] = squeak_hashes
+        return ret
+
+    def lookup_bucket_squeaks(
+            self,
+            interests: List[CInterested],
+            bucket_size: int,
+    ) -> Dict[Tuple[int, int], List[bytes]]:
+        """Lookup the unlocked squeaks in each bucket of the interests.
+
+        Return a dict keyed by the index of the interest and the bucket.
+        """
+        if bucket_size < 1:
+            raise Exception("Invalid bucket size: {}".format(bucket_size))
+        squeak_interests = [
+            get_squeak_interest(interest) for interest in interests
+        ]
+        num_buckets = sum(
+            count_buckets(squeak_interest, bucket_size)
+            for squeak_interest in squeak_interests
         )
+        if num_buckets > MAX_RECONCILE_BUCKETS:
+            raise Exception("Too many buckets: {}".format(num_buckets))
+        bucket_interests = {}
+        for i, squeak_interest in enumerate(squeak_interests):
+            for bucket_interest in split_interest(squeak_interest, bucket_size):
+                bucket = get_bucket(bucket_interest.min_block, bucket_size)
+                bucket_interests[(i, bucket)] = bucket_interest
+        looked_up = self.lookup_squeak_interests(
+            list(set(bucket_interests.values())),
+        )
+        return {
+            key: looked_up[bucket_interest]
+            for key, bucket_interest in bucket_interests.items()
+        }
+
+    def make_reconcile_msg(
+            self,
+            interests: List[CInterested],
+    ) -> Optional[msg_reconcile]:
+        """Make a reconcile message with the digests of the local squeaks
+        in the interests, or None if the interests have too many buckets.
+        """
+        num_buckets = sum(
+            count_buckets(get_squeak_interest(interest), RECONCILE_BUCKET_SIZE)
+            for interest in interests
+        )
+        if num_buckets > MAX_RECONCILE_BUCKETS:
+            return None
+        bucket_squeaks = self.lookup_bucket_squeaks(
+            interests,
+            RECONCILE_BUCKET_SIZE,
+        )
+        digests = []
+        for (i, bucket), squeak_hashes in bucket_squeaks.items():
+            if not squeak_hashes:
+                continue
+            squeak_digest = get_squeak_digest(squeak_hashes)
+            digests.append(
+                CBucketDigest(
+                    nInterest=i,
+                    nBucket=bucket,
+                    nNumSqueaks=squeak_digest.num_squeaks,
+                    hashDigest=squeak_digest.digest,
+                )
+            )
+        locator = CSqueakLocator(
+            vInterested=interests,
+        )
+        return msg_reconcile(
+            locator=locator,
+            nBucketSize=RECONCILE_BUCKET_SIZE,
+            vDigests=digests,
+        )
+
+    def reconcile_squeaks(
+            self,
+            interests: List[CInterested],
+            bucket_size: int,
+            digests: List[CBucketDigest],
+    ) -> List[bytes]:
+        """Get the unlocked squeaks in the buckets of the interests whose
+        digests differ from the given remote digests."""
+        remote_digests = {
+            (digest.nInterest, digest.nBucket): SqueakDigest(
+                num_squeaks=digest.nNumSqueaks,
+                digest=digest.hashDigest,
+            )
+            for digest in digests
+        }
+        bucket_squeaks = self.lookup_bucket_squeaks(interests, bucket_size)
+        results = []
+        for key, squeak_hashes in bucket_squeaks.items():
+            remote_digest = remote_digests.get(key, EMPTY_SQUEAK_DIGEST)
+            if get_squeak_digest(squeak_hashes) != remote_digest:
+                results.append(squeak_hashes)
+        return dedupe_squeak_hashes(results)
 
     def filter_known_invs(self, invs):
+        squeak_hashes = [inv.hash for inv in invs if inv.type == 1]
+        known_squeak_hashes = self.squeak_db.lookup_squeak_hashes(
+            squeak_hashes,
+        )
         ret = []
-        for inv in invs:
-            if inv.type == 1:
-                squeak_entry = self.squeak_db.get_squeak_entry(
-                    inv.hash,
+        for squeak_hash in squeak_hashes:
+            is_unlocked = known_squeak_hashes.get(squeak_hash)
+            if is_unlocked is None:
+                ret.append(
+                    CInv(type=1, hash=squeak_hash)
+                )
+            elif not is_unlocked:
+                ret.append(
+                    CInv(type=2, hash=squeak_hash)
                 )
-                if squeak_entry is None:
-                    ret.append(
-                        CInv(type=1, hash=inv.hash)
-                    )
-                elif not squeak_entry.squeak.HasDecryptionKey():
-                    ret.append(
-                        CInv(type=2, hash=inv.hash)
-                    )
         return ret
 
     def sync_timeline(self):
@@ -615,23 +885,108 @@ class SqueakController:
         followed_addresses = self.get_followed_addresses()
         logger.info("Syncing timeline with followed addresses: {}".format(
             followed_addresses))
-        interests = [
-            CInterested(
-                address=CSqueakAddress(address),
-                nMinBlockHeight=block_range.min_block,
-                nMaxBlockHeight=block_range.max_block,
-            )
-            for address in followed_addresses
-        ]
-        locator = CSqueakLocator(
-            vInterested=interests,
+        self.squeak_db.delete_old_peer_sync_states(
+            self.config.sync.full_sync_interval_s,
         )
-        getsqueaks_msg = msg_getsqueaks(
-            locator=locator,
+        peers = self.sync_planner.get_download_peers(
+            self.connection_manager.peers,
+            self.squeak_db.get_peers(),
+        )
+        assigned_addresses = self.sync_planner.assign_addresses(
+            peers,
+            followed_addresses,
+        )
+        for peer, addresses in assigned_addresses.items():
+            try:
+                self.sync_peer_timeline(
+                    peer,
+                    block_range,
+                    addresses,
+                )
+            except Exception:
+                logger.exception("Failed to sync timeline with peer: {}".format(
+                    peer,
+                ))
+
+    def sync_peer_timeline(
+            self,
+            peer,
+            block_range: BlockRange,
+            followed_addresses: List[str],
+    ) -> None:
+        """Request the squeaks of the followed addresses from the peer.
+
+        Only the blocks after the last synced block of each address are
+        requested, unless the address had no full sync with the peer within
+        the full sync interval. The tip block is never marked as synced,
+        because new squeaks can still be made on it. The new sync states are
+        saved when the peer answers the request.
+        """
+        peer_address = PeerAddress(
+            host=peer.address[0],
+            port=peer.address[1],
+        )
+        sync_states = {
+            sync_state.address: sync_state
+            for sync_state in self.squeak_db.get_peer_sync_states(
+                peer_address,
+                self.config.sync.full_sync_interval_s,
+            )
+        }
+        last_synced_block = block_range.max_block - 1
+        interests = []
+        full_sync_states = []
+        updated_sync_states = []
+        for address in followed_addresses:
+            new_sync_state = PeerSyncState(
+                peer_address=peer_address,
+                address=address,
+                last_synced_block=last_synced_block,
+            )
+            sync_state = sync_states.get(address)
+            if sync_state is None:
+                min_block = block_range.min_block
+                full_sync_states.append(new_sync_state)
+            else:
+                min_block = max(
+                    block_range.min_block,
+                    sync_state.last_synced_block + 1,
+                )
+                min_block = min(min_block, block_range.max_block)
+                if sync_state != new_sync_state:
+                    updated_sync_states.append(new_sync_state)
+            interests.append(
+                CInterested(
+                    address=CSqueakAddress(address),
+                    nMinBlockHeight=min_block,
+                    nMaxBlockHeight=block_range.max_block,
+                )
+            )
+        if not interests:
+            return
+        sync_msg = None
+        if peer.supports_reconciliation:
+            sync_msg = self.make_reconcile_msg(interests)
+        if sync_msg is None:
+            locator = CSqueakLocator(
+                vInterested=interests,
+            )
+            sync_msg = msg_getsqueaks(
+                locator=locator,
+            )
+        peer.send_msg(sync_msg)
+        peer.set_sync_requested(
+            sync_update=PeerSyncUpdate(
+                full_sync_states=full_sync_states,
+                updated_sync_states=updated_sync_states,
+            ),
         )
-        # for peer in self.connection_manager.peers:
-        #     peer.send_msg(getsqueaks_msg)
-        self.broadcast_msg(getsqueaks_msg)
+
+    def save_peer_sync_update(self, sync_update: PeerSyncUpdate) -> None:
+        """Save the sync states of a sync request answered by the peer."""
+        self.squeak_db.insert_peer_sync_states(sync_update.full_sync_states)
+        self.squeak_db.update_peer_sync_states(
+            sync_update.updated_sync_states)
 
     def download_single_squeak(self, squeak_hash: bytes):
         logger.info("Downloading single squeak: {}".format(
@@ -643,9 +998,18 @@ class SqueakController:
         getdata_msg = msg_getdata(
             inv=invs,
         )
-        # for peer in self.connection_manager.peers:
-        #     peer.send_msg(getdata_msg)
-        self.broadcast_msg(getdata_msg)
+        peers = self.sync_planner.get_download_peers(
+            self.connection_manager.peers,
+            self.squeak_db.get_peers(),
+        )
+        for peer in self.sync_planner.select_peers(peers, squeak_hash):
+            try:
+                peer.send_msg(getdata_msg)
+                peer.set_sync_requested()
+            except Exception:
+                logger.exception("Failed to send msg to peer: {}".format(
+                    peer,
+                ))
 
     def share_squeaks(self):
         block_range = self.get_block_range()
@@ -653,13 +1017,48 @@ class SqueakController:
         sharing_addresses = self.get_sharing_addresses()
         logger.info("Sharing squeaks with sharing addresses: {}".format(
             sharing_addresses))
+        self.squeak_share_tracker.remove_peers_except(
+            self.connection_manager.peers,
+        )
+        peers = self.sync_planner.get_upload_peers(
+            self.connection_manager.peers,
+            self.squeak_db.get_peers(),
+        )
+        for peer in peers:
+            try:
+                self.share_peer_squeaks(
+                    peer,
+                    block_range,
+                    sharing_addresses,
+                )
+            except Exception:
+                logger.exception("Failed to share squeaks with peer: {}".format(
+                    peer,
+                ))
+
+    def share_peer_squeaks(
+            self,
+            peer,
+            block_range: BlockRange,
+            sharing_addresses: List[str],
+    ) -> None:
+        """Offer the peer the squeaks of the sharing addresses that changed
+        since its last share.
+        """
+        squeak_interests, seq = self.squeak_share_tracker.get_share_interests(
+            peer,
+            sharing_addresses,
+            block_range.max_block,
+        )
+        if not squeak_interests:
+            return
         interests = [
             CInterested(
-                address=CSqueakAddress(address),
-                nMinBlockHeight=0,
-                nMaxBlockHeight=block_range.max_block,
+                address=CSqueakAddress(squeak_interest.address),
+                nMinBlockHeight=squeak_interest.min_block,
+                nMaxBlockHeight=squeak_interest.max_block,
             )
-            for address in sharing_addresses
+            for squeak_interest in squeak_interests
         ]
         locator = CSqueakLocator(
             vInterested=interests,
@@ -667,9 +1066,8 @@ class SqueakController:
         sharesqueaks_msg = msg_sharesqueaks(
             locator=locator,
         )
-        # for peer in self.connection_manager.peers:
-        #     peer.send_msg(sharesqueaks_msg)
-        self.broadcast_msg(sharesqueaks_msg)
+        peer.send_msg(sharesqueaks_msg)
+        self.squeak_share_tracker.set_shared(peer, sharing_addresses, seq)
 
     def filter_shared_squeak_locator(self, interests: List[CInterested]):
         ret = []
@@ -691,15 +1089,6 @@ class SqueakController:
                     )
         return ret
 
-    def broadcast_msg(self, msg: MsgSerializable) -> None:
-        for peer in self.connection_manager.peers:
-            try:
-                peer.send_msg(msg)
-            except Exception:
-                logger.exception("Failed to send msg to peer: {}".format(
-                    peer,
-                ))
-
     def disconnect_peer(self, peer_id: int) -> None:
         peer = self.squeak_db.get_peer(peer_id)
         if peer is None:
@@ -711,3 +1100,22 @@ class SqueakController:
             peer,
         ))
         self.peer_server.disconnect_address(peer.address)
+
+
+def get_squeak_interest(interest: CInterested) -> SqueakInterest:
+    return SqueakInterest(
+        address=str(interest.address),
+        min_block=interest.nMinBlockHeight,
+        max_block=interest.nMaxBlockHeight,
+    )
+
+
+def dedupe_squeak_hashes(results) -> List[bytes]:
+    ret = []
+    seen = set()
+    for squeak_hashes in results:
+        for squeak_hash in squeak_hashes:
+            if squeak_hash not in seen:
+                seen.add(squeak_hash)
+                ret.append(squeak_hash)
+    return ret
@@ -0,0 +1,298 @@
+import logging
+import queue
+import threading
+import time
+from typing import Callable
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Set
+
+from squeak.core import CSqueak
+
+from squeaknode.core.squeak_verifier import SqueakVerifier
+from squeaknode.core.util import get_hash
+from squeaknode.node.squeak_controller import SqueakController
+
+
+INGESTION_WORKERS = 4
+INGESTION_QUEUE_LEN = 1000
+INGESTION_BATCH_SIZE = 100
+
+
+logger = logging.getLogger(__name__)
+
+
+class StageStats(NamedTuple):
+    """Represents the statistics of one stage of the ingestion pipeline."""
+    name: str
+    queue_len: int
+    max_queue_len: int
+    num_processed: int
+    num_errors: int
+    processing_time_s: float
+
+    @property
+    def items_per_s(self) -> float:
+        """Number of squeaks processed per second by one worker of the
+        stage, while it is busy."""
+        if self.processing_time_s == 0:
+            return 0.0
+        return self.num_processed / self.processing_time_s
+
+
+class IngestionStats(NamedTuple):
+    """Represents the statistics of the ingestion pipeline."""
+    verification: StageStats
+    validation: StageStats
+    writer: StageStats
+    num_duplicates: int
+
+
+class _Stage:
+
+    def __init__(self, name: str, max_queue_len: int):
+        self.name = name
+        self.max_queue_len = max_queue_len
+        self.queue: queue.Queue = queue.Queue(max_queue_len)
+        self._lock = threading.Lock()
+        self._num_processed = 0
+        self._num_errors = 0
+        self._processing_time_s = 0.0
+
+    def record(self, num_processed: int, num_errors: int, elapsed_s: float):
+        with self._lock:
+            self._num_processed += num_processed
+            self._num_errors += num_errors
+            self._processing_time_s += elapsed_s
+
+    @property
+    def stats(self) -> StageStats:
+        with self._lock:
+            return StageStats(
+                name=self.name,
+                queue_len=self.queue.qsize(),
+                max_queue_len=self.max_queue_len,
+                num_processed=self._num_processed,
+                num_errors=self._num_errors,
+                processing_time_s=self._processing_time_s,
+            )
+
+
+class SqueakIngestion:
+    """Saves the squeaks received from peers in stages.
+
+    Peer threads submit received squeaks, still serialized, to the
+    verification queue. A single verification thread checks the
+    signatures of the squeaks in the queue in batches of up to
+    max_batch_size, with the squeak verifier, and puts the valid ones in
+    the validation queue, deserialized. A pool of validation workers
+    checks each squeak against the block chain, and puts it in the writer
+    queue. A single writer thread saves the squeaks in the writer queue in
+    batches of up to max_batch_size, each in one transaction. The rate
+    limit is checked in that transaction, so that the squeaks in the
+    pipeline cannot pass it together.
+
+    Each queue holds at most max_queue_len squeaks, so submit blocks the
+    peer thread when the pipeline is behind. A squeak that is verified
+    again while it is still in the pipeline is dropped.
+    """
+
+    def __init__(
+            self,
+            squeak_controller: SqueakController,
+            squeak_verifier: SqueakVerifier,
+            num_workers=INGESTION_WORKERS,
+            max_queue_len=INGESTION_QUEUE_LEN,
+            max_batch_size=INGESTION_BATCH_SIZE,
+    ):
+        self.squeak_controller = squeak_controller
+        self.squeak_verifier = squeak_verifier
+        self.num_workers = num_workers
+        self.max_batch_size = max_batch_size
+        self.verification = _Stage('verification', max_queue_len)
+        self.validation = _Stage('validation', max_queue_len)
+        self.writer = _Stage('writer', max_queue_len)
+        self._lock = threading.Lock()
+        self._pending_hashes: Set[bytes] = set()
+        self._num_duplicates = 0
+
+    @property
+    def stats(self) -> IngestionStats:
+        with self._lock:
+            num_duplicates = self._num_duplicates
+        return IngestionStats(
+            verification=self.verification.stats,
+            validation=self.validation.stats,
+            writer=self.writer.stats,
+            num_duplicates=num_duplicates,
+        )
+
+    def start(self):
+        threading.Thread(
+            target=self.run_verification,
+            name='squeak-verification',
+            daemon=True,
+        ).start()
+        for i in range(self.num_workers):
+            threading.Thread(
+                target=self.run_validation,
+                name='squeak-validation-{}'.format(i),
+                daemon=True,
+            ).start()
+        threading.Thread(
+            target=self.run_writer,
+            name='squeak-writer',
+            daemon=True,
+        ).start()
+
+    def stop(self):
+        # Put the poison pills
+        self.verification.queue.put(None)
+        for _ in range(self.num_workers):
+            self.validation.queue.put(None)
+        self.writer.queue.put(None)
+
+    def submit(
+            self,
+            squeak_bytes: bytes,
+            on_verified: Optional[Callable[[bytes], None]] = None,
+            on_saved: Optional[Callable[[CSqueak], None]] = None,
+    ) -> None:
+        """Add a received serialized squeak to the pipeline.
+
+        on_verified is called with the squeak hash from the verification
+        thread if the squeak is valid, even if it is already in the
+        pipeline. on_saved is called from the writer thread after the
+        squeak is saved, only if it was not already saved.
+        """
+        self.verification.queue.put((squeak_bytes, on_verified, on_saved))
+
+    def run_verification(self):
+        while True:
+            items, stopped = get_batch(
+                self.verification.queue,
+                self.max_batch_size,
+            )
+            if items:
+                self.verify(items)
+            if stopped:
+                return
+
+    def verify(self, items: List):
+        start_time = time.perf_counter()
+        try:
+            verified_squeaks = self.squeak_verifier.verify([
+                squeak_bytes for squeak_bytes, _, _ in items
+            ])
+        except Exception:
+            logger.exception("Failed to verify squeaks.")
+            self.verification.record(
+                0, len(items), time.perf_counter() - start_time)
+            return
+        num_invalid = verified_squeaks.count(None)
+        self.verification.record(
+            len(items) - num_invalid,
+            num_invalid,
+            time.perf_counter() - start_time,
+        )
+        if num_invalid:
+            logger.warning("Received {} invalid squeaks.".format(
+                num_invalid,
+            ))
+        for (_, on_verified, on_saved), verified_squeak in zip(
+                items, verified_squeaks):
+            if verified_squeak is None:
+                continue
+            if on_verified is not None:
+                try:
+                    on_verified(verified_squeak.squeak_hash)
+                except Exception:
+                    logger.exception("Failed to handle verified squeak.")
+            if not self._add_pending(verified_squeak.squeak_hash):
+                continue
+            self.validation.queue.put((verified_squeak.get_squeak(), on_saved))
+
+    def run_validation(self):
+        while True:
+            item = self.validation.queue.get()
+            if item is None:
+                return
+            self.validate(*item)
+
+    def validate(self, squeak, callback):
+        start_time = time.perf_counter()
+        try:
+            squeak_entry = self.squeak_controller.check_squeak(squeak)
+        except Exception:
+            logger.exception("Failed to validate squeak.")
+            self.validation.record(0, 1, time.perf_counter() - start_time)
+            self._remove_pending([squeak])
+            return
+        self.validation.record(1, 0, time.perf_counter() - start_time)
+        self.writer.queue.put((squeak_entry, callback))
+
+    def run_writer(self):
+        while True:
+            items, stopped = get_batch(self.writer.queue, self.max_batch_size)
+            if items:
+                self.write(items)
+            if stopped:
+                return
+
+    def write(self, items: List):
+        squeak_entries = [squeak_entry for squeak_entry, _ in items]
+        squeaks = [squeak_entry.squeak for squeak_entry in squeak_entries]
+        start_time = time.perf_counter()
+        try:
+            inserted_squeak_hashes = set(
+                self.squeak_controller.save_squeak_entries(squeak_entries),
+            )
+        except Exception:
+            logger.exception("Failed to save squeaks.")
+            self.writer.record(0, len(items), time.perf_counter() - start_time)
+            self._remove_pending(squeaks)
+            return
+        self.writer.record(len(items), 0, time.perf_counter() - start_time)
+        self._remove_pending(squeaks)
+        for squeak_entry, callback in items:
+            if callback is None:
+                continue
+            if get_hash(squeak_entry.squeak) not in inserted_squeak_hashes:
+                continue
+            try:
+                callback(squeak_entry.squeak)
+            except Exception:
+                logger.exception("Failed to handle saved squeak.")
+
+    def _add_pending(self, squeak_hash: bytes) -> bool:
+        with self._lock:
+            if squeak_hash in self._pending_hashes:
+                self._num_duplicates += 1
+                return False
+            self._pending_hashes.add(squeak_hash)
+            return True
+
+    def _remove_pending(self, squeaks: List[CSqueak]):
+        with self._lock:
+            for squeak in squeaks:
+                self._pending_hashes.discard(get_hash(squeak))
+
+
+def get_batch(q: queue.Queue, max_batch_size: int):
+    """Wait for an item in the queue, and then get the items that are
+    already in the queue, up to max_batch_size.
+
+    Return the items, and whether the poison pill was received.
+    """
+    items: List = []
+    item = q.get()
+    while item is not None:
+        items.append(item)
+        if len(items) >= max_batch_size:
+            return items, False
+        try:
+            item = q.get_nowait()
+        except queue.Empty:
+            return items, False
+    return items, True
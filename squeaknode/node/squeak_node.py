@@ -10,21 +10,32 @@ from squeaknode.admin.webapp.app import SqueakAdminWebServer
 from squeaknode.bitcoin.bitcoin_core_bitcoin_client import BitcoinCoreBitcoinClient
 from squeaknode.config.config import SqueaknodeConfig
 from squeaknode.core.squeak_core import SqueakCore
+from squeaknode.core.squeak_verifier import SqueakVerifier
 from squeaknode.db.db_engine import get_engine
 from squeaknode.db.db_engine import get_sqlite_connection_string
 from squeaknode.db.squeak_db import SqueakDb
 from squeaknode.lightning.lnd_lightning_client import LNDLightningClient
 from squeaknode.network.connection_manager import ConnectionManager
+from squeaknode.network.download_scheduler import DownloadScheduler
+from squeaknode.network.host_resolver import HostResolver
+from squeaknode.network.message_stats import MessageStats
+from squeaknode.network.peer_dialer import PeerDialer
 from squeaknode.network.peer_handler import PeerHandler
+from squeaknode.network.peer_keepalive import PeerKeepalive
 from squeaknode.network.peer_server import PeerServer
+from squeaknode.network.squeak_lookup_cache import SqueakLookupCache
+from squeaknode.network.squeak_relay import SqueakRelay
 from squeaknode.node.payment_processor import PaymentProcessor
 from squeaknode.node.peer_connection_worker import PeerConnectionWorker
 from squeaknode.node.process_received_payments_worker import ProcessReceivedPaymentsWorker
 from squeaknode.node.squeak_controller import SqueakController
 from squeaknode.node.squeak_deletion_worker import SqueakDeletionWorker
+from squeaknode.node.squeak_ingestion import SqueakIngestion
 from squeaknode.node.squeak_offer_expiry_worker import SqueakOfferExpiryWorker
 from squeaknode.node.squeak_peer_sync_worker import SqueakPeerSyncWorker
 from squeaknode.node.squeak_rate_limiter import SqueakRateLimiter
+from squeaknode.node.squeak_share_tracker import SqueakShareTracker
+from squeaknode.node.sync_planner import SyncPlanner
 
 
 logger = logging.getLogger(__name__)
@@ -66,8 +77,49 @@ class SqueakNode:
             self.config.core.subscribe_invoices_retry_s,
         )
 
-        self.connection_manager = ConnectionManager()
-        self.peer_server = PeerServer(self.connection_manager)
+        self.connection_manager = ConnectionManager(
+            self.config.network.max_inbound_peers,
+            self.config.network.max_outbound_peers,
+            self.config.network.reserved_outbound_peers,
+        )
+        self.message_stats = MessageStats()
+        self.squeak_lookup_cache = SqueakLookupCache(
+            self.config.network.lookup_cache_ttl_s,
+        )
+        squeak_share_tracker = SqueakShareTracker()
+        sync_planner = SyncPlanner(
+            self.config.sync.redundancy,
+            self.config.sync.timeout_s,
+        )
+        peer_keepalive = PeerKeepalive(
+            self.connection_manager,
+            self.config.network.ping_interval_s,
+            self.config.network.ping_timeout_s,
+            self.config.network.last_message_timeout_s,
+        )
+        host_resolver = HostResolver(
+            self.config.network.resolve_ttl_s,
+            self.config.network.resolve_negative_ttl_s,
+        )
+        peer_dialer = PeerDialer(
+            self.connection_manager,
+            self.config.network.max_concurrent_dials,
+            self.config.network.connect_timeout_s,
+            self.config.network.dial_backoff_base_s,
+            self.config.network.dial_backoff_max_s,
+            host_resolver,
+        )
+        download_scheduler = DownloadScheduler(
+            self.config.network.download_timeout_s,
+            self.config.network.max_downloads_per_peer,
+        )
+        self.peer_server = PeerServer(
+            self.connection_manager,
+            peer_keepalive=peer_keepalive,
+            peer_dialer=peer_dialer,
+            host_resolver=host_resolver,
+            download_scheduler=download_scheduler,
+        )
 
         squeak_controller = SqueakController(
             squeak_db,
@@ -76,8 +128,30 @@ class SqueakNode:
             payment_processor,
             self.peer_server,
             self.connection_manager,
+            self.message_stats,
+            self.squeak_lookup_cache,
+            squeak_share_tracker,
+            sync_planner,
             self.config,
         )
+        self.squeak_relay = SqueakRelay(
+            self.connection_manager,
+            self.peer_server.loop,
+            self.config.network.relay_batch_delay_s,
+        )
+        squeak_controller.listen_new_squeaks(self.squeak_relay.add_squeak)
+        # Zero verification workers means one for each CPU.
+        self.squeak_verifier = SqueakVerifier(
+            self.config.core.verification_workers or None,
+            self.config.core.verification_process_batch_size,
+        )
+        self.squeak_ingestion = SqueakIngestion(
+            squeak_controller,
+            self.squeak_verifier,
+            self.config.core.ingestion_workers,
+            self.config.core.ingestion_queue_len,
+            self.config.core.ingestion_batch_size,
+        )
 
         admin_handler = load_admin_handler(
             lightning_client, squeak_controller)
@@ -85,6 +159,17 @@ class SqueakNode:
         self.peer_handler = PeerHandler(
             squeak_controller,
             self.connection_manager,
+            self.message_stats,
+            download_scheduler,
+            self.squeak_ingestion,
+            self.config.network.max_handler_workers,
+            self.config.network.socket_read_len,
+            self.config.network.max_send_queue_len,
+            self.config.network.max_send_queue_bytes,
+            self.config.network.send_timeout_s,
+            self.config.network.max_recv_queue_len,
+            self.config.network.max_recv_queue_bytes,
+            self.config.network.handshake_timeout_s,
         )
 
         self.admin_rpc_server = load_admin_rpc_server(
@@ -133,11 +218,18 @@ class SqueakNode:
         self.sent_offers_worker.start_running()
         self.squeak_deletion_worker.start_running()
 
+        # Start saving received squeaks
+        self.squeak_ingestion.start()
+
         # Start peer socket server
         self.peer_server.start(self.peer_handler)
 
     def stop_running(self):
         self.stopped.set()
+        self.peer_server.stop()
+        self.peer_handler.stop()
+        self.squeak_ingestion.stop()
+        self.squeak_verifier.stop()
 
 
 def load_lightning_client(config) -> LNDLightningClient:
@@ -0,0 +1,91 @@
+import threading
+from collections import defaultdict
+from collections import deque
+from typing import Dict
+from typing import List
+from typing import Tuple
+
+from squeak.core import CSqueak
+
+from squeaknode.core.squeak_interest import SqueakInterest
+
+
+MAX_SHARE_CHANGES_PER_ADDRESS = 1000
+
+
+class SqueakShareTracker:
+    """Tracks which squeaks each connected peer has already been offered in
+    a sharesqueaks message.
+
+    Every saved squeak is recorded as a change with an increasing sequence
+    number. A peer is offered the full history of an address the first
+    time, and after that only the block range of the changes since its last
+    share. If more than max_changes_per_address changes were made to an
+    address since then, the full history is offered again.
+    """
+
+    def __init__(
+            self,
+            max_changes_per_address=MAX_SHARE_CHANGES_PER_ADDRESS,
+    ):
+        self.max_changes_per_address = max_changes_per_address
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._changes: Dict[str, deque] = defaultdict(deque)
+        self._dropped_seqs: Dict[str, int] = {}
+        self._shared_seqs: Dict[object, Dict[str, int]] = {}
+
+    def add_squeak(self, squeak: CSqueak) -> None:
+        address = str(squeak.GetAddress())
+        with self._lock:
+            self._seq += 1
+            changes = self._changes[address]
+            changes.append((self._seq, squeak.nBlockHeight))
+            if len(changes) > self.max_changes_per_address:
+                dropped_seq, _ = changes.popleft()
+                self._dropped_seqs[address] = dropped_seq
+
+    def get_share_interests(
+            self,
+            peer,
+            addresses: List[str],
+            max_block: int,
+    ) -> Tuple[List[SqueakInterest], int]:
+        """Get the interests to offer to the peer, and the sequence number
+        to pass to set_shared after they are sent.
+        """
+        interests = []
+        with self._lock:
+            shared_seqs = self._shared_seqs.get(peer, {})
+            for address in addresses:
+                shared_seq = shared_seqs.get(address)
+                if shared_seq is None or \
+                        shared_seq < self._dropped_seqs.get(address, 0):
+                    interests.append(SqueakInterest(address, 0, max_block))
+                    continue
+                block_heights = [
+                    block_height
+                    for seq, block_height in self._changes.get(address, ())
+                    if seq > shared_seq
+                ]
+                if block_heights:
+                    interests.append(SqueakInterest(
+                        address,
+                        min(block_heights),
+                        max(block_heights),
+                    ))
+            return interests, self._seq
+
+    def set_shared(self, peer, addresses: List[str], seq: int) -> None:
+        with self._lock:
+            shared_seqs = self._shared_seqs.setdefault(peer, {})
+            for address in addresses:
+                shared_seqs[address] = seq
+
+    def remove_peers_except(self, peers) -> None:
+        """Forget the share state of peers that are no longer connected."""
+        peers = set(peers)
+        with self._lock:
+            for peer in list(self._shared_seqs):
+                if peer not in peers:
+                    del self._shared_seqs[peer]
@@ -0,0 +1,102 @@
+import hashlib
+import time
+from typing import Dict
+from typing import List
+
+from squeaknode.core.squeak_peer import SqueakPeer
+
+
+SYNC_REDUNDANCY = 2
+SYNC_TIMEOUT_S = 10
+
+
+class SyncPlanner:
+    """Chooses the connected peers to download from and upload to.
+
+    A connected peer that is saved in the database is only used for
+    downloading if its downloading flag is set, and for uploading if its
+    uploading flag is set. Peers that are not saved have no flags, and are
+    used for both. Outgoing peers are matched to the saved peers by the
+    address they were dialed with, and incoming peers are never matched,
+    because their remote port is not the one that was saved.
+
+    Each followed address is synced from `redundancy` of the download
+    peers, chosen by rendezvous hashing, so that adding or removing a peer
+    only moves the addresses assigned to that peer. A peer that has not
+    answered a sync request within timeout_s is skipped, and its addresses
+    fail over to the next peers, until it answers again.
+    """
+
+    def __init__(
+            self,
+            redundancy=SYNC_REDUNDANCY,
+            timeout_s=SYNC_TIMEOUT_S,
+    ):
+        self.redundancy = redundancy
+        self.timeout_s = timeout_s
+
+    def get_download_peers(
+            self,
+            peers,
+            saved_peers: List[SqueakPeer],
+            now=None,
+    ):
+        """Get the peers to sync from, skipping the timed out peers if
+        any other peer can be used."""
+        downloading_peers = [
+            peer for peer, saved_peer in match_saved_peers(peers, saved_peers)
+            if saved_peer is None or saved_peer.downloading
+        ]
+        now = now or time.time()
+        responsive_peers = [
+            peer for peer in downloading_peers
+            if not self.is_timed_out(peer, now)
+        ]
+        return responsive_peers or downloading_peers
+
+    def get_upload_peers(self, peers, saved_peers: List[SqueakPeer]):
+        return [
+            peer for peer, saved_peer in match_saved_peers(peers, saved_peers)
+            if saved_peer is None or saved_peer.uploading
+        ]
+
+    def is_timed_out(self, peer, now) -> bool:
+        sync_request_time = peer.sync_request_time
+        if sync_request_time is None:
+            return False
+        return now - sync_request_time > self.timeout_s
+
+    def assign_addresses(self, peers, addresses: List[str]) -> Dict:
+        """Get the addresses to sync from each of the peers."""
+        ret: Dict = {}
+        for address in addresses:
+            for peer in self.select_peers(peers, address.encode()):
+                ret.setdefault(peer, []).append(address)
+        return ret
+
+    def select_peers(self, peers, key: bytes):
+        """Get the `redundancy` peers with the highest weight for the key."""
+        return sorted(
+            peers,
+            key=lambda peer: get_weight(peer, key),
+            reverse=True,
+        )[:self.redundancy]
+
+
+def match_saved_peers(peers, saved_peers: List[SqueakPeer]):
+    """Get each connected peer with a completed handshake, together with
+    its saved peer, or None if it is not saved."""
+    saved_peers_by_address = {
+        saved_peer.address: saved_peer for saved_peer in saved_peers
+    }
+    return [
+        (peer, saved_peers_by_address.get(peer.dial_address))
+        for peer in peers
+        if peer.is_handshake_complete
+    ]
+
+
+def get_weight(peer, key: bytes) -> bytes:
+    return hashlib.sha256(
+        peer.address_string.encode() + b'/' + key,
+    ).digest()
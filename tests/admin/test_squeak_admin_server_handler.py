@@ -0,0 +1,86 @@
+import mock
+import pytest
+
+from squeaknode.admin.squeak_admin_server_handler import SqueakAdminServerHandler
+from squeaknode.lightning.lnd_lightning_client import LNDLightningClient
+from squeaknode.network.download_scheduler import DownloadStats
+from squeaknode.network.peer_dialer import DialStats
+from squeaknode.node.squeak_controller import SqueakController
+
+
+@pytest.fixture
+def squeak_controller():
+    return mock.Mock(spec=SqueakController)
+
+
+@pytest.fixture
+def handler(squeak_controller):
+    return SqueakAdminServerHandler(
+        mock.Mock(spec=LNDLightningClient),
+        squeak_controller,
+    )
+
+
+def test_get_connected_peers(squeak_controller, handler):
+    squeak_controller.get_connected_peers.return_value = []
+    squeak_controller.get_disconnect_reasons.return_value = {
+        'ping timeout': 1,
+        'handshake timeout': 2,
+    }
+    squeak_controller.get_num_half_open_peers.return_value = 3
+    squeak_controller.get_num_established_peers.return_value = 5
+
+    reply = handler.handle_get_connected_peers(None)
+
+    assert [
+        (reason_count.reason, reason_count.num_peers)
+        for reason_count in reply.disconnect_reasons
+    ] == [
+        ('handshake timeout', 2),
+        ('ping timeout', 1),
+    ]
+    assert reply.num_half_open_peers == 3
+    assert reply.num_established_peers == 5
+
+
+def test_get_download_stats(squeak_controller, handler):
+    squeak_controller.get_download_stats.return_value = DownloadStats(
+        num_requested=10,
+        num_received=6,
+        num_duplicates=2,
+        num_timeouts=1,
+        num_in_flight=3,
+        num_pending=4,
+    )
+
+    reply = handler.handle_get_download_stats(None)
+
+    assert reply.num_requested == 10
+    assert reply.num_received == 6
+    assert reply.num_duplicates == 2
+    assert reply.num_timeouts == 1
+    assert reply.num_in_flight == 3
+    assert reply.num_pending == 4
+    assert reply.duplicate_ratio == 0.25
+
+
+def test_get_dial_stats(squeak_controller, handler):
+    squeak_controller.get_dial_stats.return_value = DialStats(
+        num_attempts=8,
+        num_successes=5,
+        num_failures=2,
+        num_timeouts=1,
+        num_deduplicated=3,
+        num_backoff_skips=4,
+        total_connect_time_s=1.5,
+    )
+
+    reply = handler.handle_get_dial_stats(None)
+
+    assert reply.num_attempts == 8
+    assert reply.num_successes == 5
+    assert reply.num_failures == 2
+    assert reply.num_timeouts == 1
+    assert reply.num_deduplicated == 3
+    assert reply.num_backoff_skips == 4
+    assert reply.total_connect_time_s == 1.5
@@ -0,0 +1,40 @@
+from squeaknode.core.squeak_digest import count_buckets
+from squeaknode.core.squeak_digest import EMPTY_SQUEAK_DIGEST
+from squeaknode.core.squeak_digest import get_squeak_digest
+from squeaknode.core.squeak_digest import split_interest
+from squeaknode.core.squeak_interest import SqueakInterest
+
+
+def test_get_squeak_digest():
+    squeak_hashes = [
+        b'\x01' * 32,
+        b'\x02' * 32,
+        b'\x04' * 32,
+    ]
+
+    squeak_digest = get_squeak_digest(squeak_hashes)
+
+    assert squeak_digest.num_squeaks == 3
+    assert squeak_digest.digest == b'\x07' * 8
+    assert get_squeak_digest(reversed(squeak_hashes)) == squeak_digest
+    assert get_squeak_digest([]) == EMPTY_SQUEAK_DIGEST
+
+
+def test_split_interest():
+    interest = SqueakInterest('address', 130, 300)
+
+    bucket_interests = split_interest(interest, 144)
+
+    assert bucket_interests == [
+        SqueakInterest('address', 130, 143),
+        SqueakInterest('address', 144, 287),
+        SqueakInterest('address', 288, 300),
+    ]
+    assert count_buckets(interest, 144) == 3
+
+
+def test_split_empty_interest():
+    interest = SqueakInterest('address', -1, -1)
+
+    assert split_interest(interest, 144) == []
+    assert count_buckets(interest, 144) == 0
@@ -0,0 +1,104 @@
+import pytest
+from bitcoin.core import CoreMainParams
+from squeak.core import MakeSqueakFromStr
+from squeak.core.signing import CSigningKey
+
+from squeaknode.core.squeak_verifier import SqueakVerifier
+from squeaknode.core.squeak_verifier import verify_squeak_bytes
+from squeaknode.core.util import get_hash
+
+
+@pytest.fixture
+def signing_key():
+    return CSigningKey.generate()
+
+
+def make_squeak(signing_key, content_str):
+    return MakeSqueakFromStr(
+        signing_key,
+        content_str,
+        0,
+        CoreMainParams.GENESIS_BLOCK.GetHash(),
+        1600000000,
+    )
+
+
+@pytest.fixture
+def squeak(signing_key):
+    return make_squeak(signing_key, "hello")
+
+
+@pytest.fixture
+def invalid_squeak_bytes(squeak):
+    # Change the last byte of the signature script.
+    squeak_bytes = squeak.serialize()
+    sig_end = len(squeak_bytes) - len(squeak.GetDecryptionKey()) - 2
+    return squeak_bytes[:sig_end] + \
+        bytes([squeak_bytes[sig_end] ^ 1]) + squeak_bytes[sig_end + 1:]
+
+
+def test_verify_squeak_bytes(squeak):
+    verified_squeak = verify_squeak_bytes(squeak.serialize())
+
+    assert verified_squeak.squeak_hash == get_hash(squeak)
+    assert get_hash(verified_squeak.get_squeak()) == get_hash(squeak)
+
+
+def test_verify_squeak_bytes_without_decryption_key(squeak):
+    squeak.ClearDecryptionKey()
+
+    verified_squeak = verify_squeak_bytes(squeak.serialize())
+
+    assert verified_squeak.squeak_hash == get_hash(squeak)
+
+
+def test_verify_squeak_bytes_invalid(invalid_squeak_bytes):
+    assert verify_squeak_bytes(invalid_squeak_bytes) is None
+    assert verify_squeak_bytes(b'\x00' * 10) is None
+
+
+def test_verify_small_batch(squeak, invalid_squeak_bytes):
+    squeak_verifier = SqueakVerifier(min_batch_size=3)
+
+    verified_squeaks = squeak_verifier.verify([
+        squeak.serialize(),
+        invalid_squeak_bytes,
+    ])
+
+    assert verified_squeaks[0].squeak_hash == get_hash(squeak)
+    assert verified_squeaks[1] is None
+    assert squeak_verifier.executor is None
+
+
+def test_verify_process_batch(signing_key, invalid_squeak_bytes):
+    squeaks = [make_squeak(signing_key, str(i)) for i in range(3)]
+    squeak_verifier = SqueakVerifier(
+        max_workers=2,
+        min_batch_size=2,
+        chunk_size=2,
+    )
+
+    try:
+        verified_squeaks = squeak_verifier.verify(
+            [squeak.serialize() for squeak in squeaks] + [invalid_squeak_bytes]
+        )
+    finally:
+        squeak_verifier.stop()
+
+    assert [
+        verified_squeak and verified_squeak.squeak_hash
+        for verified_squeak in verified_squeaks
+    ] == [get_hash(squeak) for squeak in squeaks] + [None]
+
+
+def test_verify_single_worker(signing_key):
+    squeaks = [make_squeak(signing_key, str(i)) for i in range(3)]
+    squeak_verifier = SqueakVerifier(max_workers=1, min_batch_size=2)
+
+    verified_squeaks = squeak_verifier.verify(
+        [squeak.serialize() for squeak in squeaks])
+
+    assert [
+        verified_squeak.squeak_hash for verified_squeak in verified_squeaks
+    ] == [get_hash(squeak) for squeak in squeaks]
+    assert squeak_verifier.executor is None
@@ -0,0 +1,261 @@
+import pytest
+from bitcoin.core import CoreMainParams
+from squeak.core import MakeSqueakFromStr
+from squeak.core.signing import CSigningKey
+
+from squeaknode.core.peer_address import PeerAddress
+from squeaknode.core.peer_sync_state import PeerSyncState
+from squeaknode.core.squeak_entry import SqueakEntry
+from squeaknode.core.squeak_interest import SqueakInterest
+from squeaknode.core.util import clear_decryption_key_bytes
+from squeaknode.core.util import get_hash
+from squeaknode.db.db_engine import get_engine
+from squeaknode.db.squeak_db import SqueakDb
+
+
+@pytest.fixture
+def squeak_db():
+    squeak_db = SqueakDb(get_engine("sqlite://"))
+    squeak_db.init()
+    return squeak_db
+
+
+@pytest.fixture
+def signing_key():
+    return CSigningKey.generate()
+
+
+@pytest.fixture
+def block_header():
+    return CoreMainParams.GENESIS_BLOCK.get_header()
+
+
+def make_squeak(signing_key, content_str, block_height=0):
+    return MakeSqueakFromStr(
+        signing_key,
+        content_str,
+        block_height,
+        CoreMainParams.GENESIS_BLOCK.GetHash(),
+        1600000000,
+    )
+
+
+def test_lookup_squeak_hashes(squeak_db, signing_key, block_header):
+    unlocked_squeak = make_squeak(signing_key, "unlocked")
+    locked_squeak = make_squeak(signing_key, "locked")
+    unknown_squeak = make_squeak(signing_key, "unknown")
+    for squeak in [unlocked_squeak, locked_squeak]:
+        squeak_db.insert_squeak(squeak, block_header)
+    squeak_db.set_squeak_decryption_key(
+        get_hash(unlocked_squeak),
+        unlocked_squeak.GetDecryptionKey(),
+    )
+
+    known_squeak_hashes = squeak_db.lookup_squeak_hashes([
+        get_hash(unlocked_squeak),
+        get_hash(locked_squeak),
+        get_hash(unknown_squeak),
+    ])
+
+    assert known_squeak_hashes == {
+        get_hash(unlocked_squeak): True,
+        get_hash(locked_squeak): False,
+    }
+
+
+def test_lookup_squeak_hashes_many(squeak_db, signing_key, block_header):
+    squeak = make_squeak(signing_key, "hello")
+    squeak_db.insert_squeak(squeak, block_header)
+    squeak_hashes = [i.to_bytes(32, 'big') for i in range(2000)]
+    squeak_hashes.append(get_hash(squeak))
+
+    known_squeak_hashes = squeak_db.lookup_squeak_hashes(squeak_hashes)
+
+    assert known_squeak_hashes == {get_hash(squeak): False}
+
+
+def test_load_squeak_hash_index(squeak_db, signing_key, block_header):
+    unlocked_squeak = make_squeak(signing_key, "unlocked")
+    locked_squeak = make_squeak(signing_key, "locked")
+    for squeak in [unlocked_squeak, locked_squeak]:
+        squeak_db.insert_squeak(squeak, block_header)
+    squeak_db.set_squeak_decryption_key(
+        get_hash(unlocked_squeak),
+        unlocked_squeak.GetDecryptionKey(),
+    )
+    squeak_db.squeak_hash_index.load([])
+
+    squeak_db.load_squeak_hash_index()
+
+    assert len(squeak_db.squeak_hash_index) == 2
+    assert squeak_db.squeak_hash_index.lookup([
+        get_hash(unlocked_squeak),
+        get_hash(locked_squeak),
+    ]) == ({
+        get_hash(unlocked_squeak): True,
+        get_hash(locked_squeak): False,
+    }, [])
+
+
+def test_lookup_squeak_hashes_not_indexed(
+        squeak_db, signing_key, block_header):
+    squeak = make_squeak(signing_key, "hello")
+    squeak_db.insert_squeak(squeak, block_header)
+    squeak_db.squeak_hash_index.load([])
+
+    known_squeak_hashes = squeak_db.lookup_squeak_hashes([get_hash(squeak)])
+
+    assert known_squeak_hashes == {get_hash(squeak): False}
+    assert len(squeak_db.squeak_hash_index) == 0
+
+
+def test_squeak_hash_index_delete_squeak(
+        squeak_db, signing_key, block_header):
+    squeak = make_squeak(signing_key, "hello")
+    squeak_db.insert_squeak(squeak, block_header)
+
+    squeak_db.delete_squeak(get_hash(squeak))
+
+    assert len(squeak_db.squeak_hash_index) == 0
+    assert squeak_db.lookup_squeak_hashes([get_hash(squeak)]) == {}
+
+
+def test_insert_squeaks(squeak_db, signing_key, block_header):
+    existing_squeak = make_squeak(signing_key, "existing")
+    unlocked_squeak = make_squeak(signing_key, "unlocked")
+    locked_squeak = make_squeak(signing_key, "locked")
+    squeak_db.insert_squeak(existing_squeak, block_header)
+    locked_squeak.ClearDecryptionKey()
+
+    inserted_squeak_hashes = squeak_db.insert_squeaks([
+        SqueakEntry(squeak=squeak, block_header=block_header)
+        for squeak in [existing_squeak, unlocked_squeak, locked_squeak]
+    ])
+
+    assert inserted_squeak_hashes == [
+        get_hash(unlocked_squeak),
+        get_hash(locked_squeak),
+    ]
+    assert squeak_db.lookup_squeak_hashes([
+        get_hash(existing_squeak),
+        get_hash(unlocked_squeak),
+        get_hash(locked_squeak),
+    ]) == {
+        get_hash(existing_squeak): False,
+        get_hash(unlocked_squeak): True,
+        get_hash(locked_squeak): False,
+    }
+    squeak_db.squeak_hash_index.load([])
+    squeak_db.load_squeak_hash_index()
+    assert squeak_db.squeak_hash_index.lookup([
+        get_hash(unlocked_squeak),
+    ]) == ({get_hash(unlocked_squeak): True}, [])
+
+
+def test_insert_squeaks_rate_limited(squeak_db, signing_key, block_header):
+    stored_squeak = make_squeak(signing_key, "stored")
+    squeak_db.insert_squeak(stored_squeak, block_header)
+    burst_squeaks = [
+        make_squeak(signing_key, "burst {}".format(i)) for i in range(3)
+    ]
+    next_block_squeak = make_squeak(signing_key, "next block", 1)
+
+    inserted_squeak_hashes = squeak_db.insert_squeaks(
+        [
+            SqueakEntry(squeak=squeak, block_header=block_header)
+            for squeak in burst_squeaks + [next_block_squeak]
+        ],
+        max_squeaks_per_address_per_block=2,
+    )
+
+    assert inserted_squeak_hashes == [
+        get_hash(burst_squeaks[0]),
+        get_hash(next_block_squeak),
+    ]
+    assert squeak_db.insert_squeaks(
+        [SqueakEntry(squeak=burst_squeaks[1], block_header=block_header)],
+        max_squeaks_per_address_per_block=2,
+    ) == []
+
+
+def test_insert_squeaks_empty(squeak_db):
+    assert squeak_db.insert_squeaks([]) == []
+
+
+def test_get_squeak_bytes(squeak_db, signing_key, block_header):
+    squeak = make_squeak(signing_key, "hello")
+    unknown_squeak = make_squeak(signing_key, "unknown")
+    squeak_db.insert_squeak(squeak, block_header)
+
+    squeak_bytes = squeak_db.get_squeak_bytes([
+        get_hash(squeak),
+        get_hash(unknown_squeak),
+    ])
+
+    assert squeak_bytes == {get_hash(squeak): squeak.serialize()}
+    squeak.ClearDecryptionKey()
+    assert clear_decryption_key_bytes(squeak_bytes[get_hash(squeak)]) == \
+        squeak.serialize()
+
+
+def test_lookup_squeaks_for_interests(squeak_db, block_header):
+    signing_keys = [CSigningKey.generate() for _ in range(3)]
+    squeaks = [
+        make_squeak(signing_key, "hello", block_height)
+        for signing_key in signing_keys
+        for block_height in [0, 10]
+    ]
+    for squeak in squeaks:
+        squeak_db.insert_squeak(squeak, block_header)
+        squeak_db.set_squeak_decryption_key(
+            get_hash(squeak),
+            squeak.GetDecryptionKey(),
+        )
+    locked_squeak = make_squeak(signing_keys[0], "locked")
+    squeak_db.insert_squeak(locked_squeak, block_header)
+    addresses = [
+        str(squeak.GetAddress()) for squeak in squeaks[::2]
+    ]
+    interests = [
+        SqueakInterest(addresses[0], 0, 20),
+        SqueakInterest(addresses[0], 5, 20),
+        SqueakInterest(addresses[1], 5, 20),
+        SqueakInterest("unknown_address", 0, 20),
+    ] + [
+        SqueakInterest("address_{}".format(i), 0, 20)
+        for i in range(1000)
+    ]
+
+    squeak_hashes = squeak_db.lookup_squeaks_for_interests(interests)
+
+    assert len(squeak_hashes) == len(interests)
+    assert sorted(squeak_hashes[interests[0]]) == sorted([
+        get_hash(squeaks[0]),
+        get_hash(squeaks[1]),
+    ])
+    assert squeak_hashes[interests[1]] == [get_hash(squeaks[1])]
+    assert squeak_hashes[interests[2]] == [get_hash(squeaks[3])]
+    assert squeak_hashes[interests[3]] == []
+
+
+def test_peer_sync_states(squeak_db):
+    peer_address = PeerAddress(host="1.2.3.4", port=8555)
+    other_peer_address = PeerAddress(host="5.6.7.8", port=8555)
+    sync_state = PeerSyncState(peer_address, "address1", 100)
+    other_sync_state = PeerSyncState(other_peer_address, "address1", 50)
+    squeak_db.insert_peer_sync_states([sync_state, other_sync_state])
+
+    assert squeak_db.get_peer_sync_states(peer_address, 3600) == \
+        [sync_state]
+
+    updated_sync_state = sync_state._replace(last_synced_block=110)
+    squeak_db.update_peer_sync_states([updated_sync_state])
+
+    assert squeak_db.get_peer_sync_states(peer_address, 3600) == \
+        [updated_sync_state]
+    # States without a recent full sync are ignored and deleted.
+    assert squeak_db.get_peer_sync_states(peer_address, -1) == []
+
+    squeak_db.delete_old_peer_sync_states(-1)
+
+    assert squeak_db.get_peer_sync_states(other_peer_address, 3600) == []
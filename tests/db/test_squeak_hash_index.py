@@ -0,0 +1,28 @@
+from squeaknode.db.squeak_hash_index import SqueakHashIndex
+
+
+def test_lookup():
+    index = SqueakHashIndex()
+    index.load([
+        (b'a' * 32, True),
+        (b'b' * 32, False),
+    ])
+
+    found, missing = index.lookup([b'a' * 32, b'b' * 32, b'c' * 32])
+
+    assert found == {b'a' * 32: True, b'b' * 32: False}
+    assert missing == [b'c' * 32]
+
+
+def test_add_set_unlocked_remove():
+    index = SqueakHashIndex()
+
+    index.add(b'a' * 32, False)
+    assert index.lookup([b'a' * 32]) == ({b'a' * 32: False}, [])
+
+    index.set_unlocked(b'a' * 32)
+    assert index.lookup([b'a' * 32]) == ({b'a' * 32: True}, [])
+
+    index.remove(b'a' * 32)
+    assert index.lookup([b'a' * 32]) == ({}, [b'a' * 32])
+    assert len(index) == 0
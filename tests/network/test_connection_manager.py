@@ -0,0 +1,99 @@
+import time
+
+import mock
+import pytest
+
+from squeaknode.network.connection_manager import ConnectionManager
+from squeaknode.network.connection_manager import EVICTED_REASON
+from squeaknode.network.connection_manager import EVICTION_PROTECTION_S
+from squeaknode.network.connection_manager import peer_score
+from squeaknode.network.peer import Peer
+
+
+def make_peer(port, outgoing=False, uptime_s=0, num_useful_squeaks=0,
+              ping_rtt=None):
+    peer = mock.Mock(spec=Peer)
+    peer.address = ('1.2.3.4', port)
+    peer.outgoing = outgoing
+    peer.connect_time = time.time() - uptime_s
+    peer.num_useful_squeaks = num_useful_squeaks
+    peer.ping_rtt = ping_rtt
+    peer.stop_reason = None
+    return peer
+
+
+@pytest.fixture
+def connection_manager():
+    return ConnectionManager(
+        max_inbound_peers=2,
+        max_outbound_peers=3,
+        reserved_outbound_peers=1,
+    )
+
+
+def test_reserve_inbound_slot_refused(connection_manager):
+    assert connection_manager.reserve_inbound_slot()
+    assert connection_manager.reserve_inbound_slot()
+    # No connected peer can be evicted.
+    assert not connection_manager.reserve_inbound_slot()
+    assert connection_manager.num_inbound_slots == 2
+    assert connection_manager.num_refused_connections == 1
+
+    connection_manager.release_slot(outgoing=False)
+
+    assert connection_manager.reserve_inbound_slot()
+
+
+def test_reserve_inbound_slot_evicts_lowest_score(connection_manager):
+    old_age = EVICTION_PROTECTION_S + 1
+    useful_peer = make_peer(1, uptime_s=old_age, num_useful_squeaks=10)
+    idle_peer = make_peer(2, uptime_s=old_age)
+    new_peer = make_peer(3)
+    outgoing_peer = make_peer(4, outgoing=True, uptime_s=old_age)
+    for peer in [useful_peer, idle_peer, new_peer, outgoing_peer]:
+        connection_manager.add_peer(peer)
+    connection_manager.reserve_inbound_slot()
+    connection_manager.reserve_inbound_slot()
+
+    assert connection_manager.reserve_inbound_slot()
+
+    idle_peer.stop.assert_called_once_with(EVICTED_REASON)
+    useful_peer.stop.assert_not_called()
+    new_peer.stop.assert_not_called()
+    outgoing_peer.stop.assert_not_called()
+    assert connection_manager.num_inbound_slots == 3
+    assert connection_manager.disconnect_reasons == {EVICTED_REASON: 1}
+
+
+def test_reserve_outbound_slot(connection_manager):
+    assert connection_manager.reserve_outbound_slot()
+    assert connection_manager.reserve_outbound_slot()
+    assert not connection_manager.reserve_outbound_slot()
+    assert connection_manager.reserve_outbound_slot(use_reserved_slot=True)
+    assert not connection_manager.reserve_outbound_slot(
+        use_reserved_slot=True)
+    assert connection_manager.num_outbound_slots == 3
+
+
+def test_peer_score():
+    now = time.time()
+    fast_peer = make_peer(1, uptime_s=100, ping_rtt=0.1)
+    slow_peer = make_peer(2, uptime_s=100, ping_rtt=2)
+    useful_peer = make_peer(3, uptime_s=100, num_useful_squeaks=5)
+    old_peer = make_peer(4, uptime_s=1000)
+
+    assert peer_score(fast_peer, now) > peer_score(slow_peer, now)
+    assert peer_score(useful_peer, now) > peer_score(old_peer, now)
+    assert peer_score(old_peer, now) > peer_score(fast_peer, now)
+
+
+def test_half_open_and_established_peers(connection_manager):
+    half_open_peer = make_peer(1)
+    half_open_peer.is_handshake_complete = False
+    established_peer = make_peer(2)
+    established_peer.is_handshake_complete = True
+    connection_manager.add_peer(half_open_peer)
+    connection_manager.add_peer(established_peer)
+
+    assert connection_manager.num_half_open_peers == 1
+    assert connection_manager.num_established_peers == 1
@@ -0,0 +1,135 @@
+import mock
+import pytest
+
+from squeaknode.network.download_scheduler import DownloadScheduler
+from squeaknode.network.download_scheduler import make_getdata_msg
+from squeaknode.network.peer import Peer
+
+
+@pytest.fixture
+def download_scheduler():
+    return DownloadScheduler(timeout_s=10, max_downloads_per_peer=2)
+
+
+@pytest.fixture
+def peer_a():
+    return mock.Mock(spec=Peer)
+
+
+@pytest.fixture
+def peer_b():
+    return mock.Mock(spec=Peer)
+
+
+@pytest.fixture
+def squeak_hashes():
+    return [bytes([i]) * 32 for i in range(3)]
+
+
+def test_add_announcement(download_scheduler, peer_a, squeak_hashes):
+    requested = download_scheduler.add_announcement(
+        peer_a, squeak_hashes[:2], now=100)
+
+    assert requested == squeak_hashes[:2]
+    stats = download_scheduler.stats
+    assert stats.num_requested == 2
+    assert stats.num_in_flight == 2
+
+
+def test_ignore_duplicate_announcement(
+        download_scheduler, peer_a, peer_b, squeak_hashes):
+    download_scheduler.add_announcement(peer_a, squeak_hashes[:1], now=100)
+
+    assert download_scheduler.add_announcement(
+        peer_a, squeak_hashes[:1], now=101) == []
+    assert download_scheduler.add_announcement(
+        peer_b, squeak_hashes[:1], now=101) == []
+    assert download_scheduler.dispatch(now=105) == {}
+    assert download_scheduler.stats.num_requested == 1
+
+
+def test_max_downloads_per_peer(
+        download_scheduler, peer_a, squeak_hashes):
+    requested = download_scheduler.add_announcement(
+        peer_a, squeak_hashes, now=100)
+
+    assert requested == squeak_hashes[:2]
+    assert download_scheduler.dispatch(now=101) == {}
+
+    download_scheduler.on_received(peer_a, squeak_hashes[0])
+
+    assert download_scheduler.dispatch(now=102) == {
+        peer_a: [squeak_hashes[2]],
+    }
+
+
+def test_timeout_requests_other_announcer(
+        download_scheduler, peer_a, peer_b, squeak_hashes):
+    download_scheduler.add_announcement(peer_a, squeak_hashes[:1], now=100)
+    download_scheduler.add_announcement(peer_b, squeak_hashes[:1], now=101)
+
+    assert download_scheduler.dispatch(now=109) == {}
+    assert download_scheduler.dispatch(now=111) == {
+        peer_b: squeak_hashes[:1],
+    }
+    stats = download_scheduler.stats
+    assert stats.num_timeouts == 1
+    assert stats.num_requested == 2
+
+
+def test_timeout_without_other_announcer(
+        download_scheduler, peer_a, squeak_hashes):
+    download_scheduler.add_announcement(peer_a, squeak_hashes[:1], now=100)
+
+    assert download_scheduler.dispatch(now=111) == {}
+    stats = download_scheduler.stats
+    assert stats.num_in_flight == 0
+    assert stats.num_pending == 0
+
+
+def test_not_found_requests_other_announcer(
+        download_scheduler, peer_a, peer_b, squeak_hashes):
+    download_scheduler.add_announcement(peer_a, squeak_hashes[:1], now=100)
+    download_scheduler.add_announcement(peer_b, squeak_hashes[:1], now=101)
+
+    download_scheduler.on_not_found(peer_a, squeak_hashes[:1])
+
+    assert download_scheduler.dispatch(now=102) == {
+        peer_b: squeak_hashes[:1],
+    }
+
+
+def test_remove_peer(download_scheduler, peer_a, peer_b, squeak_hashes):
+    download_scheduler.add_announcement(peer_a, squeak_hashes[:1], now=100)
+    download_scheduler.add_announcement(peer_b, squeak_hashes[:1], now=101)
+
+    download_scheduler.remove_peer(peer_b)
+    download_scheduler.remove_peer(peer_a)
+
+    assert download_scheduler.dispatch(now=102) == {}
+    assert download_scheduler.stats.num_pending == 0
+
+
+def test_duplicate_ratio(
+        download_scheduler, peer_a, peer_b, squeak_hashes):
+    download_scheduler.add_announcement(peer_a, squeak_hashes[:1], now=100)
+    download_scheduler.add_announcement(peer_b, squeak_hashes[:1], now=101)
+    download_scheduler.add_announcement(peer_a, squeak_hashes[1:2], now=105)
+    download_scheduler.dispatch(now=111)
+
+    download_scheduler.on_received(peer_a, squeak_hashes[0])
+    download_scheduler.on_received(peer_b, squeak_hashes[0])
+    download_scheduler.on_received(peer_a, squeak_hashes[1])
+
+    stats = download_scheduler.stats
+    assert stats.num_received == 2
+    assert stats.num_duplicates == 1
+    assert stats.duplicate_ratio == pytest.approx(1 / 3)
+    assert stats.num_in_flight == 0
+
+
+def test_make_getdata_msg(squeak_hashes):
+    getdata_msg = make_getdata_msg(squeak_hashes)
+
+    assert [inv.hash for inv in getdata_msg.inv] == squeak_hashes
+    assert all(inv.type == 1 for inv in getdata_msg.inv)
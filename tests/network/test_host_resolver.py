@@ -0,0 +1,89 @@
+import asyncio
+import socket
+
+import mock
+import pytest
+
+from squeaknode.network.host_resolver import HostResolveError
+from squeaknode.network.host_resolver import HostResolver
+
+
+def run(coro):
+    return asyncio.new_event_loop().run_until_complete(coro)
+
+
+def addr_info(ip):
+    return [(socket.AF_INET, socket.SOCK_STREAM, 6, '', (ip, 0))]
+
+
+@pytest.fixture
+def host_resolver():
+    return HostResolver(ttl_s=60, negative_ttl_s=60)
+
+
+def test_resolve_cached(host_resolver):
+    getaddrinfo = mock.AsyncMock(return_value=addr_info('1.2.3.4'))
+
+    async def resolve_twice():
+        loop = asyncio.get_event_loop()
+        with mock.patch.object(loop, 'getaddrinfo', new=getaddrinfo):
+            first = await host_resolver.resolve('example.com')
+            second = await host_resolver.resolve('example.com')
+            return first, second
+
+    assert run(resolve_twice()) == ('1.2.3.4', '1.2.3.4')
+    getaddrinfo.assert_called_once()
+    assert host_resolver.num_hits == 1
+    assert host_resolver.num_misses == 1
+
+
+def test_resolve_negative_cached(host_resolver):
+    getaddrinfo = mock.AsyncMock(side_effect=socket.gaierror())
+
+    async def resolve_twice():
+        loop = asyncio.get_event_loop()
+        errors = 0
+        with mock.patch.object(loop, 'getaddrinfo', new=getaddrinfo):
+            for _ in range(2):
+                try:
+                    await host_resolver.resolve('unknown.invalid')
+                except HostResolveError:
+                    errors += 1
+        return errors
+
+    assert run(resolve_twice()) == 2
+    getaddrinfo.assert_called_once()
+
+
+def test_resolve_expired(host_resolver):
+    host_resolver.ttl_s = 0
+    getaddrinfo = mock.AsyncMock(return_value=addr_info('1.2.3.4'))
+
+    async def resolve_twice():
+        loop = asyncio.get_event_loop()
+        with mock.patch.object(loop, 'getaddrinfo', new=getaddrinfo):
+            await host_resolver.resolve('example.com')
+            await host_resolver.resolve('example.com')
+
+    run(resolve_twice())
+
+    assert getaddrinfo.call_count == 2
+
+
+def test_resolve_concurrent_shares_lookup(host_resolver):
+    getaddrinfo = mock.AsyncMock(return_value=addr_info('1.2.3.4'))
+
+    async def resolve_concurrently():
+        loop = asyncio.get_event_loop()
+        with mock.patch.object(loop, 'getaddrinfo', new=getaddrinfo):
+            return await asyncio.gather(*[
+                host_resolver.resolve('example.com') for _ in range(3)
+            ])
+
+    assert run(resolve_concurrently()) == ['1.2.3.4'] * 3
+    getaddrinfo.assert_called_once()
+
+
+def test_resolve_ip_address(host_resolver):
+    assert run(host_resolver.resolve('127.0.0.1')) == '127.0.0.1'
+    assert host_resolver.num_misses == 0
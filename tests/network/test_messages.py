@@ -0,0 +1,69 @@
+import pytest
+from bitcoin.core import CoreMainParams
+from squeak.core import MakeSqueakFromStr
+from squeak.core.signing import CSigningKey
+from squeak.core.signing import CSqueakAddress
+from squeak.messages import msg_squeak
+from squeak.messages import MsgSerializable
+from squeak.net import CInterested
+from squeak.net import CSqueakLocator
+
+from squeaknode.network.messages import CBucketDigest
+from squeaknode.network.messages import decode_msg
+from squeaknode.network.messages import msg_reconcile
+from squeaknode.network.messages import msg_squeak_bytes
+
+
+def test_reconcile_msg_round_trip():
+    address = CSqueakAddress.from_verifying_key(
+        CSigningKey.generate().get_verifying_key())
+    interests = [
+        CInterested(address=address, nMinBlockHeight=0, nMaxBlockHeight=400),
+    ]
+    digests = [
+        CBucketDigest(nInterest=0, nBucket=2, nNumSqueaks=3,
+                      hashDigest=b'\x07' * 8),
+    ]
+    reconcile_msg = msg_reconcile(
+        locator=CSqueakLocator(vInterested=interests),
+        nBucketSize=144,
+        vDigests=digests,
+    )
+
+    decoded_msg = MsgSerializable.from_bytes(reconcile_msg.to_bytes())
+
+    assert isinstance(decoded_msg, msg_reconcile)
+    assert decoded_msg.nBucketSize == 144
+    interest, = decoded_msg.locator.vInterested
+    assert interest.address == address
+    assert (interest.nMinBlockHeight, interest.nMaxBlockHeight) == (0, 400)
+    digest, = decoded_msg.vDigests
+    assert (digest.nInterest, digest.nBucket, digest.nNumSqueaks) == (0, 2, 3)
+    assert digest.hashDigest == b'\x07' * 8
+
+
+def test_squeak_msg_decoded_as_bytes():
+    squeak = MakeSqueakFromStr(
+        CSigningKey.generate(),
+        "hello",
+        0,
+        CoreMainParams.GENESIS_BLOCK.GetHash(),
+        1600000000,
+    )
+
+    msg_bytes = msg_squeak(squeak=squeak).to_bytes()
+
+    decoded_msg = decode_msg(msg_bytes)
+
+    assert isinstance(decoded_msg, msg_squeak_bytes)
+    assert decoded_msg.squeak_bytes == squeak.serialize()
+    # The squeak library still decodes the message to its own class.
+    assert isinstance(MsgSerializable.from_bytes(msg_bytes), msg_squeak)
+
+
+def test_squeak_msg_bad_checksum():
+    msg_bytes = bytearray(msg_squeak_bytes(b'\x01' * 10).to_bytes())
+    msg_bytes[-1] ^= 1
+
+    with pytest.raises(ValueError):
+        decode_msg(bytes(msg_bytes))
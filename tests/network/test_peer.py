@@ -0,0 +1,392 @@
+import asyncio
+import socket
+
+import mock
+import pytest
+from squeak.messages import msg_inv
+from squeak.messages import msg_ping
+from squeak.messages import msg_pong
+from squeak.net import CInv
+
+from squeaknode.network.peer import MAX_MESSAGE_LEN
+from squeaknode.network.peer import MAX_PENDING_SYNC_UPDATES
+from squeaknode.network.peer import MAX_RECEIVED_SQUEAK_HASHES
+from squeaknode.network.peer import MAX_REMOTE_INTERESTED_ADDRESSES
+from squeaknode.network.peer import MessageDecoder
+from squeaknode.network.peer import MessageReceiver
+from squeaknode.network.peer import MessageSender
+from squeaknode.network.peer import Peer
+from squeaknode.network.peer import ReceiveQueue
+from squeaknode.network.peer import REMOTE_INTEREST_EXPIRY_S
+from squeaknode.network.peer import serialize_msg
+
+
+@pytest.fixture
+def ping_msg():
+    ping = msg_ping()
+    ping.nonce = 12345
+    return ping
+
+
+@pytest.fixture
+def large_inv_msg():
+    invs = [
+        CInv(type=1, hash=i.to_bytes(32, 'big'))
+        for i in range(10000)
+    ]
+    return msg_inv(inv=invs)
+
+
+def feed_chunks(decoder, data, chunk_len):
+    msgs = []
+    for i in range(0, len(data), chunk_len):
+        msgs.extend(decoder.process_recv_data(data[i:i + chunk_len]))
+    return msgs
+
+
+def test_decode_single_msg(ping_msg):
+    decoder = MessageDecoder(read_len=1024)
+
+    msgs = list(decoder.process_recv_data(ping_msg.to_bytes()))
+
+    assert len(msgs) == 1
+    assert msgs[0].nonce == ping_msg.nonce
+    assert decoder.buffered_len == 0
+
+
+def test_decode_multiple_msgs_in_one_chunk(ping_msg, large_inv_msg):
+    decoder = MessageDecoder(read_len=1024)
+    data = ping_msg.to_bytes() + large_inv_msg.to_bytes() + ping_msg.to_bytes()
+
+    msgs = list(decoder.process_recv_data(data))
+
+    assert [msg.command for msg in msgs] == [b'ping', b'inv', b'ping']
+    assert len(msgs[1].inv) == len(large_inv_msg.inv)
+
+
+def test_decode_split_msgs(ping_msg, large_inv_msg):
+    decoder = MessageDecoder(read_len=1024)
+    data = large_inv_msg.to_bytes() + ping_msg.to_bytes()
+
+    msgs = feed_chunks(decoder, data, 7)
+
+    assert [msg.command for msg in msgs] == [b'inv', b'ping']
+    assert msgs[0].inv[-1].hash == large_inv_msg.inv[-1].hash
+    assert decoder.buffered_len == 0
+
+
+def test_decode_with_read_buffer(ping_msg, large_inv_msg):
+    decoder = MessageDecoder(read_len=100)
+    data = large_inv_msg.to_bytes() + ping_msg.to_bytes()
+    msgs = []
+
+    while data:
+        with decoder.get_read_buffer() as read_buffer:
+            read_len = min(len(read_buffer), len(data))
+            read_buffer[:read_len] = data[:read_len]
+        data = data[read_len:]
+        msgs.extend(decoder.process_read_len(read_len))
+
+    assert [msg.command for msg in msgs] == [b'inv', b'ping']
+
+
+def test_decode_partial_msg(ping_msg):
+    decoder = MessageDecoder(read_len=1024)
+    data = ping_msg.to_bytes()
+
+    msgs = list(decoder.process_recv_data(data[:-1]))
+
+    assert msgs == []
+    assert decoder.buffered_len == len(data) - 1
+
+
+def test_decode_msg_too_large(ping_msg):
+    decoder = MessageDecoder(read_len=1024)
+    data = bytearray(ping_msg.to_bytes())
+    data[16:20] = (MAX_MESSAGE_LEN + 1).to_bytes(4, 'little')
+
+    with pytest.raises(Exception):
+        list(decoder.process_recv_data(bytes(data)))
+
+
+def test_serialize_msg(ping_msg, large_inv_msg):
+    for msg in [ping_msg, large_inv_msg]:
+        data = msg.to_bytes()
+        payload = data[24:]
+
+        assert serialize_msg(msg.command, payload) == data
+
+
+def test_sender_coalesces_small_msgs():
+    async def run():
+        sender = MessageSender(None, mock.Mock(), coalesce_len=10)
+        for data in [b'aaa', b'bbb', b'ccc', b'dddddddddddd', b'e']:
+            sender.enqueue(data)
+
+        batches = [sender._pop_data() for _ in range(3)]
+
+        assert batches == [b'aaabbbccc', b'dddddddddddd', b'e']
+        assert sender.queue_bytes == 0
+        assert not sender.queue_ready.is_set()
+
+    asyncio.new_event_loop().run_until_complete(run())
+
+
+def test_sender_error_when_queue_full():
+    async def run():
+        error_callback = mock.Mock()
+        sender = MessageSender(None, error_callback, max_queue_len=2)
+        sender.enqueue(b'a')
+        sender.enqueue(b'b')
+        error_callback.assert_not_called()
+
+        sender.enqueue(b'c')
+
+        error_callback.assert_called_once()
+        assert len(sender.queue) == 2
+
+    asyncio.new_event_loop().run_until_complete(run())
+
+
+def test_sender_error_when_queue_bytes_exceeded():
+    async def run():
+        error_callback = mock.Mock()
+        sender = MessageSender(None, error_callback, max_queue_bytes=5)
+        sender.enqueue(b'aaa')
+        sender.enqueue(b'bbb')
+        sender.enqueue(b'ccc')
+
+        error_callback.assert_called_once()
+        assert sender.queue_bytes == 3
+
+    asyncio.new_event_loop().run_until_complete(run())
+
+
+def test_sender_error_on_send_timeout():
+    async def run():
+        local_socket, remote_socket = socket.socketpair()
+        local_socket.setblocking(False)
+        local_socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+        error_callback = mock.Mock()
+        sender = MessageSender(local_socket, error_callback, send_timeout=0.1)
+        task = asyncio.ensure_future(sender.send_msgs())
+        # The remote socket never reads, so the write stalls.
+        sender.enqueue(b'x' * 10000000)
+        await asyncio.wait_for(task, 5)
+        local_socket.close()
+        remote_socket.close()
+        return error_callback
+
+    error_callback = asyncio.new_event_loop().run_until_complete(run())
+
+    error_callback.assert_called_once()
+
+
+def test_sender_writes_queued_msgs(ping_msg):
+    async def run():
+        local_socket, remote_socket = socket.socketpair()
+        local_socket.setblocking(False)
+        sender = MessageSender(local_socket, mock.Mock())
+        task = asyncio.ensure_future(sender.send_msgs())
+        for _ in range(3):
+            sender.enqueue(ping_msg.to_bytes())
+        await asyncio.sleep(0.1)
+        task.cancel()
+        local_socket.close()
+        decoder = MessageDecoder()
+        msgs = list(decoder.process_recv_data(remote_socket.recv(1024)))
+        remote_socket.close()
+        return msgs
+
+    msgs = asyncio.new_event_loop().run_until_complete(run())
+
+    assert [msg.nonce for msg in msgs] == [ping_msg.nonce] * 3
+
+
+def test_receive_queue_backpressure():
+    async def run():
+        queue = ReceiveQueue(max_len=2, max_bytes=100)
+        await queue.put('a', 10)
+        await queue.put('b', 10)
+        put_task = asyncio.ensure_future(queue.put('c', 10))
+        await asyncio.sleep(0.01)
+
+        assert not put_task.done()
+        assert queue.num_backpressure == 1
+
+        assert await queue.get() == 'a'
+        await asyncio.wait_for(put_task, 1)
+
+        assert len(queue) == 2
+        assert queue.queue_bytes == 20
+
+    asyncio.new_event_loop().run_until_complete(run())
+
+
+def test_receive_queue_bytes_limit():
+    async def run():
+        queue = ReceiveQueue(max_len=10, max_bytes=100)
+        # A single large message is accepted into an empty queue.
+        await queue.put('a', 500)
+        put_task = asyncio.ensure_future(queue.put('b', 10))
+        await asyncio.sleep(0.01)
+
+        assert not put_task.done()
+
+        assert await queue.get() == 'a'
+        await asyncio.wait_for(put_task, 1)
+        assert queue.queue_bytes == 10
+
+    asyncio.new_event_loop().run_until_complete(run())
+
+
+def test_receiver_records_pong_before_queued_msgs(ping_msg):
+    async def run():
+        local_socket, remote_socket = socket.socketpair()
+        local_socket.setblocking(False)
+        queue = ReceiveQueue(max_len=10)
+        pong_callback = mock.Mock()
+        receiver = MessageReceiver(
+            local_socket,
+            queue,
+            asyncio.Event(),
+            pong_callback=pong_callback,
+        )
+        task = asyncio.ensure_future(receiver.recv_msgs())
+        pong = msg_pong()
+        pong.nonce = 1234
+        # Nothing takes the pings from the queue.
+        remote_socket.sendall(
+            ping_msg.to_bytes() * 5 + pong.to_bytes(),
+        )
+        await asyncio.sleep(0.1)
+        queue_len = len(queue)
+        task.cancel()
+        local_socket.close()
+        remote_socket.close()
+        return pong_callback, queue_len
+
+    pong_callback, queue_len = \
+        asyncio.new_event_loop().run_until_complete(run())
+
+    pong_callback.assert_called_once_with(1234)
+    assert queue_len == 5
+
+
+def test_receiver_records_pong_time():
+    async def run():
+        local_socket, remote_socket = socket.socketpair()
+        local_socket.setblocking(False)
+        queue = ReceiveQueue()
+        receiver = MessageReceiver(
+            local_socket,
+            queue,
+            asyncio.Event(),
+            pong_callback=mock.Mock(),
+        )
+        task = asyncio.ensure_future(receiver.recv_msgs())
+        remote_socket.sendall(msg_pong().to_bytes())
+        await asyncio.sleep(0.1)
+        task.cancel()
+        local_socket.close()
+        remote_socket.close()
+        return queue
+
+    queue = asyncio.new_event_loop().run_until_complete(run())
+
+    # The pong is not queued, but it still counts as a received message.
+    assert len(queue) == 0
+    assert queue.last_msg_time is not None
+
+
+def test_set_pong_response():
+    async def make_peer():
+        return Peer(mock.Mock(), ('1.2.3.4', 8555))
+
+    peer = asyncio.new_event_loop().run_until_complete(make_peer())
+    peer.set_last_sent_ping(1234, 1000.0)
+    assert peer.is_ping_pending
+
+    peer.set_pong_response(5678, 1000.1)
+    assert peer.is_ping_pending
+    assert peer.ping_rtt is None
+
+    peer.set_pong_response(1234, 1000.5)
+    assert not peer.is_ping_pending
+    assert peer.ping_rtt == 0.5
+
+
+def test_sync_request_time():
+    async def make_peer():
+        return Peer(mock.Mock(), ('1.2.3.4', 8555))
+
+    peer = asyncio.new_event_loop().run_until_complete(make_peer())
+    assert peer.sync_request_time is None
+
+    peer.set_sync_requested(1000.0)
+    peer.set_sync_requested(1005.0)
+    assert peer.sync_request_time == 1000.0
+
+    peer.set_sync_response()
+    assert peer.sync_request_time is None
+
+
+def test_pending_sync_updates():
+    async def make_peer():
+        return Peer(mock.Mock(), ('1.2.3.4', 8555))
+
+    peer = asyncio.new_event_loop().run_until_complete(make_peer())
+    assert peer.pop_sync_update() is None
+
+    for i in range(MAX_PENDING_SYNC_UPDATES + 1):
+        peer.set_sync_requested(1000.0, sync_update=i)
+
+    # The oldest update is dropped when too many are pending.
+    assert peer.pop_sync_update() == 1
+    assert peer.pop_sync_update() == 2
+
+
+def test_remote_interest_expiry():
+    async def make_peer():
+        return Peer(mock.Mock(), ('1.2.3.4', 8555))
+
+    peer = asyncio.new_event_loop().run_until_complete(make_peer())
+    peer.add_remote_interested_addresses(['a', 'b'], now=1000.0)
+    expiry_time = 1000.0 + REMOTE_INTEREST_EXPIRY_S
+    peer.add_remote_interested_addresses(['b'], now=expiry_time - 1)
+
+    assert peer.is_remote_interested('a', now=expiry_time - 1)
+    assert not peer.is_remote_interested('a', now=expiry_time)
+    assert peer.is_remote_interested('b', now=expiry_time)
+    assert not peer.is_remote_interested('c', now=1000.0)
+
+    # Expired addresses are removed when new ones are added.
+    peer.add_remote_interested_addresses(['c'], now=expiry_time)
+    assert 'a' not in peer._remote_interested_addresses
+
+
+def test_remote_interest_max_addresses():
+    async def make_peer():
+        return Peer(mock.Mock(), ('1.2.3.4', 8555))
+
+    peer = asyncio.new_event_loop().run_until_complete(make_peer())
+    peer.add_remote_interested_addresses(
+        range(MAX_REMOTE_INTERESTED_ADDRESSES + 1),
+        now=1000.0,
+    )
+
+    assert not peer.is_remote_interested(0, now=1000.0)
+    assert peer.is_remote_interested(1, now=1000.0)
+
+
+def test_received_squeaks():
+    async def make_peer():
+        return Peer(mock.Mock(), ('1.2.3.4', 8555))
+
+    peer = asyncio.new_event_loop().run_until_complete(make_peer())
+    for i in range(MAX_RECEIVED_SQUEAK_HASHES + 1):
+        peer.add_received_squeak(i)
+
+    assert not peer.has_received_squeak(0)
+    assert peer.has_received_squeak(1)
+    assert peer.has_received_squeak(MAX_RECEIVED_SQUEAK_HASHES)
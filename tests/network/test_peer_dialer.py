@@ -0,0 +1,101 @@
+import asyncio
+import socket
+
+import mock
+import pytest
+
+from squeaknode.network.connection_manager import ConnectionManager
+from squeaknode.network.peer_dialer import PeerDialer
+
+
+@pytest.fixture
+def connection_manager():
+    return ConnectionManager()
+
+
+@pytest.fixture
+def peer_dialer(connection_manager):
+    return PeerDialer(
+        connection_manager,
+        connect_timeout=0.5,
+        backoff_base_s=60,
+    )
+
+
+@pytest.fixture
+def listen_socket():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        s.listen()
+        yield s
+
+
+@pytest.fixture
+def closed_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def run(coro):
+    return asyncio.new_event_loop().run_until_complete(coro)
+
+
+def test_dial(connection_manager, peer_dialer, listen_socket):
+    port = listen_socket.getsockname()[1]
+
+    peer_socket, address = run(peer_dialer.dial('localhost', port))
+    peer_socket.close()
+
+    assert address == ('127.0.0.1', port)
+    assert connection_manager.num_outbound_slots == 1
+    assert peer_dialer.stats.num_attempts == 1
+    assert peer_dialer.stats.num_successes == 1
+    assert peer_dialer.stats.total_connect_time_s > 0
+
+
+def test_dial_failure_backoff(connection_manager, peer_dialer, closed_port):
+    async def dial_twice():
+        first = await peer_dialer.dial('127.0.0.1', closed_port)
+        second = await peer_dialer.dial('127.0.0.1', closed_port)
+        return first, second
+
+    assert run(dial_twice()) == (None, None)
+    assert connection_manager.num_outbound_slots == 0
+    assert peer_dialer.stats.num_attempts == 1
+    assert peer_dialer.stats.num_failures == 1
+    assert peer_dialer.stats.num_backoff_skips == 1
+
+
+def test_dial_timeout(connection_manager, peer_dialer, listen_socket):
+    port = listen_socket.getsockname()[1]
+
+    async def never_connect(*args):
+        await asyncio.sleep(10)
+
+    async def dial():
+        loop = asyncio.get_event_loop()
+        with mock.patch.object(loop, 'sock_connect', new=never_connect):
+            return await peer_dialer.dial('127.0.0.1', port)
+
+    assert run(dial()) is None
+    assert connection_manager.num_outbound_slots == 0
+    assert peer_dialer.stats.num_timeouts == 1
+    assert peer_dialer.stats.num_failures == 1
+
+
+def test_dial_deduplicated(peer_dialer, listen_socket):
+    port = listen_socket.getsockname()[1]
+
+    async def dial_concurrently():
+        return await asyncio.gather(
+            peer_dialer.dial('127.0.0.1', port),
+            peer_dialer.dial('127.0.0.1', port),
+        )
+
+    first, second = run(dial_concurrently())
+    first[0].close()
+
+    assert second is None
+    assert peer_dialer.stats.num_attempts == 1
+    assert peer_dialer.stats.num_deduplicated == 1
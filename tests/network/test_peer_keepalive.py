@@ -0,0 +1,100 @@
+import mock
+import pytest
+from squeak.messages import msg_ping
+
+from squeaknode.network.connection_manager import ConnectionManager
+from squeaknode.network.peer import Peer
+from squeaknode.network.peer_keepalive import LAST_MESSAGE_TIMEOUT_REASON
+from squeaknode.network.peer_keepalive import PeerKeepalive
+from squeaknode.network.peer_keepalive import PING_TIMEOUT_REASON
+
+
+NOW = 1600000000
+
+
+@pytest.fixture
+def peer():
+    peer = mock.Mock(spec=Peer)
+    peer.stop_reason = None
+    peer.is_handshake_complete = True
+    peer.connect_time = NOW - 100
+    peer.last_msg_revc_time = NOW - 1
+    peer.last_sent_ping_time = None
+    peer.is_ping_pending = False
+    peer.is_recv_queue_full = False
+    return peer
+
+
+@pytest.fixture
+def connection_manager(peer):
+    connection_manager = mock.Mock(spec=ConnectionManager)
+    connection_manager.peers = [peer]
+    return connection_manager
+
+
+@pytest.fixture
+def peer_keepalive(connection_manager):
+    return PeerKeepalive(
+        connection_manager,
+        ping_interval=60,
+        ping_timeout=10,
+        last_message_timeout=600,
+    )
+
+
+def test_send_ping(peer, connection_manager, peer_keepalive):
+    peer_keepalive.check_peers(NOW)
+
+    (ping,), _ = peer.send_msg.call_args
+    assert isinstance(ping, msg_ping)
+    peer.set_last_sent_ping.assert_called_once_with(ping.nonce, NOW)
+    connection_manager.disconnect_peer.assert_not_called()
+
+
+def test_no_ping_before_interval(peer, connection_manager, peer_keepalive):
+    peer.last_sent_ping_time = NOW - 30
+
+    peer_keepalive.check_peers(NOW)
+
+    peer.send_msg.assert_not_called()
+
+
+def test_ping_timeout(peer, connection_manager, peer_keepalive):
+    peer.last_sent_ping_time = NOW - 11
+    peer.is_ping_pending = True
+
+    peer_keepalive.check_peers(NOW)
+
+    peer.send_msg.assert_not_called()
+    connection_manager.disconnect_peer.assert_called_once_with(
+        peer, PING_TIMEOUT_REASON)
+
+
+def test_no_ping_timeout_when_recv_queue_full(
+        peer, connection_manager, peer_keepalive):
+    peer.last_sent_ping_time = NOW - 11
+    peer.is_ping_pending = True
+    peer.is_recv_queue_full = True
+
+    peer_keepalive.check_peers(NOW)
+
+    connection_manager.disconnect_peer.assert_not_called()
+
+
+def test_last_message_timeout(peer, connection_manager, peer_keepalive):
+    peer.last_msg_revc_time = NOW - 601
+
+    peer_keepalive.check_peers(NOW)
+
+    connection_manager.disconnect_peer.assert_called_once_with(
+        peer, LAST_MESSAGE_TIMEOUT_REASON)
+
+
+def test_skip_peer_before_handshake(peer, connection_manager, peer_keepalive):
+    peer.is_handshake_complete = False
+    peer.last_msg_revc_time = NOW - 601
+
+    peer_keepalive.check_peers(NOW)
+
+    peer.send_msg.assert_not_called()
+    connection_manager.disconnect_peer.assert_not_called()
@@ -0,0 +1,330 @@
+import mock
+import pytest
+from bitcoin.core import CoreMainParams
+from squeak.core import MakeSqueakFromStr
+from squeak.core.signing import CSigningKey
+from squeak.messages import msg_getdata
+from squeak.messages import msg_getsqueaks
+from squeak.messages import msg_inv
+from squeak.messages import msg_notfound
+from squeak.messages import msg_ping
+from squeak.messages import msg_pong
+from squeak.net import CInterested
+from squeak.net import CInv
+from squeak.net import CSqueakLocator
+
+from squeaknode.core.peer_sync_state import PeerSyncUpdate
+from squeaknode.core.squeak_entry import SqueakEntry
+from squeaknode.core.squeak_verifier import SqueakVerifier
+from squeaknode.core.util import get_hash
+from squeaknode.network.download_scheduler import DownloadScheduler
+from squeaknode.network.message_stats import MessageStats
+from squeaknode.network.messages import CBucketDigest
+from squeaknode.network.messages import msg_reconcile
+from squeaknode.network.messages import msg_squeak_bytes
+from squeaknode.network.peer import Peer
+from squeaknode.network.peer_message_handler import MAX_INV_LEN
+from squeaknode.network.peer_message_handler import PeerMessageHandler
+from squeaknode.node.squeak_controller import SqueakController
+from squeaknode.node.squeak_ingestion import SqueakIngestion
+
+
+@pytest.fixture
+def peer():
+    peer = mock.Mock(spec=Peer)
+    peer.address = ('1.2.3.4', 8555)
+    peer.pop_sync_update.return_value = None
+    return peer
+
+
+@pytest.fixture
+def squeak_controller():
+    return mock.Mock(spec=SqueakController)
+
+
+@pytest.fixture
+def message_stats():
+    return MessageStats()
+
+
+@pytest.fixture
+def download_scheduler():
+    return DownloadScheduler()
+
+
+@pytest.fixture
+def squeak_ingestion():
+    return mock.Mock(spec=SqueakIngestion)
+
+
+@pytest.fixture
+def peer_message_handler(
+        peer,
+        squeak_controller,
+        message_stats,
+        download_scheduler,
+        squeak_ingestion,
+):
+    return PeerMessageHandler(
+        peer,
+        squeak_controller,
+        message_stats,
+        download_scheduler,
+        squeak_ingestion,
+    )
+
+
+def test_handle_ping(peer, peer_message_handler, message_stats):
+    ping = msg_ping()
+    ping.nonce = 123
+
+    peer_message_handler.handle_peer_message(ping)
+
+    (pong,), _ = peer.send_msg.call_args
+    assert isinstance(pong, msg_pong)
+    assert pong.nonce == 123
+    (stats,) = message_stats.get_command_stats()
+    assert stats.command == 'ping'
+    assert stats.num_calls == 1
+    assert stats.num_errors == 0
+    assert sum(stats.latency_histogram) == 1
+    (peer_stats,) = message_stats.get_peer_command_stats()
+    assert peer_stats.peer_address == ('1.2.3.4', 8555)
+
+
+def test_handle_message_error(peer, peer_message_handler, message_stats):
+    peer.send_msg.side_effect = Exception('Failed')
+    ping = msg_ping()
+
+    with pytest.raises(Exception):
+        peer_message_handler.handle_peer_message(ping)
+
+    (stats,) = message_stats.get_command_stats()
+    assert stats.num_calls == 1
+    assert stats.num_errors == 1
+
+
+def test_handle_unknown_message(peer_message_handler, message_stats):
+    msg = mock.Mock()
+    msg.command = b'unknown'
+
+    peer_message_handler.handle_peer_message(msg)
+
+    assert message_stats.get_command_stats() == []
+
+
+def test_remove_peer_stats(peer, peer_message_handler, message_stats):
+    peer_message_handler.handle_peer_message(msg_ping())
+
+    message_stats.remove_peer(peer.address)
+
+    assert message_stats.get_peer_command_stats() == []
+    assert len(message_stats.get_command_stats()) == 1
+
+
+def test_handle_getdata(peer, squeak_controller, peer_message_handler):
+    found_hash = b'a' * 32
+    missing_hash = b'b' * 32
+    squeak_controller.get_squeak_bytes.return_value = {
+        found_hash: b'squeak_bytes',
+    }
+    invs = [
+        CInv(type=1, hash=found_hash),
+        CInv(type=1, hash=missing_hash),
+    ]
+
+    peer_message_handler.handle_peer_message(msg_getdata(inv=invs))
+
+    squeak_controller.get_squeak_bytes.assert_called_once_with(
+        [found_hash, missing_hash],
+        clear_decryption_key=True,
+    )
+    squeak_controller.get_squeak.assert_not_called()
+    peer.send_msg_payload.assert_called_once_with(b'squeak', b'squeak_bytes')
+    (notfound_msg,), _ = peer.send_msg.call_args
+    assert isinstance(notfound_msg, msg_notfound)
+    assert [inv.hash for inv in notfound_msg.inv] == [missing_hash]
+
+
+def test_handle_getsqueaks(peer, squeak_controller, peer_message_handler):
+    squeak_hashes = [
+        i.to_bytes(32, 'big') for i in range(MAX_INV_LEN + 1)
+    ]
+    squeak_controller.lookup_squeaks_for_interests.return_value = \
+        squeak_hashes
+    interests = [CInterested(), CInterested()]
+    locator = CSqueakLocator(vInterested=interests)
+
+    peer_message_handler.handle_peer_message(msg_getsqueaks(locator=locator))
+
+    squeak_controller.lookup_squeaks_for_interests.assert_called_once()
+    (addresses,), _ = peer.add_remote_interested_addresses.call_args
+    assert set(addresses) == {str(interest.address) for interest in interests}
+    sent_msgs = [args[0] for args, _ in peer.send_msg.call_args_list]
+    assert all(isinstance(msg, msg_inv) for msg in sent_msgs)
+    assert [len(msg.inv) for msg in sent_msgs] == [MAX_INV_LEN, 1]
+    assert [inv.hash for msg in sent_msgs for inv in msg.inv] == \
+        squeak_hashes
+
+
+def test_handle_reconcile(peer, squeak_controller, peer_message_handler):
+    squeak_hash = b'\x01' * 32
+    squeak_controller.reconcile_squeaks.return_value = [squeak_hash]
+    interests = [CInterested()]
+    digests = [CBucketDigest(nBucket=1, nNumSqueaks=2)]
+    reconcile_msg = msg_reconcile(
+        locator=CSqueakLocator(vInterested=interests),
+        nBucketSize=144,
+        vDigests=digests,
+    )
+
+    peer_message_handler.handle_peer_message(reconcile_msg)
+
+    squeak_controller.reconcile_squeaks.assert_called_once_with(
+        interests, 144, digests)
+    (inv_msg,), _ = peer.send_msg.call_args
+    assert [inv.hash for inv in inv_msg.inv] == [squeak_hash]
+
+
+def test_handle_getsqueaks_empty(peer, squeak_controller, peer_message_handler):
+    squeak_controller.lookup_squeaks_for_interests.return_value = []
+    locator = CSqueakLocator(vInterested=[CInterested()])
+
+    peer_message_handler.handle_peer_message(msg_getsqueaks(locator=locator))
+
+    (inv_msg,), _ = peer.send_msg.call_args
+    assert isinstance(inv_msg, msg_inv)
+    assert inv_msg.inv == []
+
+
+def test_handle_inv_known(peer, squeak_controller, peer_message_handler):
+    squeak_controller.filter_known_invs.return_value = []
+
+    peer_message_handler.handle_peer_message(
+        msg_inv(inv=[CInv(type=1, hash=b'\x01' * 32)]))
+
+    peer.set_sync_response.assert_called_once_with()
+    peer.send_msg.assert_not_called()
+    squeak_controller.save_peer_sync_update.assert_not_called()
+
+
+def test_handle_inv_saves_sync_update(
+        peer, squeak_controller, peer_message_handler):
+    sync_update = PeerSyncUpdate(
+        full_sync_states=[],
+        updated_sync_states=[],
+    )
+    peer.pop_sync_update.return_value = sync_update
+    squeak_controller.filter_known_invs.return_value = []
+
+    peer_message_handler.handle_peer_message(msg_inv(inv=[]))
+
+    squeak_controller.save_peer_sync_update.assert_called_once_with(
+        sync_update)
+
+
+def test_handle_inv_in_flight(
+        peer,
+        squeak_controller,
+        message_stats,
+        download_scheduler,
+        squeak_ingestion,
+        peer_message_handler,
+):
+    other_peer = mock.Mock(spec=Peer)
+    other_peer.address = ('5.6.7.8', 8555)
+    other_handler = PeerMessageHandler(
+        other_peer,
+        squeak_controller,
+        message_stats,
+        download_scheduler,
+        squeak_ingestion,
+    )
+    invs = [CInv(type=1, hash=b'\x01' * 32)]
+    squeak_controller.filter_known_invs.return_value = invs
+
+    peer_message_handler.handle_peer_message(msg_inv(inv=invs))
+    other_handler.handle_peer_message(msg_inv(inv=invs))
+
+    (getdata_msg,), _ = peer.send_msg.call_args
+    assert isinstance(getdata_msg, msg_getdata)
+    assert [inv.hash for inv in getdata_msg.inv] == [b'\x01' * 32]
+    other_peer.send_msg.assert_not_called()
+
+
+def test_handle_notfound(peer, download_scheduler, peer_message_handler):
+    squeak_hash = b'\x01' * 32
+    download_scheduler.add_announcement(peer, [squeak_hash])
+
+    peer_message_handler.handle_peer_message(
+        msg_notfound(inv=[CInv(type=1, hash=squeak_hash)]))
+
+    assert download_scheduler.stats.num_in_flight == 0
+
+
+def test_handle_squeak(
+        peer, squeak_ingestion, download_scheduler, peer_message_handler):
+    squeak = mock.Mock()
+    squeak.HasDecryptionKey.return_value = False
+    squeak_hash = b'\x01' * 32
+    download_scheduler.add_announcement(peer, [squeak_hash])
+
+    with mock.patch(
+            'squeaknode.network.peer_message_handler.get_hash',
+            return_value=squeak_hash,
+    ):
+        peer_message_handler.handle_peer_message(
+            msg_squeak_bytes(b'squeak_bytes'))
+        (squeak_bytes,), kwargs = squeak_ingestion.submit.call_args
+        peer.send_msg.assert_not_called()
+        kwargs['on_verified'](squeak_hash)
+        kwargs['on_saved'](squeak)
+
+    assert squeak_bytes == b'squeak_bytes'
+    assert download_scheduler.stats.num_received == 1
+    peer.add_useful_squeak.assert_called_once_with()
+    (getdata_msg,), _ = peer.send_msg.call_args
+    assert [(inv.type, inv.hash) for inv in getdata_msg.inv] == [
+        (2, squeak_hash),
+    ]
+
+
+@pytest.mark.parametrize('already_saved', [False, True])
+def test_handle_squeak_useful_only_if_new(
+        peer, squeak_controller, message_stats, download_scheduler,
+        already_saved):
+    squeak = MakeSqueakFromStr(
+        CSigningKey.generate(),
+        'hello',
+        0,
+        CoreMainParams.GENESIS_BLOCK.GetHash(),
+        1600000000,
+    )
+    squeak_controller.check_squeak.return_value = SqueakEntry(
+        squeak=squeak,
+        block_header=None,
+    )
+    squeak_controller.save_squeak_entries.return_value = \
+        [] if already_saved else [get_hash(squeak)]
+    squeak_ingestion = SqueakIngestion(squeak_controller, SqueakVerifier())
+    peer_message_handler = PeerMessageHandler(
+        peer,
+        squeak_controller,
+        message_stats,
+        download_scheduler,
+        squeak_ingestion,
+    )
+
+    peer_message_handler.handle_peer_message(
+        msg_squeak_bytes(squeak.serialize()))
+    for stage, run in [
+            (squeak_ingestion.verification, squeak_ingestion.run_verification),
+            (squeak_ingestion.validation, squeak_ingestion.run_validation),
+            (squeak_ingestion.writer, squeak_ingestion.run_writer),
+    ]:
+        stage.queue.put(None)
+        run()
+
+    squeak_controller.save_squeak_entries.assert_called_once()
+    assert peer.add_useful_squeak.call_count == (0 if already_saved else 1)
+    peer.add_received_squeak.assert_called_once_with(get_hash(squeak))
@@ -0,0 +1,151 @@
+import logging
+import socket
+import time
+
+import mock
+import pytest
+
+from squeaknode.core.peer_address import PeerAddress
+from squeaknode.network.connection import HANDSHAKE_TIMEOUT_REASON
+from squeaknode.network.connection_manager import ConnectionManager
+from squeaknode.network.message_stats import MessageStats
+from squeaknode.network.peer_handler import PeerHandler
+from squeaknode.network.peer_server import PeerServer
+from squeaknode.node.squeak_controller import SqueakController
+from squeaknode.node.squeak_ingestion import SqueakIngestion
+
+
+def get_free_port():
+    with socket.socket() as s:
+        s.bind(('', 0))
+        return s.getsockname()[1]
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def make_node(max_inbound_peers=10):
+    port = get_free_port()
+    connection_manager = ConnectionManager(
+        max_inbound_peers=max_inbound_peers,
+    )
+    peer_server = PeerServer(connection_manager, port)
+    squeak_controller = mock.Mock(spec=SqueakController)
+    squeak_controller.get_address.return_value = (peer_server.ip, port)
+    peer_handler = PeerHandler(
+        squeak_controller,
+        connection_manager,
+        MessageStats(),
+        peer_server.download_scheduler,
+        mock.Mock(spec=SqueakIngestion),
+        max_handler_workers=2,
+        socket_read_len=1024,
+        max_send_queue_len=100,
+        max_send_queue_bytes=100000,
+        send_timeout_s=5,
+        max_recv_queue_len=100,
+        max_recv_queue_bytes=100000,
+        handshake_timeout_s=1,
+    )
+    peer_server.start(peer_handler)
+    return peer_server, peer_handler, connection_manager
+
+
+@pytest.fixture
+def node_a():
+    peer_server, peer_handler, connection_manager = make_node()
+    yield peer_server, connection_manager
+    peer_server.stop()
+    peer_handler.stop()
+
+
+@pytest.fixture
+def node_b():
+    peer_server, peer_handler, connection_manager = make_node()
+    yield peer_server, connection_manager
+    peer_server.stop()
+    peer_handler.stop()
+
+
+def test_connect_and_disconnect(node_a, node_b):
+    server_a, connection_manager_a = node_a
+    server_b, connection_manager_b = node_b
+
+    server_a.connect_address(('localhost', server_b.port))
+
+    assert wait_for(lambda: len(connection_manager_a.peers) == 1)
+    assert wait_for(lambda: len(connection_manager_b.peers) == 1)
+    assert wait_for(
+        lambda: connection_manager_a.peers[0].is_handshake_complete)
+    assert connection_manager_a.peers[0].outgoing
+    assert not connection_manager_b.peers[0].outgoing
+    assert connection_manager_a.peers[0].dial_address == PeerAddress(
+        host='localhost',
+        port=server_b.port,
+    )
+    assert connection_manager_b.peers[0].dial_address is None
+
+    server_a.disconnect_address(('localhost', server_b.port))
+
+    assert wait_for(lambda: len(connection_manager_a.peers) == 0)
+    assert wait_for(lambda: len(connection_manager_b.peers) == 0)
+
+
+def test_disconnect_peer_records_reason(node_a, node_b):
+    server_a, connection_manager_a = node_a
+    server_b, connection_manager_b = node_b
+    server_a.connect_address(('localhost', server_b.port))
+    assert wait_for(lambda: len(connection_manager_a.peers) == 1)
+    peer = connection_manager_a.peers[0]
+
+    connection_manager_a.disconnect_peer(peer, 'Too slow')
+
+    assert wait_for(lambda: len(connection_manager_a.peers) == 0)
+    assert peer.stop_reason == 'Too slow'
+    assert connection_manager_a.disconnect_reasons == {'Too slow': 1}
+
+
+def test_inbound_connection_refused(node_a):
+    server_a, connection_manager_a = node_a
+    server_b, peer_handler_b, connection_manager_b = make_node(
+        max_inbound_peers=0,
+    )
+    try:
+        server_a.connect_address(('localhost', server_b.port))
+
+        assert wait_for(
+            lambda: connection_manager_b.num_refused_connections == 1)
+        assert wait_for(lambda: connection_manager_a.num_outbound_slots == 0)
+        assert len(connection_manager_b.peers) == 0
+    finally:
+        server_b.stop()
+        peer_handler_b.stop()
+
+
+def test_handshake_timeout(node_a, caplog):
+    server_a, connection_manager_a = node_a
+    caplog.set_level(logging.INFO)
+
+    # Open a connection that never sends a version message.
+    with socket.create_connection(('localhost', server_a.port)):
+        assert wait_for(lambda: connection_manager_a.num_half_open_peers == 1)
+        assert connection_manager_a.num_established_peers == 0
+
+        assert wait_for(lambda: len(connection_manager_a.peers) == 0)
+        assert connection_manager_a.disconnect_reasons == {
+            HANDSHAKE_TIMEOUT_REASON: 1,
+        }
+    assert wait_for(lambda: any(
+        record.getMessage().startswith('Stopped controller')
+        for record in caplog.records
+    ))
+    assert not [
+        record for record in caplog.records
+        if record.levelno >= logging.ERROR
+    ]
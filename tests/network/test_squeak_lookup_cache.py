@@ -0,0 +1,58 @@
+from squeaknode.core.squeak_interest import SqueakInterest
+from squeaknode.network.squeak_lookup_cache import SqueakLookupCache
+
+
+def test_get_put():
+    cache = SqueakLookupCache()
+    interest = SqueakInterest('address', 0, 10)
+
+    assert cache.get(interest) is None
+    cache.put(interest, [b'a' * 32], cache.generation)
+
+    assert cache.get(interest) == [b'a' * 32]
+    assert cache.num_hits == 1
+    assert cache.num_misses == 1
+
+
+def test_expired_entry():
+    cache = SqueakLookupCache(ttl_s=0)
+    interest = SqueakInterest('address', 0, 10)
+    cache.put(interest, [b'a' * 32], cache.generation)
+
+    assert cache.get(interest) is None
+    assert len(cache) == 0
+
+
+def test_invalidate_address():
+    cache = SqueakLookupCache()
+    interest = SqueakInterest('address', 0, 10)
+    other_interest = SqueakInterest('other_address', 0, 10)
+    cache.put(interest, [b'a' * 32], cache.generation)
+    cache.put(other_interest, [b'b' * 32], cache.generation)
+
+    cache.invalidate_address('address')
+
+    assert cache.get(interest) is None
+    assert cache.get(other_interest) == [b'b' * 32]
+
+
+def test_put_after_invalidation_ignored():
+    cache = SqueakLookupCache()
+    interest = SqueakInterest('address', 0, 10)
+    generation = cache.generation
+
+    cache.invalidate_address('address')
+    cache.put(interest, [b'a' * 32], generation)
+
+    assert cache.get(interest) is None
+
+
+def test_max_entries():
+    cache = SqueakLookupCache(max_entries=2)
+    interests = [SqueakInterest('address', i, 10) for i in range(3)]
+    for interest in interests:
+        cache.put(interest, [], cache.generation)
+
+    assert len(cache) == 2
+    assert cache.get(interests[0]) is None
+    assert cache.get(interests[2]) == []
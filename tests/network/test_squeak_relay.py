@@ -0,0 +1,142 @@
+import mock
+import pytest
+from bitcoin.core import CoreMainParams
+from squeak.core import MakeSqueakFromStr
+from squeak.core.signing import CSigningKey
+from squeak.messages import msg_inv
+
+from squeaknode.core.util import get_hash
+from squeaknode.network.connection_manager import ConnectionManager
+from squeaknode.network.peer import Peer
+from squeaknode.network.squeak_relay import SqueakRelay
+
+
+def make_squeak(signing_key, content_str):
+    return MakeSqueakFromStr(
+        signing_key,
+        content_str,
+        0,
+        CoreMainParams.GENESIS_BLOCK.GetHash(),
+        1600000000,
+    )
+
+
+def make_peer(interested_addresses, received_squeak_hashes=()):
+    peer = mock.Mock(spec=Peer)
+    peer.is_handshake_complete = True
+    peer.is_remote_interested.side_effect = \
+        lambda address: address in interested_addresses
+    peer.has_received_squeak.side_effect = \
+        lambda squeak_hash: squeak_hash in received_squeak_hashes
+    return peer
+
+
+@pytest.fixture
+def squeak():
+    return make_squeak(CSigningKey.generate(), "hello")
+
+
+@pytest.fixture
+def other_squeak():
+    return make_squeak(CSigningKey.generate(), "other")
+
+
+@pytest.fixture
+def loop():
+    loop = mock.Mock()
+    loop.call_soon_threadsafe.side_effect = lambda fn, *args: fn(*args)
+    return loop
+
+
+@pytest.fixture
+def connection_manager():
+    connection_manager = mock.Mock(spec=ConnectionManager)
+    connection_manager.peers = []
+    return connection_manager
+
+
+@pytest.fixture
+def squeak_relay(connection_manager, loop):
+    return SqueakRelay(connection_manager, loop, batch_delay_s=0.3)
+
+
+def test_relay_to_interested_peers(
+        squeak, other_squeak, connection_manager, loop, squeak_relay):
+    address = str(squeak.GetAddress())
+    interested_peer = make_peer([address])
+    other_peer = make_peer([str(other_squeak.GetAddress())])
+    connection_manager.peers = [interested_peer, other_peer]
+
+    squeak_relay.add_squeak(squeak)
+    squeak_relay.add_squeak(squeak)
+    squeak_relay.flush()
+
+    loop.call_later.assert_called_once_with(0.3, squeak_relay.flush)
+    (inv_msg,), _ = interested_peer.send_msg.call_args
+    assert isinstance(inv_msg, msg_inv)
+    assert [inv.hash for inv in inv_msg.inv] == [get_hash(squeak)]
+    other_peer.send_msg.assert_not_called()
+    assert squeak_relay.num_relayed_invs == 1
+
+
+def test_relay_batches_squeaks(
+        squeak, other_squeak, connection_manager, loop, squeak_relay):
+    peer = make_peer([
+        str(squeak.GetAddress()),
+        str(other_squeak.GetAddress()),
+    ])
+    connection_manager.peers = [peer]
+
+    squeak_relay.add_squeak(squeak)
+    squeak_relay.add_squeak(other_squeak)
+    squeak_relay.flush()
+
+    loop.call_later.assert_called_once()
+    (inv_msg,), _ = peer.send_msg.call_args
+    assert {inv.hash for inv in inv_msg.inv} == {
+        get_hash(squeak),
+        get_hash(other_squeak),
+    }
+
+    # Nothing is sent again when the next batch is empty.
+    squeak_relay.flush()
+    peer.send_msg.assert_called_once()
+
+
+def test_relay_skips_locked_squeak(
+        squeak, connection_manager, loop, squeak_relay):
+    peer = make_peer([str(squeak.GetAddress())])
+    connection_manager.peers = [peer]
+    squeak.ClearDecryptionKey()
+
+    squeak_relay.add_squeak(squeak)
+    squeak_relay.flush()
+
+    loop.call_soon_threadsafe.assert_not_called()
+    peer.send_msg.assert_not_called()
+
+
+def test_relay_skips_peer_before_handshake(
+        squeak, connection_manager, squeak_relay):
+    peer = make_peer([str(squeak.GetAddress())])
+    peer.is_handshake_complete = False
+    connection_manager.peers = [peer]
+
+    squeak_relay.add_squeak(squeak)
+    squeak_relay.flush()
+
+    peer.send_msg.assert_not_called()
+
+
+def test_relay_skips_source_peer(
+        squeak, connection_manager, squeak_relay):
+    address = str(squeak.GetAddress())
+    source_peer = make_peer([address], [get_hash(squeak)])
+    other_peer = make_peer([address])
+    connection_manager.peers = [source_peer, other_peer]
+
+    squeak_relay.add_squeak(squeak)
+    squeak_relay.flush()
+
+    source_peer.send_msg.assert_not_called()
+    other_peer.send_msg.assert_called_once()
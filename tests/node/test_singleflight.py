@@ -0,0 +1,88 @@
+import threading
+import time
+
+import pytest
+
+from squeaknode.node.singleflight import Singleflight
+
+
+def run_concurrently(singleflight, key, fn, num_threads):
+    """Call do from each thread, and wait until all of them are waiting
+    for the first call."""
+    results = []
+    errors = []
+
+    def run():
+        try:
+            results.append(singleflight.do(key, fn))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run) for _ in range(num_threads)]
+    for thread in threads:
+        thread.start()
+    while singleflight.num_shared < num_threads - 1:
+        time.sleep(0.001)
+    return threads, results, errors
+
+
+def test_do():
+    singleflight = Singleflight()
+
+    assert singleflight.do('key', lambda: 123) == 123
+    assert singleflight.num_in_flight == 0
+
+
+def test_do_concurrent_calls_share_result():
+    singleflight = Singleflight()
+    release = threading.Event()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        release.wait()
+        return 'result'
+
+    threads, results, errors = run_concurrently(singleflight, 'key', fn, 5)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert results == ['result'] * 5
+    assert errors == []
+    assert singleflight.num_in_flight == 0
+
+
+def test_do_concurrent_calls_share_error():
+    singleflight = Singleflight()
+    release = threading.Event()
+    error = Exception('Failed')
+
+    def fn():
+        release.wait()
+        raise error
+
+    threads, results, errors = run_concurrently(singleflight, 'key', fn, 3)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert results == []
+    assert errors == [error] * 3
+
+
+def test_do_different_keys():
+    singleflight = Singleflight()
+
+    assert singleflight.do('a', lambda: 1) == 1
+    assert singleflight.do('b', lambda: 2) == 2
+
+
+def test_do_runs_again_after_done():
+    singleflight = Singleflight()
+
+    with pytest.raises(Exception):
+        singleflight.do('key', lambda: 1 / 0)
+
+    assert singleflight.do('key', lambda: 'ok') == 'ok'
@@ -1,17 +1,44 @@
+import threading
+import time
+
 import mock
 import pytest
+from squeak.core.signing import CSigningKey
+from squeak.core.signing import CSqueakAddress
+from squeak.net import CInterested
+from squeak.net import CInv
 
 from squeaknode.config.config import SqueaknodeConfig
 from squeaknode.core.lightning_address import LightningAddressHostPort
 from squeaknode.core.peer_address import PeerAddress
+from squeaknode.core.peer_sync_state import PeerSyncState
+from squeaknode.core.peer_sync_state import PeerSyncUpdate
 from squeaknode.core.squeak_core import SqueakCore
+from squeaknode.core.squeak_entry import SqueakEntry
+from squeaknode.core.squeak_interest import SqueakInterest
 from squeaknode.core.squeak_peer import SqueakPeer
 from squeaknode.db.squeak_db import SqueakDb
 from squeaknode.network.connection_manager import ConnectionManager
+from squeaknode.network.message_stats import MessageStats
+from squeaknode.network.peer import Peer
 from squeaknode.network.peer_server import PeerServer
+from squeaknode.network.squeak_lookup_cache import SqueakLookupCache
 from squeaknode.node.payment_processor import PaymentProcessor
 from squeaknode.node.squeak_controller import SqueakController
 from squeaknode.node.squeak_rate_limiter import SqueakRateLimiter
+from squeaknode.node.squeak_share_tracker import SqueakShareTracker
+from squeaknode.node.sync_planner import SyncPlanner
+
+
+def make_peer(host, port):
+    peer = mock.Mock(spec=Peer)
+    peer.address = (host, port)
+    peer.peer_address = PeerAddress(host=host, port=port)
+    peer.address_string = '{}:{}'.format(host, port)
+    peer.is_handshake_complete = True
+    peer.supports_reconciliation = False
+    peer.sync_request_time = None
+    return peer
 
 
 @pytest.fixture
@@ -46,6 +73,26 @@ def connection_manager():
     return mock.Mock(spec=ConnectionManager)
 
 
+@pytest.fixture
+def message_stats():
+    return mock.Mock(spec=MessageStats)
+
+
+@pytest.fixture
+def squeak_lookup_cache():
+    return SqueakLookupCache()
+
+
+@pytest.fixture
+def squeak_share_tracker():
+    return SqueakShareTracker()
+
+
+@pytest.fixture
+def sync_planner():
+    return SyncPlanner()
+
+
 @pytest.fixture
 def squeak_core():
     return mock.Mock(spec=SqueakCore)
@@ -63,7 +110,9 @@ def price_msat():
 
 @pytest.fixture
 def squeak_rate_limiter():
-    return mock.Mock(spec=SqueakRateLimiter)
+    squeak_rate_limiter = mock.Mock(spec=SqueakRateLimiter)
+    squeak_rate_limiter.max_squeaks_per_address_per_block = 100
+    return squeak_rate_limiter
 
 
 @pytest.fixture
@@ -79,6 +128,10 @@ def squeak_controller(
     payment_processor,
     peer_server,
     connection_manager,
+    message_stats,
+    squeak_lookup_cache,
+    squeak_share_tracker,
+    sync_planner,
     config,
 ):
     return SqueakController(
@@ -88,6 +141,10 @@ def squeak_controller(
         payment_processor,
         peer_server,
         connection_manager,
+        message_stats,
+        squeak_lookup_cache,
+        squeak_share_tracker,
+        sync_planner,
         config,
     )
 
@@ -100,6 +157,10 @@ def regtest_squeak_controller(
     payment_processor,
     peer_server,
     connection_manager,
+    message_stats,
+    squeak_lookup_cache,
+    squeak_share_tracker,
+    sync_planner,
     regtest_config,
 ):
     return SqueakController(
@@ -109,6 +170,10 @@ def regtest_squeak_controller(
         payment_processor,
         peer_server,
         connection_manager,
+        message_stats,
+        squeak_lookup_cache,
+        squeak_share_tracker,
+        sync_planner,
         regtest_config,
     )
 
@@ -178,3 +243,370 @@ def test_create_peer_default_port(config, squeak_db, squeak_controller):
             downloading=False,
         )
     )
+
+
+def test_filter_known_invs(squeak_db, squeak_controller):
+    unknown_hash = b'\x01' * 32
+    locked_hash = b'\x02' * 32
+    unlocked_hash = b'\x03' * 32
+    squeak_db.lookup_squeak_hashes.return_value = {
+        locked_hash: False,
+        unlocked_hash: True,
+    }
+    invs = [
+        CInv(type=1, hash=unknown_hash),
+        CInv(type=1, hash=locked_hash),
+        CInv(type=1, hash=unlocked_hash),
+        CInv(type=2, hash=unknown_hash),
+    ]
+
+    unknown_invs = squeak_controller.filter_known_invs(invs)
+
+    squeak_db.lookup_squeak_hashes.assert_called_once_with(
+        [unknown_hash, locked_hash, unlocked_hash],
+    )
+    assert [(inv.type, inv.hash) for inv in unknown_invs] == [
+        (1, unknown_hash),
+        (2, locked_hash),
+    ]
+
+
+def test_lookup_squeaks_for_interests_cached(
+        squeak_db, squeak_lookup_cache, squeak_controller):
+    signing_key = CSigningKey.generate()
+    address = CSqueakAddress.from_verifying_key(
+        signing_key.get_verifying_key())
+    interest = CInterested(
+        address=address,
+        nMinBlockHeight=0,
+        nMaxBlockHeight=10,
+    )
+    squeak_interest = SqueakInterest(str(address), 0, 10)
+    squeak_db.lookup_squeaks_for_interests.return_value = {
+        squeak_interest: [b'\x01' * 32],
+    }
+
+    for _ in range(3):
+        squeak_hashes = squeak_controller.lookup_squeaks_for_interests(
+            [interest],
+        )
+        assert squeak_hashes == [b'\x01' * 32]
+
+    squeak_db.lookup_squeaks_for_interests.assert_called_once_with(
+        [squeak_interest],
+    )
+    assert squeak_lookup_cache.num_hits == 2
+    assert squeak_lookup_cache.num_misses == 1
+
+    squeak_lookup_cache.invalidate_address(str(address))
+    squeak_controller.lookup_squeaks_for_interests([interest])
+
+    assert squeak_db.lookup_squeaks_for_interests.call_count == 2
+
+
+def test_save_squeak_notifies_listeners(
+        squeak_db, squeak_core, squeak_controller):
+    squeak = mock.Mock()
+    squeak.HasDecryptionKey.return_value = False
+    squeak.GetAddress.return_value = 'my_address'
+    squeak_core.validate_squeak.return_value = SqueakEntry(
+        squeak=squeak,
+        block_header=None,
+    )
+    squeak_db.insert_squeaks.return_value = [b'\x01' * 32]
+    failing_listener = mock.Mock(side_effect=Exception('listener error'))
+    listener = mock.Mock()
+    squeak_controller.listen_new_squeaks(failing_listener)
+    squeak_controller.listen_new_squeaks(listener)
+
+    with mock.patch(
+            'squeaknode.node.squeak_controller.get_hash',
+            return_value=b'\x01' * 32,
+    ):
+        squeak_controller.save_squeak(squeak)
+
+    failing_listener.assert_called_once_with(squeak)
+    listener.assert_called_once_with(squeak)
+
+
+def test_save_squeak_already_saved(
+        squeak_db, squeak_core, squeak_share_tracker, squeak_lookup_cache,
+        squeak_controller):
+    squeak = mock.Mock()
+    squeak.HasDecryptionKey.return_value = True
+    squeak.GetDecryptionKey.return_value = b'secret_key'
+    squeak.GetAddress.return_value = 'my_address'
+    squeak_entry = SqueakEntry(
+        squeak=squeak,
+        block_header=None,
+    )
+    squeak_core.validate_squeak.return_value = squeak_entry
+    squeak_db.insert_squeaks.return_value = []
+    squeak_db.get_squeak_entry.return_value = squeak_entry
+    listener = mock.Mock()
+    squeak_controller.listen_new_squeaks(listener)
+
+    with mock.patch(
+            'squeaknode.node.squeak_controller.get_hash',
+            return_value=b'\x01' * 32,
+    ), mock.patch.object(
+            squeak_lookup_cache,
+            'invalidate_address',
+    ) as invalidate_address:
+        squeak_hash = squeak_controller.save_squeak(squeak)
+
+    assert squeak_hash == b'\x01' * 32
+    invalidate_address.assert_called_once_with('my_address')
+    squeak_db.set_squeak_decryption_key.assert_called_once_with(
+        b'\x01' * 32,
+        b'secret_key',
+    )
+    listener.assert_not_called()
+    assert squeak_share_tracker._seq == 0
+
+
+def test_save_squeak_rate_limited(
+        squeak_db, squeak_core, squeak_controller):
+    squeak = mock.Mock()
+    squeak.HasDecryptionKey.return_value = False
+    squeak_core.validate_squeak.return_value = SqueakEntry(
+        squeak=squeak,
+        block_header=None,
+    )
+    squeak_db.insert_squeaks.return_value = []
+    squeak_db.get_squeak_entry.return_value = None
+
+    with mock.patch(
+            'squeaknode.node.squeak_controller.get_hash',
+            return_value=b'\x01' * 32,
+    ):
+        with pytest.raises(Exception, match='Exceeded allowed number'):
+            squeak_controller.save_squeak(squeak)
+
+
+def test_save_squeak_concurrent(
+        squeak_db, squeak_core, squeak_controller):
+    squeak = mock.Mock()
+    squeak.HasDecryptionKey.return_value = False
+    squeak.GetAddress.return_value = 'my_address'
+    squeak_db.insert_squeaks.return_value = [b'\x01' * 32]
+    release = threading.Event()
+
+    def validate_squeak(squeak):
+        release.wait()
+        return SqueakEntry(squeak=squeak, block_header=None)
+
+    squeak_core.validate_squeak.side_effect = validate_squeak
+    results = []
+
+    def save():
+        results.append(squeak_controller.save_squeak(squeak))
+
+    with mock.patch(
+            'squeaknode.node.squeak_controller.get_hash',
+            return_value=b'\x01' * 32,
+    ):
+        threads = [threading.Thread(target=save) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        while squeak_controller.save_squeak_flight.num_shared < 2:
+            time.sleep(0.001)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+    assert results == [b'\x01' * 32] * 3
+    squeak_core.validate_squeak.assert_called_once_with(squeak)
+    squeak_db.insert_squeaks.assert_called_once()
+
+
+def test_save_squeak_entries(squeak_db, squeak_controller):
+    new_squeak = mock.Mock()
+    new_squeak.GetAddress.return_value = 'my_address'
+    saved_squeak = mock.Mock()
+    squeak_entries = [
+        SqueakEntry(squeak=new_squeak, block_header=None),
+        SqueakEntry(squeak=saved_squeak, block_header=None),
+    ]
+    squeak_db.insert_squeaks.return_value = [b'\x01' * 32]
+    listener = mock.Mock()
+    squeak_controller.listen_new_squeaks(listener)
+
+    with mock.patch(
+            'squeaknode.node.squeak_controller.get_hash',
+            side_effect=lambda squeak: b'\x01' * 32
+            if squeak is new_squeak else b'\x02' * 32,
+    ):
+        inserted_squeak_hashes = squeak_controller.save_squeak_entries(
+            squeak_entries)
+
+    assert inserted_squeak_hashes == [b'\x01' * 32]
+    squeak_db.insert_squeaks.assert_called_once_with(squeak_entries, 100)
+    listener.assert_called_once_with(new_squeak)
+
+
+def test_sync_timeline_incremental(
+        config, squeak_db, squeak_core, connection_manager, squeak_controller):
+    synced_address = str(CSqueakAddress.from_verifying_key(
+        CSigningKey.generate().get_verifying_key()))
+    new_address = str(CSqueakAddress.from_verifying_key(
+        CSigningKey.generate().get_verifying_key()))
+    peer = make_peer('1.2.3.4', 8555)
+    connection_manager.peers = [peer]
+    peer_address = PeerAddress(host='1.2.3.4', port=8555)
+    squeak_db.get_peers.return_value = []
+    squeak_core.get_best_block_height.return_value = 5000
+    squeak_db.get_following_profiles.return_value = [
+        mock.Mock(address=synced_address),
+        mock.Mock(address=new_address),
+    ]
+    squeak_db.get_peer_sync_states.return_value = [
+        PeerSyncState(peer_address, synced_address, 4990),
+    ]
+
+    squeak_controller.sync_timeline()
+
+    squeak_db.delete_old_peer_sync_states.assert_called_once_with(
+        config.sync.full_sync_interval_s)
+    (getsqueaks_msg,), _ = peer.send_msg.call_args
+    ranges = {
+        str(interest.address): (
+            interest.nMinBlockHeight,
+            interest.nMaxBlockHeight,
+        )
+        for interest in getsqueaks_msg.locator.vInterested
+    }
+    assert ranges == {
+        synced_address: (4991, 5000),
+        new_address: (5000 - config.sync.block_interval, 5000),
+    }
+    # The sync states are saved only when the peer answers.
+    squeak_db.insert_peer_sync_states.assert_not_called()
+    squeak_db.update_peer_sync_states.assert_not_called()
+    _, kwargs = peer.set_sync_requested.call_args
+    sync_update = kwargs['sync_update']
+    assert sync_update == PeerSyncUpdate(
+        full_sync_states=[PeerSyncState(peer_address, new_address, 4999)],
+        updated_sync_states=[
+            PeerSyncState(peer_address, synced_address, 4999),
+        ],
+    )
+
+    squeak_controller.save_peer_sync_update(sync_update)
+
+    squeak_db.insert_peer_sync_states.assert_called_once_with([
+        PeerSyncState(peer_address, new_address, 4999),
+    ])
+    squeak_db.update_peer_sync_states.assert_called_once_with([
+        PeerSyncState(peer_address, synced_address, 4999),
+    ])
+
+
+def test_share_squeaks_only_changes(
+        squeak_db, squeak_core, connection_manager, squeak_controller):
+    address = str(CSqueakAddress.from_verifying_key(
+        CSigningKey.generate().get_verifying_key()))
+    peer = make_peer('1.2.3.4', 8555)
+    connection_manager.peers = [peer]
+    squeak_db.get_peers.return_value = []
+    squeak_core.get_best_block_height.return_value = 5000
+    squeak_db.get_sharing_profiles.return_value = [
+        mock.Mock(address=address),
+    ]
+
+    squeak_controller.share_squeaks()
+    squeak_controller.share_squeaks()
+
+    (sharesqueaks_msg,), _ = peer.send_msg.call_args
+    interest, = sharesqueaks_msg.locator.vInterested
+    assert str(interest.address) == address
+    assert (interest.nMinBlockHeight, interest.nMaxBlockHeight) == (0, 5000)
+    peer.send_msg.assert_called_once()
+
+
+def test_reconcile_squeaks(squeak_db, squeak_controller):
+    address = CSqueakAddress.from_verifying_key(
+        CSigningKey.generate().get_verifying_key())
+    squeaks_by_block = {
+        10: b'\x01' * 32,
+        600: b'\x02' * 32,
+        1100: b'\x03' * 32,
+    }
+
+    def lookup_squeaks_for_interests(interests):
+        return {
+            interest: [
+                squeak_hash
+                for block_height, squeak_hash in squeaks_by_block.items()
+                if interest.min_block <= block_height <= interest.max_block
+            ]
+            for interest in interests
+        }
+
+    squeak_db.lookup_squeaks_for_interests.side_effect = \
+        lookup_squeaks_for_interests
+    interests = [
+        CInterested(address=address, nMinBlockHeight=0, nMaxBlockHeight=1200),
+    ]
+
+    reconcile_msg = squeak_controller.make_reconcile_msg(interests)
+
+    assert [
+        (digest.nBucket, digest.nNumSqueaks)
+        for digest in reconcile_msg.vDigests
+    ] == [(0, 1), (1, 1), (2, 1)]
+    assert squeak_controller.reconcile_squeaks(
+        interests,
+        reconcile_msg.nBucketSize,
+        reconcile_msg.vDigests,
+    ) == []
+
+    # The remote node is missing the squeak in the second bucket.
+    remote_digests = [
+        digest for digest in reconcile_msg.vDigests if digest.nBucket != 1
+    ]
+
+    assert squeak_controller.reconcile_squeaks(
+        interests,
+        reconcile_msg.nBucketSize,
+        remote_digests,
+    ) == [b'\x02' * 32]
+
+
+def test_reconcile_squeaks_too_many_buckets(squeak_controller):
+    address = CSqueakAddress.from_verifying_key(
+        CSigningKey.generate().get_verifying_key())
+    interests = [
+        CInterested(address=address, nMinBlockHeight=0,
+                    nMaxBlockHeight=2 ** 30),
+    ]
+
+    with pytest.raises(Exception):
+        squeak_controller.reconcile_squeaks(interests, 1, [])
+    assert squeak_controller.make_reconcile_msg(interests) is None
+
+
+def test_sync_timeline_routes_to_selected_peers(
+        squeak_db, squeak_core, connection_manager, squeak_controller):
+    address = str(CSqueakAddress.from_verifying_key(
+        CSigningKey.generate().get_verifying_key()))
+    peers = [make_peer('10.0.0.{}'.format(i), 8555) for i in range(3)]
+    connection_manager.peers = peers
+    squeak_db.get_peers.return_value = []
+    squeak_db.get_peer_sync_states.return_value = []
+    squeak_core.get_best_block_height.return_value = 5000
+    squeak_db.get_following_profiles.return_value = [
+        mock.Mock(address=address),
+    ]
+
+    squeak_controller.sync_timeline()
+
+    assert [peer.send_msg.call_count for peer in peers].count(1) == 2
+    assert [peer.set_sync_requested.call_count for peer in peers].count(1) \
+        == 2
+
+    for peer in peers:
+        peer.send_msg.reset_mock()
+    squeak_controller.download_single_squeak(b'\x01' * 32)
+
+    assert [peer.send_msg.call_count for peer in peers].count(1) == 2
@@ -0,0 +1,230 @@
+import queue
+import threading
+
+import mock
+import pytest
+from bitcoin.core import CoreMainParams
+from squeak.core import MakeSqueakFromStr
+from squeak.core.signing import CSigningKey
+
+from squeaknode.core.squeak_entry import SqueakEntry
+from squeaknode.core.squeak_verifier import SqueakVerifier
+from squeaknode.core.squeak_verifier import verify_squeak_bytes_batch
+from squeaknode.core.util import get_hash
+from squeaknode.node.squeak_controller import SqueakController
+from squeaknode.node.squeak_ingestion import get_batch
+from squeaknode.node.squeak_ingestion import SqueakIngestion
+
+
+@pytest.fixture
+def squeak_controller():
+    squeak_controller = mock.Mock(spec=SqueakController)
+    squeak_controller.check_squeak.side_effect = \
+        lambda squeak: SqueakEntry(squeak=squeak, block_header=None)
+    squeak_controller.save_squeak_entries.side_effect = \
+        lambda squeak_entries: [
+            get_hash(squeak_entry.squeak)
+            for squeak_entry in squeak_entries
+        ]
+    return squeak_controller
+
+
+@pytest.fixture
+def squeak_verifier():
+    squeak_verifier = mock.Mock(spec=SqueakVerifier)
+    squeak_verifier.verify.side_effect = verify_squeak_bytes_batch
+    return squeak_verifier
+
+
+@pytest.fixture
+def squeak_ingestion(squeak_controller, squeak_verifier):
+    return SqueakIngestion(
+        squeak_controller,
+        squeak_verifier,
+        num_workers=2,
+        max_queue_len=10,
+        max_batch_size=3,
+    )
+
+
+@pytest.fixture(scope='module')
+def squeaks():
+    signing_key = CSigningKey.generate()
+    return [
+        MakeSqueakFromStr(
+            signing_key,
+            "hello {}".format(i),
+            0,
+            CoreMainParams.GENESIS_BLOCK.GetHash(),
+            1600000000,
+        )
+        for i in range(5)
+    ]
+
+
+def run_verification(squeak_ingestion):
+    """Run the verification until the squeaks in its queue are verified."""
+    squeak_ingestion.verification.queue.put(None)
+    squeak_ingestion.run_verification()
+
+
+def run_validation(squeak_ingestion):
+    """Run a validation worker until the squeaks in its queue are
+    validated."""
+    squeak_ingestion.validation.queue.put(None)
+    squeak_ingestion.run_validation()
+
+
+def run_writer(squeak_ingestion):
+    """Run the writer until the squeaks in the writer queue are saved."""
+    squeak_ingestion.writer.queue.put(None)
+    squeak_ingestion.run_writer()
+
+
+def run_stages(squeak_ingestion):
+    run_verification(squeak_ingestion)
+    run_validation(squeak_ingestion)
+    run_writer(squeak_ingestion)
+
+
+def saved_hashes(callback):
+    return [get_hash(squeak) for (squeak,), _ in callback.call_args_list]
+
+
+def test_submit(
+        squeak_ingestion, squeak_controller, squeak_verifier, squeaks):
+    squeak_bytes_list = [squeak.serialize() for squeak in squeaks]
+    on_verified = mock.Mock()
+    on_saved = mock.Mock()
+
+    for squeak_bytes in squeak_bytes_list:
+        squeak_ingestion.submit(squeak_bytes, on_verified, on_saved)
+    run_stages(squeak_ingestion)
+
+    batches = [
+        [get_hash(squeak_entry.squeak) for squeak_entry in squeak_entries]
+        for (squeak_entries,), _
+        in squeak_controller.save_squeak_entries.call_args_list
+    ]
+    squeak_hashes = [get_hash(squeak) for squeak in squeaks]
+    assert batches == [squeak_hashes[:3], squeak_hashes[3:]]
+    verified_batches = [
+        args for (args,), _ in squeak_verifier.verify.call_args_list
+    ]
+    assert verified_batches == [
+        squeak_bytes_list[:3],
+        squeak_bytes_list[3:],
+    ]
+    assert [
+        args for (args,), _ in on_verified.call_args_list
+    ] == squeak_hashes
+    assert saved_hashes(on_saved) == squeak_hashes
+    stats = squeak_ingestion.stats
+    assert stats.verification.num_processed == 5
+    assert stats.validation.num_processed == 5
+    assert stats.writer.num_processed == 5
+    assert stats.writer.queue_len == 0
+
+
+def test_submit_duplicate(squeak_ingestion, squeaks):
+    squeak_bytes = squeaks[0].serialize()
+    on_verified = mock.Mock()
+
+    squeak_ingestion.submit(squeak_bytes, on_verified)
+    squeak_ingestion.submit(squeak_bytes, on_verified)
+    run_verification(squeak_ingestion)
+
+    assert on_verified.call_count == 2
+    assert squeak_ingestion.stats.num_duplicates == 1
+    assert squeak_ingestion.stats.validation.queue_len == 1
+
+
+def test_submit_again_after_saved(squeak_ingestion, squeaks):
+    squeak_bytes = squeaks[0].serialize()
+    squeak_ingestion.submit(squeak_bytes)
+    run_stages(squeak_ingestion)
+
+    squeak_ingestion.submit(squeak_bytes)
+    run_verification(squeak_ingestion)
+
+    assert squeak_ingestion.stats.num_duplicates == 0
+    assert squeak_ingestion.stats.validation.queue_len == 1
+
+
+def test_callback_only_for_inserted(
+        squeak_ingestion, squeak_controller, squeaks):
+    squeak_controller.save_squeak_entries.side_effect = \
+        lambda squeak_entries: [get_hash(squeaks[0])]
+    on_saved = mock.Mock()
+
+    squeak_ingestion.submit(squeaks[0].serialize(), on_saved=on_saved)
+    squeak_ingestion.submit(squeaks[1].serialize(), on_saved=on_saved)
+    run_stages(squeak_ingestion)
+
+    assert saved_hashes(on_saved) == [get_hash(squeaks[0])]
+
+
+def test_validation_error(squeak_ingestion, squeak_controller, squeaks):
+    squeak_controller.check_squeak.side_effect = Exception('Invalid')
+    on_saved = mock.Mock()
+
+    squeak_ingestion.submit(squeaks[0].serialize(), on_saved=on_saved)
+    run_verification(squeak_ingestion)
+    run_validation(squeak_ingestion)
+
+    stats = squeak_ingestion.stats
+    assert stats.validation.num_errors == 1
+    assert stats.writer.queue_len == 0
+    on_saved.assert_not_called()
+    squeak_ingestion.submit(squeaks[0].serialize())
+    run_verification(squeak_ingestion)
+    assert squeak_ingestion.stats.num_duplicates == 0
+
+
+def test_write_error(squeak_ingestion, squeak_controller, squeaks):
+    squeak_controller.save_squeak_entries.side_effect = Exception('Failed')
+    on_saved = mock.Mock()
+
+    squeak_ingestion.submit(squeaks[0].serialize(), on_saved=on_saved)
+    run_stages(squeak_ingestion)
+
+    assert squeak_ingestion.stats.writer.num_errors == 1
+    on_saved.assert_not_called()
+
+
+def test_start_and_stop(squeak_ingestion, squeak_controller, squeaks):
+    saved = threading.Event()
+
+    squeak_ingestion.start()
+    squeak_ingestion.submit(
+        squeaks[0].serialize(),
+        on_saved=lambda squeak: saved.set(),
+    )
+
+    assert saved.wait(5)
+    squeak_ingestion.stop()
+    squeak_controller.save_squeak_entries.assert_called_once()
+
+
+def test_verification_invalid(squeak_ingestion, squeak_controller):
+    on_verified = mock.Mock()
+    on_saved = mock.Mock()
+
+    squeak_ingestion.submit(b'\x00' * 10, on_verified, on_saved)
+    run_verification(squeak_ingestion)
+
+    stats = squeak_ingestion.stats
+    assert stats.verification.num_errors == 1
+    assert stats.validation.queue_len == 0
+    on_verified.assert_not_called()
+    squeak_controller.check_squeak.assert_not_called()
+
+
+def test_get_batch():
+    q = queue.Queue()
+    for i in range(5):
+        q.put(i)
+    q.put(None)
+
+    assert get_batch(q, 3) == ([0, 1, 2], False)
+    assert get_batch(q, 3) == ([3, 4], True)
@@ -0,0 +1,86 @@
+import mock
+import pytest
+
+from squeaknode.core.squeak_interest import SqueakInterest
+from squeaknode.node.squeak_share_tracker import SqueakShareTracker
+
+
+ADDRESS = 'address1'
+OTHER_ADDRESS = 'address2'
+
+
+def make_squeak(address, block_height):
+    squeak = mock.Mock()
+    squeak.GetAddress.return_value = address
+    squeak.nBlockHeight = block_height
+    return squeak
+
+
+@pytest.fixture
+def squeak_share_tracker():
+    return SqueakShareTracker(max_changes_per_address=3)
+
+
+@pytest.fixture
+def peer():
+    return mock.Mock()
+
+
+def share(squeak_share_tracker, peer, addresses, max_block):
+    interests, seq = squeak_share_tracker.get_share_interests(
+        peer, addresses, max_block)
+    squeak_share_tracker.set_shared(peer, addresses, seq)
+    return interests
+
+
+def test_first_share_is_full(squeak_share_tracker, peer):
+    interests = share(squeak_share_tracker, peer, [ADDRESS], 100)
+
+    assert interests == [SqueakInterest(ADDRESS, 0, 100)]
+
+
+def test_nothing_changed(squeak_share_tracker, peer):
+    share(squeak_share_tracker, peer, [ADDRESS], 100)
+
+    assert share(squeak_share_tracker, peer, [ADDRESS], 101) == []
+
+
+def test_share_changed_range(squeak_share_tracker, peer):
+    share(squeak_share_tracker, peer, [ADDRESS, OTHER_ADDRESS], 100)
+    squeak_share_tracker.add_squeak(make_squeak(ADDRESS, 90))
+    squeak_share_tracker.add_squeak(make_squeak(ADDRESS, 101))
+
+    interests = share(
+        squeak_share_tracker, peer, [ADDRESS, OTHER_ADDRESS], 101)
+
+    assert interests == [SqueakInterest(ADDRESS, 90, 101)]
+    assert share(
+        squeak_share_tracker, peer, [ADDRESS, OTHER_ADDRESS], 101) == []
+
+
+def test_new_sharing_address_is_full(squeak_share_tracker, peer):
+    share(squeak_share_tracker, peer, [ADDRESS], 100)
+
+    interests = share(
+        squeak_share_tracker, peer, [ADDRESS, OTHER_ADDRESS], 100)
+
+    assert interests == [SqueakInterest(OTHER_ADDRESS, 0, 100)]
+
+
+def test_too_many_changes_is_full(squeak_share_tracker, peer):
+    share(squeak_share_tracker, peer, [ADDRESS], 100)
+    for block_height in range(95, 99):
+        squeak_share_tracker.add_squeak(make_squeak(ADDRESS, block_height))
+
+    interests = share(squeak_share_tracker, peer, [ADDRESS], 100)
+
+    assert interests == [SqueakInterest(ADDRESS, 0, 100)]
+
+
+def test_removed_peer_is_full(squeak_share_tracker, peer):
+    share(squeak_share_tracker, peer, [ADDRESS], 100)
+
+    squeak_share_tracker.remove_peers_except([])
+
+    interests = share(squeak_share_tracker, peer, [ADDRESS], 100)
+    assert interests == [SqueakInterest(ADDRESS, 0, 100)]
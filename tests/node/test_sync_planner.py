@@ -0,0 +1,128 @@
+import mock
+import pytest
+
+from squeaknode.core.peer_address import PeerAddress
+from squeaknode.core.squeak_peer import SqueakPeer
+from squeaknode.network.peer import Peer
+from squeaknode.node.sync_planner import SyncPlanner
+
+
+NOW = 1600000000
+
+
+def make_peer(host, port=8555, dial_host=None):
+    peer = mock.Mock(spec=Peer)
+    peer.peer_address = PeerAddress(host=host, port=port)
+    peer.dial_address = PeerAddress(host=dial_host or host, port=port)
+    peer.address_string = '{}:{}'.format(host, port)
+    peer.is_handshake_complete = True
+    peer.sync_request_time = None
+    return peer
+
+
+def make_saved_peer(host, downloading, uploading, port=8555):
+    return SqueakPeer(
+        peer_id=1,
+        peer_name='saved_peer',
+        address=PeerAddress(host=host, port=port),
+        uploading=uploading,
+        downloading=downloading,
+    )
+
+
+@pytest.fixture
+def sync_planner():
+    return SyncPlanner(redundancy=2, timeout_s=10)
+
+
+@pytest.fixture
+def peers():
+    return [make_peer('10.0.0.{}'.format(i)) for i in range(5)]
+
+
+def test_assign_addresses(sync_planner, peers):
+    addresses = ['address{}'.format(i) for i in range(100)]
+
+    assigned_addresses = sync_planner.assign_addresses(peers, addresses)
+
+    for address in addresses:
+        assigned_peers = [
+            peer for peer, peer_addresses in assigned_addresses.items()
+            if address in peer_addresses
+        ]
+        assert len(assigned_peers) == 2
+    # Every peer gets some of the addresses.
+    assert set(assigned_addresses) == set(peers)
+
+
+def test_assign_addresses_after_peer_removed(sync_planner, peers):
+    addresses = ['address{}'.format(i) for i in range(100)]
+    before = sync_planner.assign_addresses(peers, addresses)
+
+    after = sync_planner.assign_addresses(peers[1:], addresses)
+
+    # Only the addresses of the removed peer move to other peers.
+    for peer in peers[1:]:
+        assert set(before[peer]) <= set(after[peer])
+
+
+def test_download_peers_honour_flags(sync_planner, peers):
+    saved_peers = [
+        make_saved_peer('10.0.0.0', downloading=False, uploading=True),
+        make_saved_peer('10.0.0.1', downloading=True, uploading=False),
+    ]
+    peers[2].is_handshake_complete = False
+
+    download_peers = sync_planner.get_download_peers(peers, saved_peers)
+    upload_peers = sync_planner.get_upload_peers(peers, saved_peers)
+
+    assert download_peers == [peers[1], peers[3], peers[4]]
+    assert upload_peers == [peers[0], peers[3], peers[4]]
+
+
+def test_download_peers_match_saved_host_name(sync_planner):
+    peers = [
+        make_peer('10.0.0.0', dial_host='node0.example.com'),
+        make_peer('10.0.0.1', dial_host='node1.example.com'),
+    ]
+    saved_peers = [
+        make_saved_peer(
+            'node0.example.com', downloading=False, uploading=True),
+        make_saved_peer(
+            'node1.example.com', downloading=True, uploading=False),
+    ]
+
+    download_peers = sync_planner.get_download_peers(peers, saved_peers)
+    upload_peers = sync_planner.get_upload_peers(peers, saved_peers)
+
+    assert download_peers == [peers[1]]
+    assert upload_peers == [peers[0]]
+
+
+def test_incoming_peers_not_matched(sync_planner):
+    peer = make_peer('10.0.0.0')
+    peer.dial_address = None
+    saved_peers = [
+        make_saved_peer('10.0.0.0', downloading=False, uploading=False),
+    ]
+
+    assert sync_planner.get_download_peers([peer], saved_peers) == [peer]
+    assert sync_planner.get_upload_peers([peer], saved_peers) == [peer]
+
+
+def test_download_peers_skip_timed_out(sync_planner, peers):
+    peers[0].sync_request_time = NOW - 11
+    peers[1].sync_request_time = NOW - 5
+
+    download_peers = sync_planner.get_download_peers(peers, [], NOW)
+
+    assert download_peers == peers[1:]
+
+
+def test_download_peers_all_timed_out(sync_planner, peers):
+    for peer in peers:
+        peer.sync_request_time = NOW - 11
+
+    download_peers = sync_planner.get_download_peers(peers, [], NOW)
+
+    assert download_peers == peers